@@ -52,8 +52,21 @@ from .models import (
 
 from .optimizer import RouteOptimizer
 from .distance_calculator import DistanceCalculator
+from .distance_cache import PersistentDistanceCache
+from .road_network import RoadNetworkProvider
+from .circuit_breaker import CircuitBreaker
+from .coordinate_snapping import CoordinateSnapper
+from .distance_context import DistanceContext
+from .distance_matrix import DistanceMatrix
+from .travel_time import TravelTimeModel
+from .driver_registry import DriverRegistry
 from .clustering import PickupClusterer
 from .simple_route_solver import SimpleRouteSolver
+from .distance_calculator import HAVERSINE
+from .clustering_engine import CLUSTERING_TIME_BUDGET
+from .local_search import LOCAL_SEARCH_TIME_BUDGET
+from .route_solver import ORTOOLS_TIME_LIMIT, ORTOOLS_METAHEURISTIC
+from .joint_solver import JOINT_MAX_POINTS
 
 # The route solver now uses heuristic algorithms without OR-Tools dependency
 print("ℹ️  Route optimization module loaded with heuristic solver")
@@ -69,6 +82,14 @@ __all__ = [
     "OptimizationResult",
     "PriorityFlag",
     "DistanceCalculator",
+    "DistanceContext",
+    "DistanceMatrix",
+    "TravelTimeModel",
+    "DriverRegistry",
+    "PersistentDistanceCache",
+    "RoadNetworkProvider",
+    "CircuitBreaker",
+    "CoordinateSnapper",
     "PickupClusterer", 
     "SimpleRouteSolver"
 ]
@@ -79,7 +100,28 @@ def optimize_waste_collection_routes(pickup_points_data: list,
                                    google_maps_api_key: str = None,
                                    priority_weight: float = 0.4,
                                    distance_weight: float = 0.4,
-                                   balance_weight: float = 0.2) -> dict:
+                                   balance_weight: float = 0.2,
+                                   distance_cache_path: str = None,
+                                   road_network_path: str = None,
+                                   cache_snapping: str = None,
+                                   distance_matrix_dir: str = None,
+                                   speed_profile=None,
+                                   departure_hour: float = None,
+                                   distance_metric: str = HAVERSINE,
+                                   clustering_strategy: str = "auto",
+                                   clustering_time_budget: float = CLUSTERING_TIME_BUDGET,
+                                   capacity_aware: bool = False,
+                                   warm_start: bool = False,
+                                   aggregation_radius_m: float = None,
+                                   hierarchical_zone_size: int = None,
+                                   local_search: bool = True,
+                                   local_search_time_budget: float = LOCAL_SEARCH_TIME_BUDGET,
+                                   parallel_workers: int = None,
+                                   route_solver: str = "heuristic",
+                                   ortools_time_limit: float = ORTOOLS_TIME_LIMIT,
+                                   ortools_solution_limit: int = None,
+                                   ortools_metaheuristic: str = ORTOOLS_METAHEURISTIC,
+                                   joint_max_points: int = JOINT_MAX_POINTS) -> dict:
     """
     Convenience function for route optimization with dict inputs.
     
@@ -94,6 +136,36 @@ def optimize_waste_collection_routes(pickup_points_data: list,
         priority_weight: Weight for priority coverage (0-1)
         distance_weight: Weight for path efficiency (0-1)
         balance_weight: Weight for workload balance (0-1)
+        distance_cache_path: Optional SQLite file for a persistent distance cache
+            shared by all worker processes
+        road_network_path: Optional road graph file for accurate offline distances
+        cache_snapping: Optional distance cache key snapping, 'grid:<meters>' or
+            'geohash:<precision>'
+        distance_matrix_dir: Optional directory of memory-mapped distance matrices
+            reused across runs and worker processes
+        speed_profile: Optional speed profile by hour and road class ('city', a
+            JSON file path or a configuration dict; see TravelTimeModel.from_dict)
+        departure_hour: Clock hour at which routes start (default: now)
+        distance_metric: Offline straight-line metric, 'haversine' or 'equirectangular'
+        clustering_strategy: 'auto', 'kmeans++', 'minibatch' or 'kmeans'
+        clustering_time_budget: Wall-clock seconds for clustering attempts
+        capacity_aware: Keep each driver's cluster volume within max_capacity
+        warm_start: Warm-start clustering from this fleet's previous run in the process
+        aggregation_radius_m: Merge reports within this many meters into one stop;
+            exported routes list every member report
+        hierarchical_zone_size: Split runs with more pickups than this into zones
+            optimized one at a time (for city-scale runs)
+        local_search: Improve routes with 2-opt / Or-opt moves within each priority segment
+        local_search_time_budget: Seconds of local search per route (None for no limit)
+        parallel_workers: Solve clusters in this many worker processes (0: one per CPU)
+        route_solver: 'heuristic', 'ortools' (OR-Tools search per route) or 'joint'
+            (one OR-Tools model for all drivers on runs of up to joint_max_points pickups)
+        ortools_time_limit: Seconds of OR-Tools search per route (None: solution limit
+            only); in joint mode, the strict limit of the whole joint solve
+        ortools_solution_limit: Solutions OR-Tools may find per route (None: time limit only)
+        ortools_metaheuristic: OR-Tools metaheuristic, e.g. 'guided_local_search',
+            'simulated_annealing' or 'tabu_search'
+        joint_max_points: Largest pickup count solved jointly in joint mode
         
     Returns:
         Dictionary with optimized routes for mobile consumption
@@ -156,10 +228,27 @@ def optimize_waste_collection_routes(pickup_points_data: list,
             raise ValueError(f"Invalid driver data: {driver_data}. Error: {e}")
     
     # Run optimization
-    optimizer = RouteOptimizer(google_maps_api_key)
+    optimizer = RouteOptimizer(google_maps_api_key, distance_cache_path, road_network_path,
+                               cache_snapping, distance_matrix_dir=distance_matrix_dir,
+                               speed_profile=speed_profile, distance_metric=distance_metric,
+                               clustering_strategy=clustering_strategy,
+                               clustering_time_budget=clustering_time_budget,
+                               capacity_aware_clustering=capacity_aware,
+                               warm_start_clustering=warm_start,
+                               aggregation_radius_m=aggregation_radius_m,
+                               hierarchical_zone_size=hierarchical_zone_size,
+                               local_search=local_search,
+                               local_search_time_budget=local_search_time_budget,
+                               parallel_workers=parallel_workers,
+                               route_solver=route_solver,
+                               ortools_time_limit=ortools_time_limit,
+                               ortools_solution_limit=ortools_solution_limit,
+                               ortools_metaheuristic=ortools_metaheuristic,
+                               joint_max_points=joint_max_points)
     result = optimizer.optimize_routes(
         pickup_points, drivers,
-        priority_weight, distance_weight, balance_weight
+        priority_weight, distance_weight, balance_weight,
+        departure_hour=departure_hour
     )
     
     # Export mobile-friendly format
@@ -174,7 +263,7 @@ def optimize_waste_collection_routes(pickup_points_data: list,
             "total_pickup_points": len(pickup_points),
             "total_distance_km": round(result.total_distance, 2),
             "total_time_minutes": round(result.total_time, 0),
-            "points_covered": result.total_points_covered,
+            "points_covered": result.total_reports_covered,
             "priority_coverage": {
                 "red": result.total_red_covered,
                 "yellow": result.total_yellow_covered,
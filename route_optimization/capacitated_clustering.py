@@ -0,0 +1,179 @@
+"""
+Capacity-constrained balanced clustering.
+Lloyd-style iterations where the assignment step is a regret-ordered greedy
+that respects every driver's max_capacity, with clusters seeded at (and pulled
+towards) the driver bases.
+"""
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+from .models import PickupPoint, Driver
+from .equirectangular import EquirectangularProjection
+
+
+class CapacitatedClustering:
+    """
+    Clusters pickup points into one cluster per driver within capacity.
+    
+    Each iteration:
+        1. cost[i, k] = distance(point i, center k) + depot_weight * distance(point i, base k)
+        2. Points are assigned in decreasing regret (second-best minus best
+           cost), heavy points first on ties, each to its cheapest cluster with
+           room left. Points with little to lose wait, so they absorb the
+           detours forced by full clusters.
+        3. Centers move to the mean of their points.
+    until no label changes.
+    
+    Loads target the same fraction of every driver's capacity (plus
+    balance_slack), so trucks are filled evenly rather than the nearest ones
+    to the brim. When a point fits no target it may use the remaining real
+    capacity; when it fits nowhere (total volume above total capacity) it
+    goes to the cluster with the most room left and counts as overflow.
+    """
+    
+    def __init__(self,
+                 max_iter: int = 20,
+                 balance_slack: float = 0.1,
+                 depot_weight: float = 0.25):
+        """
+        Initialize capacitated clustering.
+        
+        Args:
+            max_iter: Maximum Lloyd iterations
+            balance_slack: Allowed load above the even fill fraction (0.1 = 10%)
+            depot_weight: Weight of the distance to the driver's base in the cost
+        """
+        self.max_iter = max_iter
+        self.balance_slack = balance_slack
+        self.depot_weight = depot_weight
+        self.last_report: Dict[str, object] = {}
+    
+    def cluster(self, pickup_points: List[PickupPoint], drivers: List[Driver]) -> Dict[int, List[PickupPoint]]:
+        """
+        Cluster pickup points, one cluster per driver.
+        
+        Args:
+            pickup_points: Pickup points to cluster
+            drivers: Drivers; cluster k is served by drivers[k]
+        
+        Returns:
+            Dictionary mapping driver index to its pickup points (empty clusters omitted)
+        """
+        coords = np.array([(p.lat, p.lng) for p in pickup_points], dtype=np.float64).reshape(-1, 2)
+        bases = np.array([(d.base_lat, d.base_lng) for d in drivers], dtype=np.float64).reshape(-1, 2)
+        volumes = np.array([p.volume for p in pickup_points], dtype=np.float64)
+        capacities = np.array([d.max_capacity for d in drivers], dtype=np.float64)
+        
+        projection = EquirectangularProjection.for_box(EquirectangularProjection.bounding_box(coords, bases))
+        labels = self.fit(projection.project(coords), volumes, projection.project(bases), capacities)
+        
+        clusters: Dict[int, List[PickupPoint]] = {}
+        for point, label in zip(pickup_points, labels.tolist()):
+            clusters.setdefault(label, []).append(point)
+        return dict(sorted(clusters.items()))
+    
+    def fit(self,
+            points: np.ndarray,
+            volumes: np.ndarray,
+            bases: np.ndarray,
+            capacities: np.ndarray) -> np.ndarray:
+        """
+        Cluster planar points.
+        
+        Args:
+            points: (n, 2) planar point coordinates (km)
+            volumes: (n,) point volumes
+            bases: (k, 2) planar driver base coordinates (km), also the initial centers
+            capacities: (k,) driver capacities
+        
+        Returns:
+            Cluster (driver) index of every point
+        """
+        n, k = len(points), len(bases)
+        total_volume, total_capacity = float(volumes.sum()), float(capacities.sum())
+        fill = min(1.0, total_volume / total_capacity * (1.0 + self.balance_slack)) if total_capacity else 1.0
+        targets = capacities * fill
+        
+        base_cost = self.depot_weight * self._distances(points, bases)
+        centers = bases.copy()
+        labels = np.full(n, -1, dtype=np.intp)
+        iterations = 0
+        overflow = 0.0
+        
+        for iterations in range(1, self.max_iter + 1):
+            cost = self._distances(points, centers) + base_cost
+            new_labels, overflow = self._assign(cost, volumes, targets, capacities)
+            
+            changed = not np.array_equal(new_labels, labels)
+            labels = new_labels
+            if not changed:
+                break
+            
+            counts = np.bincount(labels, minlength=k)
+            occupied = counts > 0
+            for axis in range(2):
+                sums = np.bincount(labels, weights=points[:, axis], minlength=k)
+                centers[occupied, axis] = sums[occupied] / counts[occupied]
+        
+        loads = np.bincount(labels, weights=volumes, minlength=k) if n else np.zeros(k)
+        self.last_report = {
+            'iterations': iterations,
+            'overflow_volume': overflow,
+            'loads': loads.tolist(),
+            'capacities': capacities.tolist(),
+            'max_utilization': float(np.max(loads / capacities)) if k else 0.0
+        }
+        return labels
+    
+    @staticmethod
+    def _distances(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        """Planar distances between every point and every center."""
+        return np.hypot(points[:, 0, None] - centers[None, :, 0], points[:, 1, None] - centers[None, :, 1])
+    
+    @staticmethod
+    def _assign(cost: np.ndarray,
+                volumes: np.ndarray,
+                targets: np.ndarray,
+                capacities: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Regret-ordered capacitated assignment; returns (labels, overflow volume)."""
+        n, k = cost.shape
+        labels = np.empty(n, dtype=np.intp)
+        if n == 0:
+            return labels, 0.0
+        
+        best = cost.argmin(axis=1)
+        if k > 1:
+            two = np.partition(cost, 1, axis=1)
+            regret = two[:, 1] - two[:, 0]
+        else:
+            regret = np.zeros(n)
+        order = np.lexsort((-volumes, -regret))
+        
+        target_left = targets.astype(np.float64).tolist()
+        capacity_left = capacities.astype(np.float64)
+        volume_list = volumes.tolist()
+        best_list = best.tolist()
+        overflow = 0.0
+        
+        for i in order.tolist():
+            volume = volume_list[i]
+            choice = best_list[i]
+            if target_left[choice] < volume:
+                # Cheapest cluster is at its target: next cheapest with room
+                ranked = np.argsort(cost[i])
+                within_target = np.asarray(target_left)[ranked] >= volume
+                within_capacity = capacity_left[ranked] >= volume
+                if within_target.any():
+                    choice = int(ranked[within_target.argmax()])
+                elif within_capacity.any():
+                    choice = int(ranked[within_capacity.argmax()])
+                else:
+                    choice = int(capacity_left.argmax())
+                    overflow += volume - max(float(capacity_left[choice]), 0.0)
+            
+            labels[i] = choice
+            target_left[choice] -= volume
+            capacity_left[choice] -= volume
+        
+        return labels, overflow
@@ -0,0 +1,197 @@
+"""
+Circuit breaker for remote distance providers.
+Stops calling a failing API after repeated errors so route optimization falls
+back to offline distances immediately instead of waiting on every timeout.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Three-state circuit breaker with exponential backoff.
+    
+    Closed: requests flow; consecutive failures are counted.
+    Open: requests are rejected until the backoff has elapsed.
+    Half-open: a single probe request is let through. Success closes the
+    circuit, failure reopens it with the backoff multiplied.
+    
+    Breakers obtained through shared() live for the whole process, so the
+    state survives across optimization runs (and API server requests).
+    """
+    
+    _shared: Dict[str, "CircuitBreaker"] = {}
+    _shared_lock = threading.Lock()
+    
+    def __init__(self,
+                 failure_threshold: int = 5,
+                 base_backoff_seconds: float = 5.0,
+                 max_backoff_seconds: float = 300.0,
+                 backoff_multiplier: float = 2.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize circuit breaker.
+        
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            base_backoff_seconds: Time the circuit stays open after it first opens
+            max_backoff_seconds: Upper bound of the backoff
+            backoff_multiplier: Factor applied to the backoff after every failed probe
+            clock: Time source, injectable for testing
+        """
+        if failure_threshold < 1:
+            raise ValueError(f"Failure threshold must be at least 1: {failure_threshold}")
+        if base_backoff_seconds <= 0 or max_backoff_seconds < base_backoff_seconds:
+            raise ValueError(f"Invalid backoff range: {base_backoff_seconds}-{max_backoff_seconds}")
+        if backoff_multiplier < 1:
+            raise ValueError(f"Backoff multiplier must be at least 1: {backoff_multiplier}")
+        
+        self.failure_threshold = failure_threshold
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.backoff_multiplier = backoff_multiplier
+        self._clock = clock
+        self._lock = threading.Lock()
+        
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._backoff = base_backoff_seconds
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        
+        self.total_failures = 0
+        self.total_successes = 0
+        self.rejected = 0
+        self.times_opened = 0
+    
+    @classmethod
+    def shared(cls, name: str, **kwargs) -> "CircuitBreaker":
+        """
+        Return the process-wide breaker for an endpoint, creating it on first use.
+        
+        Args:
+            name: Endpoint identifier (e.g. the API base URL)
+            **kwargs: Passed to the constructor when the breaker is created
+        
+        Returns:
+            Shared circuit breaker
+        """
+        with cls._shared_lock:
+            if name not in cls._shared:
+                cls._shared[name] = cls(**kwargs)
+            return cls._shared[name]
+    
+    @classmethod
+    def shared_stats(cls) -> Dict[str, Dict[str, object]]:
+        """Return stats() of every shared breaker, keyed by endpoint."""
+        with cls._shared_lock:
+            breakers = dict(cls._shared)
+        return {name: breaker.stats() for name, breaker in breakers.items()}
+    
+    @property
+    def state(self) -> str:
+        """Return the current state: 'closed', 'open' or 'half_open'."""
+        with self._lock:
+            self._update_state()
+            return self._state
+    
+    def _update_state(self) -> None:
+        """Move from open to half-open once the backoff has elapsed (lock held)."""
+        if self._state == OPEN and self._clock() - self._opened_at >= self._backoff:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+    
+    def is_open(self) -> bool:
+        """Return True while requests would be rejected without a probe slot."""
+        with self._lock:
+            self._update_state()
+            return self._state == OPEN or (self._state == HALF_OPEN and self._probe_in_flight)
+    
+    def allow_request(self) -> bool:
+        """
+        Ask permission to send one request.
+        
+        In the half-open state only the first caller gets through as the probe;
+        it must report back with record_success() or record_failure().
+        
+        Returns:
+            True if the request may be sent
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+    
+    def record_success(self) -> None:
+        """Report a successful request; closes the circuit and resets the backoff."""
+        with self._lock:
+            self.total_successes += 1
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            if self._state != CLOSED:
+                self._state = CLOSED
+                self._backoff = self.base_backoff_seconds
+    
+    def record_failure(self) -> None:
+        """Report a failed request; may open (or reopen) the circuit."""
+        with self._lock:
+            self.total_failures += 1
+            self._consecutive_failures += 1
+            
+            if self._state == HALF_OPEN:
+                # Failed probe: back off further before the next one
+                self._backoff = min(self._backoff * self.backoff_multiplier, self.max_backoff_seconds)
+                self._open()
+            elif self._state == CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._backoff = self.base_backoff_seconds
+                self._open()
+    
+    def _open(self) -> None:
+        """Open the circuit (lock held)."""
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._probe_in_flight = False
+        self.times_opened += 1
+    
+    def reset(self) -> None:
+        """Close the circuit and clear the failure count; counters are kept."""
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._backoff = self.base_backoff_seconds
+            self._probe_in_flight = False
+    
+    def stats(self) -> Dict[str, object]:
+        """
+        Return the breaker state for monitoring.
+        
+        Returns:
+            Dictionary with state, consecutive failures, current backoff, seconds
+            until the next probe and success/failure/rejection counters
+        """
+        with self._lock:
+            self._update_state()
+            retry_in: Optional[float] = None
+            if self._state == OPEN:
+                retry_in = max(0.0, self._opened_at + self._backoff - self._clock())
+            return {
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'backoff_seconds': self._backoff,
+                'retry_in_seconds': retry_in,
+                'times_opened': self.times_opened,
+                'successes': self.total_successes,
+                'failures': self.total_failures,
+                'rejected': self.rejected
+            }
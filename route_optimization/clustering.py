@@ -4,28 +4,57 @@ Uses K-Means clustering to create balanced workloads for drivers.
 """
 
 import numpy as np
-from typing import List, Dict, Tuple
-from sklearn.cluster import KMeans
+from typing import List, Dict, NamedTuple, Optional, Tuple
+from scipy.optimize import linear_sum_assignment
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import silhouette_score
 import math
 
 from .models import PickupPoint, Driver
 from .distance_calculator import DistanceCalculator
+from .driver_registry import DriverRegistry
+from .clustering_engine import ClusteringEngine
+from .capacitated_clustering import CapacitatedClustering
+from .equirectangular import EquirectangularProjection
+from .incremental_clustering import IncrementalClustering
+
+
+class FeatureScaling(NamedTuple):
+    """Feature normalization of one clustering: (row - mean) / scale after projection."""
+    mean: np.ndarray
+    scale: np.ndarray
+    projection: Optional[EquirectangularProjection]
 
 
 class PickupClusterer:
     """Handles clustering of pickup points for driver assignment."""
     
-    def __init__(self, distance_calculator: DistanceCalculator):
+    def __init__(self,
+                 distance_calculator: DistanceCalculator,
+                 driver_registry: Optional[DriverRegistry] = None,
+                 engine: Optional[ClusteringEngine] = None,
+                 capacity_aware: bool = False,
+                 incremental: Optional[IncrementalClustering] = None):
         """
         Initialize clusterer.
         
         Args:
             distance_calculator: Distance calculation utility
+            driver_registry: Optional registry of warm depot distances used to
+                match drivers to clusters
+            engine: Clustering engine (default: ClusteringEngine() with its time budget)
+            capacity_aware: Build one cluster per driver whose volume fits the driver's
+                max_capacity (see CapacitatedClustering) instead of plain k-means
+            incremental: Optional store of previous clusterings; k-means runs of a
+                fleet seen before warm-start from its last centroids, labels and
+                feature scaling (not used with capacity_aware)
         """
         self.distance_calculator = distance_calculator
+        self.driver_registry = driver_registry
+        self.engine = engine or ClusteringEngine()
+        self.capacitated = CapacitatedClustering() if capacity_aware else None
         self.scaler = StandardScaler()
+        self.incremental = incremental
+        self.last_warm_start: Dict[str, object] = {}
     
     def cluster_pickups(self, 
                        pickup_points: List[PickupPoint], 
@@ -48,17 +77,24 @@ class PickupClusterer:
         if len(drivers) == 0:
             raise ValueError("No drivers available for clustering")
         
+        if self.capacitated is not None:
+            # Clusters are built per driver, so no separate driver assignment
+            return self.capacitated.cluster(pickup_points, drivers)
+        
         # Determine optimal number of clusters
         n_clusters = min(len(drivers), len(pickup_points))
         
-        if n_clusters == 1:
+        if len(drivers) == 1:
             return {0: pickup_points}
         
-        # Prepare features for clustering
-        features = self._prepare_features(pickup_points, balance_workload)
-        
-        # Perform clustering
-        clusters = self._perform_clustering(features, n_clusters)
+        if self.incremental is not None:
+            clusters = self._incremental_clustering(pickup_points, drivers, n_clusters, balance_workload)
+        else:
+            # Prepare features for clustering
+            features = self._prepare_features(pickup_points, balance_workload)
+            
+            # Perform clustering
+            clusters = self._perform_clustering(features, n_clusters)
         
         # Group pickup points by cluster
         clustered_points = {}
@@ -83,31 +119,103 @@ class PickupClusterer:
         Returns:
             Normalized feature matrix
         """
+        features_array = np.array(self._feature_rows(pickup_points, balance_workload), dtype=np.float64)
+        return self._scale_features(features_array, self._fit_scaling(features_array))
+    
+    def _feature_rows(self, pickup_points: List[PickupPoint], balance_workload: bool) -> List[tuple]:
+        """Raw (lat, lng[, volume, priority]) feature row of every pickup point."""
         features = []
         
         for point in pickup_points:
-            feature_vector = [
+            feature_vector = (
                 point.lat,
                 point.lng,
-            ]
+            )
             
             if balance_workload:
                 # Add volume and priority as features for workload balancing
-                feature_vector.extend([
+                feature_vector += (
                     point.volume,
                     point.priority_flag.priority_value,
-                ])
+                )
             
             features.append(feature_vector)
         
-        features_array = np.array(features)
-        
+        return features
+    
+    def _fit_scaling(self, features_array: np.ndarray) -> FeatureScaling:
+        """Fit the feature normalization to raw feature rows."""
         # Normalize features
-        return self.scaler.fit_transform(features_array)
+        self.scaler.fit(features_array)
+        mean, scale = self.scaler.mean_.copy(), self.scaler.scale_.copy()
+        
+        projection = self.distance_calculator.planar_projection(features_array[:, :2])
+        if projection is not None:
+            # Equirectangular metric: cluster on planar kilometers scaled by one
+            # common factor, so east-west and north-south spreads stay comparable
+            planar = projection.project(features_array[:, :2])
+            mean[:2] = planar.mean(axis=0)
+            scale[:2] = (planar - mean[:2]).std() or 1.0
+        
+        return FeatureScaling(mean, scale, projection)
+    
+    @staticmethod
+    def _scale_features(features_array: np.ndarray, scaling: FeatureScaling) -> np.ndarray:
+        """Normalize raw feature rows with a fitted scaling."""
+        features = features_array.copy()
+        if scaling.projection is not None:
+            features[:, :2] = scaling.projection.project(features_array[:, :2])
+        features -= scaling.mean
+        features /= scaling.scale
+        return features
+    
+    def _incremental_clustering(self,
+                                pickup_points: List[PickupPoint],
+                                drivers: List[Driver],
+                                n_clusters: int,
+                                balance_workload: bool) -> np.ndarray:
+        """
+        Cluster with a warm start from this fleet's previous clustering.
+        
+        Falls back to a full clustering (and remembers it) when the fleet is
+        new, its cluster count changed or too many points changed.
+        
+        Args:
+            pickup_points: List of pickup points
+            drivers: List of available drivers
+            n_clusters: Number of clusters to create
+            balance_workload: Whether to include workload balancing features
+        
+        Returns:
+            Cluster labels for each point
+        """
+        fleet_key = (tuple(driver.driver_id for driver in drivers), balance_workload)
+        rows = self._feature_rows(pickup_points, balance_workload)
+        features_array = np.array(rows, dtype=np.float64)
+        pickup_ids = [point.pickup_id for point in pickup_points]
+        
+        labels = None
+        snapshot = self.incremental.lookup(fleet_key)
+        if snapshot is not None and len(snapshot.centers) == n_clusters:
+            scaling = snapshot.scaling
+            features = self._scale_features(features_array, scaling)
+            labels, centers, self.last_warm_start = self.incremental.update(snapshot, pickup_ids, rows, features)
+        else:
+            self.last_warm_start = {'mode': 'full', 'placed_points': len(pickup_points),
+                                    'removed_points': 0, 'affected_clusters': n_clusters}
+        
+        if labels is None:
+            scaling = self._fit_scaling(features_array)
+            features = self._scale_features(features_array, scaling)
+            labels = self._perform_clustering(features, n_clusters)
+            centers = IncrementalClustering.cluster_centers(features, labels, n_clusters)
+        
+        self.incremental.remember(fleet_key, pickup_ids, rows, labels, centers, scaling)
+        return labels
     
     def _perform_clustering(self, features: np.ndarray, n_clusters: int) -> np.ndarray:
         """
-        Perform K-Means clustering with optimization.
+        Perform K-Means clustering through the time-budgeted clustering engine.
         
         Args:
             features: Normalized feature matrix
@@ -120,34 +228,8 @@ class PickupClusterer:
             # If we have more clusters than points, assign each point to its own cluster
             return np.arange(len(features))
         
-        # Try different random states and pick the best clustering
-        best_clustering = None
-        best_score = -1
-        
-        for random_state in range(5):  # Try 5 different initializations
-            try:
-                kmeans = KMeans(
-                    n_clusters=n_clusters,
-                    random_state=random_state,
-                    n_init=10,
-                    max_iter=300
-                )
-                
-                clusters = kmeans.fit_predict(features)
-                
-                # Calculate silhouette score if we have enough points
-                if len(features) > n_clusters:
-                    score = silhouette_score(features, clusters)
-                    if score > best_score:
-                        best_score = score
-                        best_clustering = clusters
-                else:
-                    best_clustering = clusters
-                    break
-                    
-            except Exception as e:
-                print(f"Clustering attempt {random_state} failed: {e}")
-                continue
+        # Repeated cheap fits under a wall-clock budget, best quality score wins
+        best_clustering = self.engine.cluster(features, n_clusters)
         
         if best_clustering is None:
             # Fallback: assign points to clusters round-robin
@@ -161,104 +243,82 @@ class PickupClusterer:
         """
         Optimize cluster-to-driver assignment based on driver locations.
         
+        With more drivers than clusters the farthest drivers stay idle; with
+        more clusters than drivers each leftover cluster joins the driver
+        closest to it.
+        
         Args:
             clustered_points: Initial clustering result
             drivers: List of available drivers
             
         Returns:
-            Optimized cluster assignment
+            Dictionary mapping driver index to its pickup points
         """
-        if len(clustered_points) != len(drivers):
-            # If mismatched numbers, return original clustering
-            return clustered_points
-        
-        # Calculate cluster centroids
-        cluster_centroids = {}
-        for cluster_id, points in clustered_points.items():
-            if points:
-                avg_lat = sum(p.lat for p in points) / len(points)
-                avg_lng = sum(p.lng for p in points) / len(points)
-                cluster_centroids[cluster_id] = (avg_lat, avg_lng)
-        
-        # Calculate distance matrix between drivers and cluster centroids
-        driver_positions = [(d.base_lat, d.base_lng) for d in drivers]
-        centroid_positions = [cluster_centroids[cid] for cid in sorted(cluster_centroids.keys())]
-        
-        distance_matrix = self.distance_calculator.batch_distances(
-            driver_positions, centroid_positions
-        )
-        
-        # Solve assignment problem using greedy approach
-        # For production, consider using scipy.optimize.linear_sum_assignment
-        assignments = self._greedy_assignment(distance_matrix)
+        cluster_ids = sorted(cid for cid, points in clustered_points.items() if points)
+        if not cluster_ids or not drivers:
+            return {}
+        
+        if self.driver_registry is not None:
+            # Mean depot distance to the cluster's points, read from the warm registry
+            distance_matrix = np.column_stack([
+                self.driver_registry.depot_distances(self.distance_calculator, drivers,
+                                                     clustered_points[cid])[0].mean(axis=1)
+                for cid in cluster_ids
+            ])
+        else:
+            # Calculate distance matrix between drivers and cluster centroids
+            driver_positions = [(d.base_lat, d.base_lng) for d in drivers]
+            centroid_positions = [
+                tuple(np.mean([(p.lat, p.lng) for p in clustered_points[cid]], axis=0)) for cid in cluster_ids
+            ]
+            
+            distance_matrix = self.distance_calculator.batch_distance_matrix(
+                driver_positions, centroid_positions
+            )
+        distance_matrix = np.asarray(distance_matrix, dtype=np.float64)
+        
+        # Minimum total distance matching (rectangular when counts differ)
+        assignments = self._optimal_assignment(distance_matrix)
         
         # Reassign clusters based on optimal assignment
         optimized_clusters = {}
-        cluster_ids = sorted(clustered_points.keys())
-        
         for driver_idx, cluster_idx in enumerate(assignments):
-            original_cluster_id = cluster_ids[cluster_idx]
-            optimized_clusters[driver_idx] = clustered_points[original_cluster_id]
+            if cluster_idx >= 0:
+                optimized_clusters[driver_idx] = list(clustered_points[cluster_ids[cluster_idx]])
         
-        return optimized_clusters
+        assigned = set(assignments)
+        for cluster_idx, cluster_id in enumerate(cluster_ids):
+            if cluster_idx not in assigned:
+                driver_idx = int(np.argmin(distance_matrix[:, cluster_idx]))
+                optimized_clusters[driver_idx].extend(clustered_points[cluster_id])
+        
+        return dict(sorted(optimized_clusters.items()))
     
-    def _greedy_assignment(self, distance_matrix: List[List[float]]) -> List[int]:
+    def _optimal_assignment(self, distance_matrix: np.ndarray) -> List[int]:
         """
-        Solve assignment problem using greedy approach.
+        Solve the assignment problem exactly (Hungarian-type, O(n^3)).
         
         Args:
             distance_matrix: Distance matrix between drivers and clusters
             
         Returns:
-            List where assignments[i] is the cluster assigned to driver i
+            List where assignments[i] is the cluster assigned to driver i, or -1
+            when there are fewer clusters than drivers and driver i stays idle
         """
-        n_drivers = len(distance_matrix)
-        n_clusters = len(distance_matrix[0]) if distance_matrix else 0
-        
-        if n_drivers == 0 or n_clusters == 0:
+        distance_matrix = np.asarray(distance_matrix, dtype=np.float64)
+        if distance_matrix.ndim != 2 or distance_matrix.size == 0:
             return []
         
-        assignments = [-1] * n_drivers
-        used_clusters = set()
-        
-        # Create list of (distance, driver_idx, cluster_idx) tuples
-        distance_tuples = []
-        for driver_idx in range(n_drivers):
-            for cluster_idx in range(n_clusters):
-                distance_tuples.append((
-                    distance_matrix[driver_idx][cluster_idx],
-                    driver_idx,
-                    cluster_idx
-                ))
-        
-        # Sort by distance (ascending)
-        distance_tuples.sort()
-        
-        # Assign greedily
-        for distance, driver_idx, cluster_idx in distance_tuples:
-            if assignments[driver_idx] == -1 and cluster_idx not in used_clusters:
-                assignments[driver_idx] = cluster_idx
-                used_clusters.add(cluster_idx)
-                
-                # If all drivers assigned, break
-                if len(used_clusters) == n_drivers:
-                    break
-        
-        # Handle unassigned drivers (if any)
-        for driver_idx in range(n_drivers):
-            if assignments[driver_idx] == -1:
-                # Assign to nearest available cluster
-                min_distance = float('inf')
-                best_cluster = 0
-                for cluster_idx in range(n_clusters):
-                    if cluster_idx not in used_clusters:
-                        if distance_matrix[driver_idx][cluster_idx] < min_distance:
-                            min_distance = distance_matrix[driver_idx][cluster_idx]
-                            best_cluster = cluster_idx
-                
-                assignments[driver_idx] = best_cluster
-                used_clusters.add(best_cluster)
+        # Unknown distances must not be chosen, but must not break the solver either
+        finite = np.isfinite(distance_matrix)
+        if not finite.all():
+            penalty = (distance_matrix[finite].max() + 1.0) * distance_matrix.size if finite.any() else 1.0
+            distance_matrix = np.where(finite, distance_matrix, penalty)
         
+        driver_indices, cluster_indices = linear_sum_assignment(distance_matrix)
+        assignments = [-1] * distance_matrix.shape[0]
+        for driver_idx, cluster_idx in zip(driver_indices.tolist(), cluster_indices.tolist()):
+            assignments[driver_idx] = cluster_idx
         return assignments
     
     def analyze_cluster_balance(self, 
@@ -0,0 +1,221 @@
+"""
+Time-budgeted clustering engine with pluggable k-means strategies.
+Repeats cheap randomized fits while the wall-clock budget lasts, scores them
+with a sampled silhouette (or linear-time inertia) and stops as soon as the
+score stops improving.
+"""
+
+import time
+import numpy as np
+from typing import Dict, Optional, Tuple, Union
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+# Wall-clock seconds the engine may spend on repeated fits
+CLUSTERING_TIME_BUDGET = 2.0
+
+# Points above which the 'auto' strategy switches to mini-batch k-means
+MINIBATCH_MIN_POINTS = 10000
+
+# Points sampled when computing the silhouette score (O(sample^2))
+SILHOUETTE_SAMPLE_SIZE = 2000
+
+FitResult = Tuple[np.ndarray, np.ndarray, float]
+
+
+class KMeansPlusPlusStrategy:
+    """A single Lloyd k-means run from one k-means++ seeding."""
+    
+    name = "kmeans++"
+    
+    def __init__(self, max_iter: int = 300):
+        self.max_iter = max_iter
+    
+    def fit(self, features: np.ndarray, n_clusters: int, random_state: int) -> FitResult:
+        """
+        Fit one clustering.
+        
+        Args:
+            features: (n, d) feature matrix
+            n_clusters: Number of clusters
+            random_state: Seed of this attempt
+        
+        Returns:
+            (labels, centers, inertia)
+        """
+        kmeans = KMeans(n_clusters=n_clusters, init='k-means++', n_init=1,
+                        max_iter=self.max_iter, random_state=random_state)
+        labels = kmeans.fit_predict(features)
+        return labels, kmeans.cluster_centers_, float(kmeans.inertia_)
+
+
+class MiniBatchKMeansStrategy:
+    """Mini-batch k-means: each iteration touches only batch_size points."""
+    
+    name = "minibatch"
+    
+    def __init__(self, batch_size: int = 2048, max_iter: int = 100):
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+    
+    def fit(self, features: np.ndarray, n_clusters: int, random_state: int) -> FitResult:
+        """Fit one clustering (see KMeansPlusPlusStrategy.fit)."""
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=self.batch_size, n_init=1,
+                                 max_iter=self.max_iter, random_state=random_state)
+        labels = kmeans.fit_predict(features)
+        return labels, kmeans.cluster_centers_, float(kmeans.inertia_)
+
+
+class FullKMeansStrategy:
+    """Classic k-means with n_init seedings per fit (the previous behavior, per attempt)."""
+    
+    name = "kmeans"
+    
+    def __init__(self, n_init: int = 10, max_iter: int = 300):
+        self.n_init = n_init
+        self.max_iter = max_iter
+    
+    def fit(self, features: np.ndarray, n_clusters: int, random_state: int) -> FitResult:
+        """Fit one clustering (see KMeansPlusPlusStrategy.fit)."""
+        kmeans = KMeans(n_clusters=n_clusters, n_init=self.n_init,
+                        max_iter=self.max_iter, random_state=random_state)
+        labels = kmeans.fit_predict(features)
+        return labels, kmeans.cluster_centers_, float(kmeans.inertia_)
+
+
+CLUSTERING_STRATEGIES = {
+    KMeansPlusPlusStrategy.name: KMeansPlusPlusStrategy,
+    MiniBatchKMeansStrategy.name: MiniBatchKMeansStrategy,
+    FullKMeansStrategy.name: FullKMeansStrategy,
+}
+
+
+class ClusteringEngine:
+    """
+    Repeated randomized clustering under a wall-clock budget.
+    
+    Attempt i fits the strategy with random_state i. Every attempt is scored
+    (higher is better); the engine stops when the budget is spent, after
+    max_attempts, or once patience attempts in a row failed to improve the
+    best score by more than tolerance. The first attempt always runs.
+    """
+    
+    def __init__(self,
+                 strategy: Union[str, object] = "auto",
+                 time_budget_seconds: Optional[float] = CLUSTERING_TIME_BUDGET,
+                 max_attempts: int = 10,
+                 patience: int = 3,
+                 tolerance: float = 1e-3,
+                 quality: str = "silhouette",
+                 sample_size: int = SILHOUETTE_SAMPLE_SIZE,
+                 clock=time.monotonic):
+        """
+        Initialize clustering engine.
+        
+        Args:
+            strategy: 'auto' (k-means++ below MINIBATCH_MIN_POINTS points, mini-batch
+                above), a name from CLUSTERING_STRATEGIES, or an object with a
+                fit(features, n_clusters, random_state) -> (labels, centers, inertia) method
+            time_budget_seconds: Wall-clock budget for all attempts (None for no limit)
+            max_attempts: Maximum number of fits
+            patience: Attempts without improvement before stopping early
+            tolerance: Relative score gain that counts as an improvement
+            quality: 'silhouette' (sampled, O(sample_size^2)) or 'inertia' (linear time,
+                free from the fit)
+            sample_size: Points sampled for the silhouette score
+            clock: Time source, injectable for tests
+        """
+        if quality not in ("silhouette", "inertia"):
+            raise ValueError(f"Unknown clustering quality metric: {quality}")
+        if isinstance(strategy, str) and strategy != "auto" and strategy not in CLUSTERING_STRATEGIES:
+            raise ValueError(f"Unknown clustering strategy: {strategy}")
+        self.strategy = strategy
+        self.time_budget_seconds = time_budget_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.patience = max(1, patience)
+        self.tolerance = tolerance
+        self.quality = quality
+        self.sample_size = sample_size
+        self._clock = clock
+        self.last_run: Dict[str, object] = {}
+    
+    def _resolve_strategy(self, n_points: int):
+        """Return the strategy object for a problem size."""
+        if not isinstance(self.strategy, str):
+            return self.strategy
+        name = self.strategy
+        if name == "auto":
+            name = MiniBatchKMeansStrategy.name if n_points >= MINIBATCH_MIN_POINTS else KMeansPlusPlusStrategy.name
+        return CLUSTERING_STRATEGIES[name]()
+    
+    def score(self, features: np.ndarray, labels: np.ndarray, inertia: float) -> float:
+        """
+        Score a clustering, higher is better.
+        
+        Args:
+            features: (n, d) feature matrix
+            labels: Cluster label per point
+            inertia: Sum of squared distances to the centers
+        
+        Returns:
+            Sampled silhouette score, or negative inertia
+        """
+        if self.quality == "inertia":
+            return -inertia
+        n_labels = len(np.unique(labels))
+        if n_labels < 2 or n_labels >= len(features):
+            return -1.0
+        sample_size = self.sample_size if len(features) > self.sample_size else None
+        return float(silhouette_score(features, labels, sample_size=sample_size, random_state=0))
+    
+    def cluster(self, features: np.ndarray, n_clusters: int) -> np.ndarray:
+        """
+        Cluster features, keeping the best-scoring attempt.
+        
+        Args:
+            features: Normalized feature matrix
+            n_clusters: Number of clusters to create
+        
+        Returns:
+            Cluster labels for each point
+        """
+        start = self._clock()
+        strategy = self._resolve_strategy(len(features))
+        
+        best_labels, best_score = None, -np.inf
+        stale = 0
+        attempts = 0
+        stop_reason = "max_attempts"
+        
+        for random_state in range(self.max_attempts):
+            if attempts and self.time_budget_seconds is not None and \
+                    self._clock() - start >= self.time_budget_seconds:
+                stop_reason = "time_budget"
+                break
+            
+            try:
+                labels, _, inertia = strategy.fit(features, n_clusters, random_state)
+            except Exception as e:
+                print(f"Clustering attempt {random_state} failed: {e}")
+                continue
+            attempts += 1
+            
+            score = self.score(features, labels, inertia)
+            if best_labels is None or score > best_score + self.tolerance * abs(best_score):
+                best_labels, best_score = labels, score
+                stale = 0
+            else:
+                stale += 1
+                if stale >= self.patience:
+                    stop_reason = "converged"
+                    break
+        
+        self.last_run = {
+            'strategy': getattr(strategy, 'name', type(strategy).__name__),
+            'attempts': attempts,
+            'best_score': best_score if best_labels is not None else None,
+            'quality': self.quality,
+            'elapsed_seconds': self._clock() - start,
+            'stop_reason': stop_reason
+        }
+        return best_labels
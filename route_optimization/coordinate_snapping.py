@@ -0,0 +1,138 @@
+"""
+Coordinate snapping for distance cache keys.
+Normalizes coordinates to a fixed grid or geohash cell so reports of the same
+location with GPS jitter share one cache entry.
+"""
+
+import math
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+# Kilometers per degree of latitude (and of longitude at the equator)
+KM_PER_DEGREE = 111.32
+
+GRID = "grid"
+GEOHASH = "geohash"
+
+
+class CoordinateSnapper:
+    """
+    Snaps coordinates to the center of a grid or geohash cell.
+    
+    Error bound: a snapped point lies at most max_point_error_km from the
+    original one (half the cell diagonal, taken at the equator where cells are
+    widest). A great-circle distance between two snapped points therefore
+    differs from the exact one by at most max_pair_error_km, twice that
+    value. Road distances usually stay within the same bound, but a cell can
+    straddle a road that is only reachable by a detour. Jittered readings
+    that fall on either side of a cell edge still get different keys.
+    
+    Common settings:
+        grid 10 m      -> points move at most ~7 m, pair distances ~14 m
+        geohash 8      -> cells of ~38 m x 19 m, points move at most ~21 m
+        geohash 7      -> cells of ~153 m x 153 m, points move at most ~108 m
+    """
+    
+    def __init__(self, mode: str = GRID, cell_meters: float = 10.0, geohash_precision: int = 8):
+        """
+        Initialize coordinate snapper.
+        
+        Args:
+            mode: 'grid' for a square degree grid, 'geohash' for geohash cells
+            cell_meters: Grid cell edge in meters (grid mode)
+            geohash_precision: Number of geohash characters, 1-12 (geohash mode)
+        """
+        if mode == GRID:
+            if cell_meters <= 0:
+                raise ValueError(f"Grid cell size must be positive: {cell_meters}")
+            step = cell_meters / 1000.0 / KM_PER_DEGREE
+            self.lat_step = self.lng_step = step
+        elif mode == GEOHASH:
+            if not 1 <= geohash_precision <= 12:
+                raise ValueError(f"Geohash precision must be between 1 and 12: {geohash_precision}")
+            # Geohash interleaves bits starting with longitude
+            bits = 5 * geohash_precision
+            self.lat_step = 180.0 / 2 ** (bits // 2)
+            self.lng_step = 360.0 / 2 ** ((bits + 1) // 2)
+        else:
+            raise ValueError(f"Unknown snapping mode: {mode}")
+        
+        self.mode = mode
+        self.cell_meters = cell_meters
+        self.geohash_precision = geohash_precision
+    
+    @classmethod
+    def from_spec(cls, spec: Optional[str]) -> Optional["CoordinateSnapper"]:
+        """
+        Create a snapper from a short configuration string.
+        
+        Args:
+            spec: 'grid:<meters>' or 'geohash:<precision>'; None or '' disables snapping
+        
+        Returns:
+            Coordinate snapper, or None when snapping is disabled
+        """
+        if not spec:
+            return None
+        
+        mode, _, value = spec.partition(":")
+        mode = mode.strip().lower()
+        if mode == GRID:
+            return cls(GRID, cell_meters=float(value or 10.0))
+        if mode == GEOHASH:
+            return cls(GEOHASH, geohash_precision=int(value or 8))
+        raise ValueError(f"Invalid snapping spec: {spec}")
+    
+    @property
+    def max_point_error_km(self) -> float:
+        """Return the largest distance between a point and its snapped position."""
+        return 0.5 * KM_PER_DEGREE * math.hypot(self.lat_step, self.lng_step)
+    
+    @property
+    def max_pair_error_km(self) -> float:
+        """Return the largest change of a great-circle distance caused by snapping both ends."""
+        return 2.0 * self.max_point_error_km
+    
+    def snap_array(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Snap an array of coordinates to cell centers.
+        
+        Args:
+            coords: (n, 2) array of (lat, lng)
+        
+        Returns:
+            (n, 2) array of snapped (lat, lng)
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if self.mode == GRID:
+            steps = np.array([self.lat_step, self.lng_step])
+            return np.round(coords / steps) * steps
+        
+        origin = np.array([-90.0, -180.0])
+        steps = np.array([self.lat_step, self.lng_step])
+        return origin + (np.floor((coords - origin) / steps) + 0.5) * steps
+    
+    def snap_point(self, lat: float, lng: float) -> Tuple[float, float]:
+        """Snap a single (lat, lng) to its cell center."""
+        snapped = self.snap_array(np.array([[lat, lng]]))[0]
+        return float(snapped[0]), float(snapped[1])
+    
+    def snap_pairs(self, pairs: Sequence[Tuple[float, float, float, float]]) -> List[Tuple[float, float, float, float]]:
+        """
+        Snap both ends of every coordinate pair.
+        
+        Args:
+            pairs: Sequence of (lat1, lng1, lat2, lng2) tuples
+        
+        Returns:
+            List of snapped (lat1, lng1, lat2, lng2) tuples, usable as cache keys
+        """
+        if not len(pairs):
+            return []
+        snapped = self.snap_array(np.asarray(pairs, dtype=np.float64).reshape(-1, 2)).reshape(-1, 4)
+        return [tuple(row) for row in snapped.tolist()]
+    
+    def __repr__(self) -> str:
+        if self.mode == GRID:
+            return f"CoordinateSnapper(grid, {self.cell_meters} m)"
+        return f"CoordinateSnapper(geohash, precision {self.geohash_precision})"
@@ -0,0 +1,359 @@
+"""
+Distance caches for route optimization.
+Provides a bounded in-memory LRU/TTL cache for a single process and a
+persistent SQLite cache shared by every worker process on a host.
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# (lat1, lng1, lat2, lng2) in degrees
+CoordinatePair = Tuple[float, float, float, float]
+
+# Approximate size of one cached entry: 4-float key tuple, (value, expiry) tuple
+# and its slot in the ordered dict's linked list
+_ENTRY_BYTES = (
+    sys.getsizeof((0.0, 0.0, 0.0, 0.0)) + 4 * sys.getsizeof(0.0) +
+    sys.getsizeof((0.0, 0.0)) + 2 * sys.getsizeof(0.0) +
+    64
+)
+
+
+class LRUDistanceCache:
+    """
+    Bounded in-memory cache with least-recently-used eviction and per-entry TTL.
+    
+    Counters for hits, misses, evictions and expirations can be read at runtime
+    through stats().
+    """
+    
+    def __init__(self,
+                 max_size: Optional[int] = 50000,
+                 ttl_seconds: Optional[float] = 24 * 3600,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize LRU cache.
+        
+        Args:
+            max_size: Maximum number of entries (None for unbounded)
+            ttl_seconds: Lifetime of an entry in seconds (None to never expire)
+            clock: Time source, injectable for testing
+        """
+        if max_size is not None and max_size <= 0:
+            raise ValueError(f"Cache size must be positive: {max_size}")
+        if ttl_seconds is not None and ttl_seconds <= 0:
+            raise ValueError(f"Cache TTL must be positive: {ttl_seconds}")
+        
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key: Hashable) -> Optional[float]:
+        """
+        Look up a value, refreshing its recency.
+        
+        Args:
+            key: Cache key
+        
+        Returns:
+            Cached value, or None on a miss or an expired entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key: Hashable, value: float) -> None:
+        """
+        Store a value, evicting the least recently used entries when full.
+        
+        Args:
+            key: Cache key
+            value: Value to cache
+        """
+        expires_at = float('inf') if self.ttl_seconds is None else self._clock() + self.ttl_seconds
+        
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            
+            if self.max_size is not None:
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+    
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > self._clock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def clear(self) -> None:
+        """Remove all entries; counters are kept."""
+        with self._lock:
+            self._entries.clear()
+    
+    def purge_expired(self) -> int:
+        """
+        Remove every expired entry.
+        
+        Returns:
+            Number of entries removed
+        """
+        now = self._clock()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+            self.expirations += len(expired)
+        return len(expired)
+    
+    def stats(self) -> Dict[str, float]:
+        """
+        Return cache counters and an estimate of the memory held.
+        
+        Returns:
+            Dictionary with size, limits, hit/miss/eviction/expiration counters,
+            hit rate and approximate bytes
+        """
+        with self._lock:
+            size = len(self._entries)
+            lookups = self.hits + self.misses
+            return {
+                'size': size,
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'approx_bytes': sys.getsizeof(self._entries) + size * _ENTRY_BYTES
+            }
+
+
+class PersistentDistanceCache:
+    """
+    SQLite-backed cache of distances keyed by provider and quantized coordinates.
+    
+    The database runs in WAL mode so any number of processes (e.g. gunicorn
+    workers) can read it concurrently while one of them writes. Cache errors
+    never propagate; a failing cache behaves like an empty one.
+    """
+    
+    _instances: Dict[Tuple[int, str], "PersistentDistanceCache"] = {}
+    _instances_lock = threading.Lock()
+    
+    def __init__(self, path: str, precision: int = 5, timeout: float = 5.0):
+        """
+        Initialize persistent cache.
+        
+        Args:
+            path: SQLite database file, created if missing
+            precision: Decimal places kept when quantizing coordinates for keys
+                (5 places is about 1.1 m)
+            timeout: Seconds to wait for a write lock held by another process
+        """
+        self.path = path
+        self.precision = precision
+        self.timeout = timeout
+        self._scale = 10 ** precision
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+    
+    @classmethod
+    def open(cls, path: str, precision: int = 5) -> "PersistentDistanceCache":
+        """
+        Return the cache for a path, reusing one instance per process.
+        
+        Args:
+            path: SQLite database file
+            precision: Decimal places kept when quantizing coordinates
+        
+        Returns:
+            Shared cache instance
+        """
+        key = (os.getpid(), os.path.abspath(path))
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(path, precision)
+            return cls._instances[key]
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Return this process's connection, creating the schema on first use."""
+        # Connections must not be shared across fork(), so reconnect in children
+        if self._connection is not None and self._connection_pid == os.getpid():
+            return self._connection
+        
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        
+        connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS distances (
+                provider TEXT NOT NULL,
+                lat1 INTEGER NOT NULL,
+                lng1 INTEGER NOT NULL,
+                lat2 INTEGER NOT NULL,
+                lng2 INTEGER NOT NULL,
+                distance_km REAL NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (provider, lat1, lng1, lat2, lng2)
+            ) WITHOUT ROWID
+            """
+        )
+        connection.commit()
+        
+        self._connection = connection
+        self._connection_pid = os.getpid()
+        return connection
+    
+    def quantize(self, lat1: float, lng1: float, lat2: float, lng2: float) -> Tuple[int, int, int, int]:
+        """Convert a coordinate pair to the integer grid used in cache keys."""
+        scale = self._scale
+        return (round(lat1 * scale), round(lng1 * scale),
+                round(lat2 * scale), round(lng2 * scale))
+    
+    def get(self, provider: str, lat1: float, lng1: float, lat2: float, lng2: float) -> Optional[float]:
+        """
+        Look up a cached distance.
+        
+        Args:
+            provider: Name of the distance source (e.g. "google")
+            lat1, lng1: Latitude and longitude of first point
+            lat2, lng2: Latitude and longitude of second point
+        
+        Returns:
+            Distance in kilometers, or None if not cached
+        """
+        return self.get_many(provider, [(lat1, lng1, lat2, lng2)]).get(0)
+    
+    def get_many(self, provider: str, pairs: List[CoordinatePair]) -> Dict[int, float]:
+        """
+        Look up several cached distances in one query per batch.
+        
+        Args:
+            provider: Name of the distance source
+            pairs: Coordinate pairs to look up
+        
+        Returns:
+            Dictionary mapping index into pairs to cached distance (misses are absent)
+        """
+        if not pairs:
+            return {}
+        
+        keys = [self.quantize(*pair) for pair in pairs]
+        positions: Dict[Tuple[int, int, int, int], List[int]] = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, []).append(i)
+        
+        found: Dict[int, float] = {}
+        unique_keys = list(positions.keys())
+        
+        try:
+            with self._lock:
+                connection = self._connect()
+                # Stay well below SQLite's bound parameter limit
+                for start in range(0, len(unique_keys), 150):
+                    batch = unique_keys[start:start + 150]
+                    clause = " OR ".join(["(lat1=? AND lng1=? AND lat2=? AND lng2=?)"] * len(batch))
+                    params: List = [provider]
+                    for key in batch:
+                        params.extend(key)
+                    rows = connection.execute(
+                        f"SELECT lat1, lng1, lat2, lng2, distance_km FROM distances "
+                        f"WHERE provider=? AND ({clause})",
+                        params
+                    ).fetchall()
+                    for lat1, lng1, lat2, lng2, distance in rows:
+                        for i in positions.get((lat1, lng1, lat2, lng2), []):
+                            found[i] = distance
+        except (sqlite3.Error, OSError) as e:
+            print(f"Distance cache read error: {e}. Continuing without cache.")
+        
+        return found
+    
+    def set(self, provider: str, lat1: float, lng1: float, lat2: float, lng2: float,
+            distance_km: float) -> None:
+        """
+        Store a distance.
+        
+        Args:
+            provider: Name of the distance source
+            lat1, lng1: Latitude and longitude of first point
+            lat2, lng2: Latitude and longitude of second point
+            distance_km: Distance in kilometers
+        """
+        self.set_many(provider, [((lat1, lng1, lat2, lng2), distance_km)])
+    
+    def set_many(self, provider: str, entries: Iterable[Tuple[CoordinatePair, float]]) -> None:
+        """
+        Store several distances in a single transaction.
+        
+        Args:
+            provider: Name of the distance source
+            entries: Iterable of (coordinate pair, distance in kilometers)
+        """
+        now = time.time()
+        rows = [(provider, *self.quantize(*pair), float(distance), now) for pair, distance in entries]
+        if not rows:
+            return
+        
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO distances "
+                        "(provider, lat1, lng1, lat2, lng2, distance_km, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+        except (sqlite3.Error, OSError) as e:
+            print(f"Distance cache write error: {e}. Distance not persisted.")
+    
+    def __len__(self) -> int:
+        """Return number of cached distances across all providers."""
+        try:
+            with self._lock:
+                return self._connect().execute("SELECT COUNT(*) FROM distances").fetchone()[0]
+        except (sqlite3.Error, OSError):
+            return 0
+    
+    def close(self) -> None:
+        """Close this process's connection."""
+        with self._lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._connection_pid = None
@@ -4,27 +4,99 @@ Provides both Haversine (great circle) and road distance calculations.
 """
 
 import math
-import requests
-from typing import List, Tuple, Optional, Dict
+import numpy as np
+from typing import List, Tuple, Optional, Dict, Sequence, Union
 import time
 from functools import lru_cache
 
+from .distance_cache import PersistentDistanceCache, LRUDistanceCache
+from .google_maps_client import DistanceMatrixClient
+from .road_network import RoadNetworkProvider
+from .coordinate_snapping import CoordinateSnapper
+from .travel_time import TravelTimeModel
+from .equirectangular import EquirectangularProjection, EQUIRECTANGULAR_ERROR_BUDGET
+
+# Ratio between road and great circle distance used when no road data is available
+ROAD_FACTOR = 1.3
+
+# Mean radius of Earth in kilometers
+EARTH_RADIUS_KM = 6371.0
+
+# Default bound of the memoized scalar haversine_distance
+HAVERSINE_CACHE_SIZE = 10000
+
+# Default tile edge for blocked matrix computations (tile memory ~ chunk_size^2 floats)
+MATRIX_CHUNK_SIZE = 512
+
+# Provider name used for Google Maps results in the persistent cache
+GOOGLE_PROVIDER = "google"
+
+# Straight-line metrics used for offline estimates
+HAVERSINE = "haversine"
+EQUIRECTANGULAR = "equirectangular"
+
+Coordinates = Union[Sequence[Tuple[float, float]], np.ndarray]
+
 
 class DistanceCalculator:
     """Handles distance calculations between geographic points."""
     
-    def __init__(self, google_maps_api_key: Optional[str] = None):
+    def __init__(self,
+                 google_maps_api_key: Optional[str] = None,
+                 persistent_cache: Optional[PersistentDistanceCache] = None,
+                 cache_max_size: Optional[int] = 50000,
+                 cache_ttl_seconds: Optional[float] = 24 * 3600,
+                 matrix_client: Optional[DistanceMatrixClient] = None,
+                 road_network: Optional[RoadNetworkProvider] = None,
+                 snapper: Optional[CoordinateSnapper] = None,
+                 travel_time_model: Optional[TravelTimeModel] = None,
+                 metric: str = HAVERSINE,
+                 metric_error_budget: float = EQUIRECTANGULAR_ERROR_BUDGET):
         """
         Initialize distance calculator.
         
         Args:
             google_maps_api_key: Optional API key for Google Maps Distance Matrix API
+            persistent_cache: Optional on-disk cache shared across processes and runs,
+                consulted before any paid API lookup
+            cache_max_size: Maximum entries kept in the in-memory road distance cache
+                (None for unbounded)
+            cache_ttl_seconds: Lifetime of an in-memory road distance (None to never expire)
+            matrix_client: Distance Matrix client to use; by default one is created
+                when an API key is given
+            road_network: Optional offline road graph used instead of the Haversine
+                estimate; any object with distance_matrix() and pair_distances()
+                returning NaN for unknown distances can be plugged in
+            snapper: Optional coordinate snapping applied to every cache key (in-memory
+                and persistent) so nearby jittered coordinates share entries; see
+                CoordinateSnapper for the resulting error bound
+            travel_time_model: Speed profile converting distances to travel times
+                (default: a constant 25 km/h)
+            metric: Straight-line metric behind offline estimates: 'haversine', or
+                'equirectangular' for a faster local flat-earth projection
+            metric_error_budget: Largest relative error against Haversine accepted
+                for the equirectangular metric; areas whose measured error exceeds
+                it fall back to Haversine
         """
         self.google_maps_api_key = google_maps_api_key
-        self._cache: Dict[Tuple[float, float, float, float], float] = {}
+        if matrix_client is None and google_maps_api_key:
+            matrix_client = DistanceMatrixClient(google_maps_api_key)
+        self.matrix_client = matrix_client
+        self.road_network = road_network
+        self.persistent_cache = persistent_cache
+        self.snapper = snapper
+        self.travel_time_model = travel_time_model or TravelTimeModel.constant()
+        if metric not in (HAVERSINE, EQUIRECTANGULAR):
+            raise ValueError(f"Unknown distance metric: {metric}")
+        self.metric = metric
+        self.metric_error_budget = metric_error_budget
+        self.metric_report: Optional[Dict[str, object]] = None
+        self._projection_box: Optional[Tuple[float, float, float, float]] = None
+        self._projection: Optional[EquirectangularProjection] = None
+        self._cache = LRUDistanceCache(cache_max_size, cache_ttl_seconds)
     
     @staticmethod
-    @lru_cache(maxsize=10000)
+    @lru_cache(maxsize=HAVERSINE_CACHE_SIZE)
     def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
         """
         Calculate the great circle distance between two points on Earth.
@@ -45,10 +117,155 @@ class DistanceCalculator:
         a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng/2)**2
         c = 2 * math.asin(math.sqrt(a))
         
-        # Radius of Earth in kilometers
-        r = 6371
+        return c * EARTH_RADIUS_KM
+    
+    @staticmethod
+    def haversine_matrix(origins: Coordinates,
+                         destinations: Optional[Coordinates] = None,
+                         chunk_size: int = MATRIX_CHUNK_SIZE,
+                         out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Calculate great circle distances between all origins and destinations at once.
+        
+        The matrix is filled tile by tile so temporary memory stays bounded by
+        chunk_size x chunk_size regardless of the matrix size. When destinations
+        is omitted (or is the same object as origins) only the upper triangle of
+        tiles is computed and mirrored.
+        
+        Args:
+            origins: Sequence or (n, 2) array of (lat, lng) pairs
+            destinations: Sequence or (m, 2) array of (lat, lng) pairs, defaults to origins
+            chunk_size: Edge length of the tiles computed in one vectorized step
+            out: Optional preallocated (n, m) array to fill (e.g. a float32 memory map)
+        
+        Returns:
+            (n, m) array of distances in kilometers (out when given)
+        """
+        symmetric = destinations is None or destinations is origins
+        
+        origin_rad = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+        dest_rad = origin_rad if symmetric else np.radians(
+            np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+        )
+        
+        n_origins, n_dests = len(origin_rad), len(dest_rad)
+        if out is not None and out.shape != (n_origins, n_dests):
+            raise ValueError(f"Output shape {out.shape} does not match ({n_origins}, {n_dests})")
+        result = np.empty((n_origins, n_dests), dtype=np.float64) if out is None else out
+        if n_origins == 0 or n_dests == 0:
+            return result
+        
+        lat1, lng1 = origin_rad[:, 0], origin_rad[:, 1]
+        lat2, lng2 = dest_rad[:, 0], dest_rad[:, 1]
+        cos_lat1 = np.cos(lat1)
+        cos_lat2 = cos_lat1 if symmetric else np.cos(lat2)
+        chunk_size = max(1, int(chunk_size))
+        
+        for row_start in range(0, n_origins, chunk_size):
+            row_end = min(row_start + chunk_size, n_origins)
+            col_from = row_start if symmetric else 0
+            
+            for col_start in range(col_from, n_dests, chunk_size):
+                col_end = min(col_start + chunk_size, n_dests)
+                
+                dlat = lat2[None, col_start:col_end] - lat1[row_start:row_end, None]
+                dlng = lng2[None, col_start:col_end] - lng1[row_start:row_end, None]
+                a = (np.sin(dlat / 2) ** 2 +
+                     cos_lat1[row_start:row_end, None] * cos_lat2[None, col_start:col_end] *
+                     np.sin(dlng / 2) ** 2)
+                block = 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0))) * EARTH_RADIUS_KM
+                
+                result[row_start:row_end, col_start:col_end] = block
+                if symmetric and col_start != row_start:
+                    result[col_start:col_end, row_start:row_end] = block.T
+        
+        return result
+    
+    @staticmethod
+    def haversine_pairs(origins: Coordinates, destinations: Coordinates) -> np.ndarray:
+        """
+        Calculate great circle distances between origins[i] and destinations[i].
+        
+        Args:
+            origins: Sequence or (n, 2) array of (lat, lng) pairs
+            destinations: Sequence or (n, 2) array of (lat, lng) pairs
+        
+        Returns:
+            (n,) array of distances in kilometers
+        """
+        origin_rad = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+        dest_rad = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+        
+        dlat = dest_rad[:, 0] - origin_rad[:, 0]
+        dlng = dest_rad[:, 1] - origin_rad[:, 1]
+        a = (np.sin(dlat / 2) ** 2 +
+             np.cos(origin_rad[:, 0]) * np.cos(dest_rad[:, 0]) * np.sin(dlng / 2) ** 2)
+        return 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0))) * EARTH_RADIUS_KM
+    
+    def planar_projection(self, *coordinate_sets: Coordinates) -> Optional[EquirectangularProjection]:
+        """
+        Return the equirectangular projection for an area, if the metric may use it.
+        
+        The error against Haversine is measured over the bounding box of the
+        given coordinates and recorded in metric_report; areas inside the last
+        measured one reuse its projection. None is returned when
+        the Haversine metric is configured or the measured error exceeds
+        metric_error_budget (the equirectangular mode switches itself off).
         
-        return c * r
+        Args:
+            coordinate_sets: Coordinates covered by the computation
+        
+        Returns:
+            Projection to use, or None for Haversine
+        """
+        if self.metric != EQUIRECTANGULAR:
+            return None
+        box = EquirectangularProjection.bounding_box(*coordinate_sets)
+        if box is None:
+            return None
+        if self._projection_box is not None and EquirectangularProjection.contains(self._projection_box, box):
+            # Inside the last measured area the same projection (and bound) holds,
+            # which keeps distances of one run consistent across calls
+            return self._projection
+        
+        projection = EquirectangularProjection.for_box(box)
+        report = projection.error_report(box, self.metric_error_budget)
+        report['metric'] = EQUIRECTANGULAR if report['within_budget'] else HAVERSINE
+        if not report['within_budget']:
+            print(f"⚠️  Equirectangular error {report['max_relative_error']:.3%} exceeds the "
+                  f"{self.metric_error_budget:.3%} budget for this area. Using Haversine.")
+            projection = None
+        
+        self.metric_report = report
+        self._projection_box, self._projection = box, projection
+        return projection
+    
+    def straight_line_matrix(self,
+                             origins: Coordinates,
+                             destinations: Optional[Coordinates] = None,
+                             out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Great circle distances between all origins and destinations in the configured metric.
+        
+        Args:
+            origins: Sequence or (n, 2) array of (lat, lng) pairs
+            destinations: Sequence or (m, 2) array of (lat, lng) pairs, defaults to origins
+            out: Optional preallocated (n, m) array to fill
+        
+        Returns:
+            (n, m) array of distances in kilometers (out when given)
+        """
+        projection = self.planar_projection(origins, destinations)
+        if projection is not None:
+            return projection.distance_matrix(origins, destinations, out=out)
+        return self.haversine_matrix(origins, destinations, out=out)
+    
+    def straight_line_pairs(self, origins: Coordinates, destinations: Coordinates) -> np.ndarray:
+        """Great circle distances between origins[i] and destinations[i] in the configured metric."""
+        projection = self.planar_projection(origins, destinations)
+        if projection is not None:
+            return projection.pair_distances(origins, destinations)
+        return self.haversine_pairs(origins, destinations)
     
     def road_distance(self, lat1: float, lng1: float, lat2: float, lng2: float) -> float:
         """
@@ -62,50 +279,152 @@ class DistanceCalculator:
         Returns:
             Distance in kilometers
         """
-        # Check cache first
-        cache_key = (lat1, lng1, lat2, lng2)
-        if cache_key in self._cache:
-            return self._cache[cache_key]
+        return self.road_distances([(lat1, lng1, lat2, lng2)])[0]
+    
+    def road_distances(self, pairs: List[Tuple[float, float, float, float]]) -> List[float]:
+        """
+        Calculate road distances for independent origin-destination pairs.
         
-        if not self.google_maps_api_key:
-            # Fallback to Haversine distance with road factor
-            distance = self.haversine_distance(lat1, lng1, lat2, lng2) * 1.3  # Road factor
-            self._cache[cache_key] = distance
-            return distance
+        Pairs missing from the in-memory and persistent caches are requested
+        from the API concurrently; failed pairs fall back to Haversine. While
+        the API's circuit breaker is open no requests are sent at all. Pairs
+        whose snapped cache keys coincide are resolved only once.
         
-        try:
-            # Google Maps Distance Matrix API call
-            url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-            params = {
-                'origins': f"{lat1},{lng1}",
-                'destinations': f"{lat2},{lng2}",
-                'units': 'metric',
-                'mode': 'driving',
-                'key': self.google_maps_api_key
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
+        Args:
+            pairs: List of (lat1, lng1, lat2, lng2) tuples
+        
+        Returns:
+            Distance in kilometers per pair
+        """
+        keys = self.cache_keys(pairs)
+        first_index: Dict[Tuple[float, float, float, float], int] = {}
+        for i, key in enumerate(keys):
+            first_index.setdefault(key, i)
+        
+        unique = list(first_index.values())
+        distances = self._resolve_road_distances([pairs[i] for i in unique], [keys[i] for i in unique])
+        by_key = dict(zip((keys[i] for i in unique), distances))
+        return [by_key[key] for key in keys]
+    
+    def _resolve_road_distances(self,
+                                pairs: List[Tuple[float, float, float, float]],
+                                keys: List[Tuple[float, float, float, float]]) -> List[float]:
+        """Look up or compute distances for pairs with distinct cache keys."""
+        results: List[Optional[float]] = [self._cache.get(key) for key in keys]
+        missing = [i for i, distance in enumerate(results) if distance is None]
+        
+        if missing and self.matrix_client is not None:
+            if self.persistent_cache is not None:
+                cached = self.persistent_cache.get_many(GOOGLE_PROVIDER, [keys[i] for i in missing])
+                for position, distance in cached.items():
+                    results[missing[position]] = distance
+                    self._cache.set(keys[missing[position]], distance)
+                missing = [i for i in missing if results[i] is None]
             
-            if (data['status'] == 'OK' and 
-                data['rows'][0]['elements'][0]['status'] == 'OK'):
+            if missing and self.matrix_client.circuit_breaker.is_open():
+                print(f"Google Maps circuit breaker open. Using fallback distances for "
+                      f"{len(missing)} pairs.")
+            elif missing:
+                fetched = self.matrix_client.distances([pairs[i] for i in missing])
+                new_entries = []
+                for i, distance in zip(missing, fetched):
+                    if distance is not None:
+                        results[i] = distance
+                        self._cache.set(keys[i], distance)
+                        new_entries.append((keys[i], distance))
                 
-                # Extract distance in kilometers
-                distance_meters = data['rows'][0]['elements'][0]['distance']['value']
-                distance = distance_meters / 1000.0
-                
-                self._cache[cache_key] = distance
-                return distance
-            
-        except (requests.RequestException, KeyError, ValueError) as e:
-            print(f"Google Maps API error: {e}. Falling back to Haversine.")
+                if self.persistent_cache is not None:
+                    self.persistent_cache.set_many(GOOGLE_PROVIDER, new_entries)
+                if len(new_entries) < len(missing):
+                    print(f"Google Maps API failed for {len(missing) - len(new_entries)} pairs. "
+                          f"Falling back to Haversine.")
         
-        # Fallback to Haversine with road factor
-        distance = self.haversine_distance(lat1, lng1, lat2, lng2) * 1.3
-        self._cache[cache_key] = distance
-        return distance
+        missing = [i for i, distance in enumerate(results) if distance is None]
+        if missing and self.road_network is not None:
+            network_distances = self.road_network.pair_distances([pairs[i] for i in missing])
+            for i, distance in zip(missing, network_distances):
+                if not np.isnan(distance):
+                    results[i] = float(distance)
+                    self._cache.set(keys[i], results[i])
+        
+        # Fallback to Haversine distance with road factor
+        for i, distance in enumerate(results):
+            if distance is None:
+                distance = self.haversine_distance(*pairs[i]) * ROAD_FACTOR
+                results[i] = distance
+                self._cache.set(keys[i], distance)
+        
+        return results
+    
+    def cache_keys(self, pairs: Sequence[Tuple[float, float, float, float]]) -> List[Tuple[float, float, float, float]]:
+        """
+        Return the cache key of every coordinate pair.
+        
+        Args:
+            pairs: Sequence of (lat1, lng1, lat2, lng2) tuples
+        
+        Returns:
+            Snapped pairs when a coordinate snapper is configured, else the pairs themselves
+        """
+        if self.snapper is None:
+            return [tuple(pair) for pair in pairs]
+        return self.snapper.snap_pairs(pairs)
+    
+    def _point_keys(self, points: Sequence[Tuple[float, float]]) -> List[Tuple[float, float]]:
+        """Return the (optionally snapped) cache key part of every point."""
+        if self.snapper is None:
+            return [tuple(point) for point in points]
+        return [tuple(point) for point in self.snapper.snap_array(np.asarray(points)).tolist()]
+    
+    @classmethod
+    def configure_haversine_cache(cls, maxsize: Optional[int] = HAVERSINE_CACHE_SIZE) -> None:
+        """
+        Rebuild the memoization of haversine_distance with a new size bound.
+        
+        The cache is shared by all calculators in the process. Haversine results
+        never go stale, so unlike road distances they need no TTL.
+        
+        Args:
+            maxsize: Maximum number of memoized results (None for unbounded, 0 to disable)
+        """
+        original = cls.haversine_distance.__wrapped__
+        cls.haversine_distance = staticmethod(lru_cache(maxsize=maxsize)(original))
+    
+    def cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Return runtime statistics of the in-memory distance caches.
+        
+        Returns:
+            Dictionary with 'road_distance' and 'haversine' cache statistics
+        """
+        info = self.haversine_distance.cache_info()
+        lookups = info.hits + info.misses
+        
+        return {
+            'road_distance': self._cache.stats(),
+            'haversine': {
+                'size': info.currsize,
+                'max_size': info.maxsize,
+                'ttl_seconds': None,
+                'hits': info.hits,
+                'misses': info.misses,
+                # Every miss inserts one entry, so anything no longer held was evicted
+                'evictions': max(0, info.misses - info.currsize) if info.maxsize else 0,
+                'expirations': 0,
+                'hit_rate': info.hits / lookups if lookups else 0.0,
+            }
+        }
+    
+    def api_circuit_stats(self) -> Optional[Dict[str, object]]:
+        """
+        Return the state of the Google Maps circuit breaker for monitoring.
+        
+        Returns:
+            CircuitBreaker.stats() of the API client, or None without an API client
+        """
+        if self.matrix_client is None:
+            return None
+        return self.matrix_client.circuit_breaker.stats()
     
     def batch_distances(self, 
                        origins: List[Tuple[float, float]], 
@@ -120,82 +439,237 @@ class DistanceCalculator:
         Returns:
             2D matrix where result[i][j] is distance from origins[i] to destinations[j]
         """
-        if not self.google_maps_api_key or len(origins) * len(destinations) > 100:
-            # Use Haversine for large batches or when no API key
-            return self._batch_haversine(origins, destinations)
+        return self.batch_distance_matrix(origins, destinations).tolist()
+    
+    def batch_distance_matrix(self,
+                              origins: List[Tuple[float, float]],
+                              destinations: List[Tuple[float, float]]) -> np.ndarray:
+        """
+        Calculate distances between multiple origins and destinations as an array.
+        
+        Same semantics as batch_distances but without converting the result to
+        nested lists, so solvers can index the matrix directly.
+        
+        Args:
+            origins: List of (lat, lng) tuples for origin points
+            destinations: List of (lat, lng) tuples for destination points
+        
+        Returns:
+            (len(origins), len(destinations)) array of distances in kilometers
+        """
+        if self.matrix_client is None:
+            return self.offline_distance_matrix(origins, destinations)
         
         try:
             return self._batch_google_maps(origins, destinations)
         except Exception as e:
-            print(f"Batch Google Maps API error: {e}. Falling back to Haversine.")
-            return self._batch_haversine(origins, destinations)
+            # Failed tiles already fall back per element; this only guards
+            # against errors in the caching and stitching around them
+            print(f"Batch Google Maps API error: {e}. Falling back to offline distances.")
+            return self.offline_distance_matrix(origins, destinations)
     
-    def _batch_haversine(self, 
-                        origins: List[Tuple[float, float]], 
+    def offline_distance_matrix(self,
+                                origins: Coordinates,
+                                destinations: Optional[Coordinates] = None,
+                                out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Estimate road distances between all origins and destinations without any API calls.
+        
+        Uses the local road network when one is configured and the Haversine
+        distance with road factor for everything else.
+        
+        Args:
+            origins: Sequence or (n, 2) array of (lat, lng) pairs
+            destinations: Sequence or (m, 2) array of (lat, lng) pairs, defaults to origins
+            out: Optional preallocated (n, m) array to fill (e.g. DistanceMatrix.data)
+        
+        Returns:
+            (n, m) array of distances in kilometers (out when given)
+        """
+        if self.road_network is not None:
+            matrix = self.road_network.distance_matrix(origins, destinations)
+            unknown = np.isnan(matrix)
+            if unknown.any():
+                matrix[unknown] = (self.straight_line_matrix(origins, destinations) * ROAD_FACTOR)[unknown]
+            if out is None:
+                return matrix
+            out[...] = matrix
+            return out
+        
+        matrix = self.straight_line_matrix(origins, destinations, out=out)
+        matrix *= ROAD_FACTOR
+        return matrix
+    
+    @property
+    def offline_metric_id(self) -> str:
+        """
+        Return an identifier of the configured offline metric.
+        
+        Independent of any area, so equirectangular distances are not fully
+        described by it; use area_metric_id to key distances of an area.
+        """
+        if self.road_network is None:
+            return f"{self.metric}:{ROAD_FACTOR}"
+        fingerprint = getattr(self.road_network, 'fingerprint', None) or type(self.road_network).__name__
+        return f"{getattr(self.road_network, 'name', 'road_network')}:{fingerprint}"
+    
+    def area_metric_id(self, *coordinate_sets: Coordinates) -> str:
+        """
+        Return an identifier of the offline metric used within an area, for keying stored matrices.
+        
+        Equirectangular distances depend on the projection the area gets (or
+        on its Haversine fallback), so its reference latitude is part of the
+        identifier; for other metrics this is offline_metric_id.
+        
+        Args:
+            coordinate_sets: Coordinates the distances are computed between
+        
+        Returns:
+            Metric identifier
+        """
+        if self.metric != EQUIRECTANGULAR:
+            return self.offline_metric_id
+        projection = self.planar_projection(*coordinate_sets)
+        reference = f"ref_lat={projection.ref_lat!r}" if projection is not None else f"{HAVERSINE}-fallback"
+        return f"{self.offline_metric_id}({reference})"
+    
+    def offline_pair_distances(self, origins: Coordinates, destinations: Coordinates) -> np.ndarray:
+        """
+        Estimate road distances between origins[i] and destinations[i] without API calls.
+        
+        Elementwise counterpart of offline_distance_matrix; memory is linear in
+        the number of pairs.
+        
+        Args:
+            origins: Sequence or (n, 2) array of (lat, lng) pairs
+            destinations: Sequence or (n, 2) array of (lat, lng) pairs
+        
+        Returns:
+            (n,) array of distances in kilometers
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+        
+        if self.road_network is not None:
+            distances = self.road_network.pair_distances(np.hstack((origins, destinations)))
+            unknown = np.isnan(distances)
+            if unknown.any():
+                distances[unknown] = self.straight_line_pairs(origins[unknown], destinations[unknown]) * ROAD_FACTOR
+            return distances
+        
+        return self.straight_line_pairs(origins, destinations) * ROAD_FACTOR
+    
+    def _batch_haversine(self,
+                        origins: List[Tuple[float, float]],
                         destinations: List[Tuple[float, float]]) -> List[List[float]]:
         """Calculate batch distances using Haversine formula."""
-        result = []
-        for origin_lat, origin_lng in origins:
-            row = []
-            for dest_lat, dest_lng in destinations:
-                distance = self.haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng) * 1.3
-                row.append(distance)
-            result.append(row)
-        return result
+        return self.offline_distance_matrix(origins, destinations).tolist()
     
     def _batch_google_maps(self, 
                           origins: List[Tuple[float, float]], 
-                          destinations: List[Tuple[float, float]]) -> List[List[float]]:
-        """Calculate batch distances using Google Maps Distance Matrix API."""
-        # Format origins and destinations for API
-        origins_str = "|".join([f"{lat},{lng}" for lat, lng in origins])
-        destinations_str = "|".join([f"{lat},{lng}" for lat, lng in destinations])
-        
-        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-        params = {
-            'origins': origins_str,
-            'destinations': destinations_str,
-            'units': 'metric',
-            'mode': 'driving',
-            'key': self.google_maps_api_key
-        }
+                          destinations: List[Tuple[float, float]]) -> np.ndarray:
+        """
+        Calculate batch distances using Google Maps Distance Matrix API.
         
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if data['status'] != 'OK':
-            raise ValueError(f"Google Maps API returned status: {data['status']}")
-        
-        # Parse response into distance matrix
-        result = []
-        for i, row in enumerate(data['rows']):
-            distance_row = []
-            for j, element in enumerate(row['elements']):
-                if element['status'] == 'OK':
-                    distance_meters = element['distance']['value']
-                    distance = distance_meters / 1000.0
-                else:
-                    # Fallback to Haversine for failed elements
-                    origin_lat, origin_lng = origins[i]
-                    dest_lat, dest_lng = destinations[j]
-                    distance = self.haversine_distance(origin_lat, origin_lng, dest_lat, dest_lng) * 1.3
-                
-                distance_row.append(distance)
-            result.append(distance_row)
+        Pairs found in the in-memory or persistent cache are not requested
+        again; only the rows and columns that still contain misses are sent
+        to the API, tiled into API-legal blocks, and origins or destinations
+        sharing a snapped key are requested once. Elements that fail, or that
+        are skipped while the circuit breaker is open, fall back to the
+        offline estimate.
+        """
+        origins = [tuple(origin) for origin in origins]
+        destinations = [tuple(destination) for destination in destinations]
+        origin_keys = self._point_keys(origins)
+        dest_keys = self._point_keys(destinations)
+        result = np.full((len(origins), len(destinations)), np.nan, dtype=np.float64)
+        
+        keys = [(*origin, *destination) for origin in origin_keys for destination in dest_keys]
+        for index, key in enumerate(keys):
+            distance = self._cache.get(key)
+            if distance is not None:
+                result.flat[index] = distance
+        
+        if self.persistent_cache is not None:
+            uncached = np.flatnonzero(np.isnan(result.ravel()))
+            stored = self.persistent_cache.get_many(GOOGLE_PROVIDER, [keys[i] for i in uncached])
+            for position, distance in stored.items():
+                result.flat[uncached[position]] = distance
+                self._cache.set(keys[uncached[position]], distance)
+        
+        missing = np.isnan(result)
+        missing_rows = np.flatnonzero(missing.any(axis=1))
+        missing_cols = np.flatnonzero(missing[missing_rows].any(axis=0))
+        
+        if len(missing_rows) and self.matrix_client.circuit_breaker.is_open():
+            print("Google Maps circuit breaker open. Using fallback distances.")
+            missing_rows = missing_rows[:0]
+        
+        if len(missing_rows):
+            # One API row (column) per distinct snapped origin (destination)
+            row_slot: Dict[Tuple[float, float], int] = {}
+            request_rows = []
+            for i in missing_rows:
+                if origin_keys[i] not in row_slot:
+                    row_slot[origin_keys[i]] = len(request_rows)
+                    request_rows.append(i)
+            col_slot: Dict[Tuple[float, float], int] = {}
+            request_cols = []
+            for j in missing_cols:
+                if dest_keys[j] not in col_slot:
+                    col_slot[dest_keys[j]] = len(request_cols)
+                    request_cols.append(j)
+            
+            fetched = self.matrix_client.distance_matrix(
+                [origins[i] for i in request_rows],
+                [destinations[j] for j in request_cols]
+            )
+            row_map = np.array([row_slot[origin_keys[i]] for i in missing_rows], dtype=np.intp)
+            col_map = np.array([col_slot[dest_keys[j]] for j in missing_cols], dtype=np.intp)
+            
+            block = np.ix_(missing_rows, missing_cols)
+            result[block] = np.where(np.isnan(result[block]), fetched[np.ix_(row_map, col_map)], result[block])
+            
+            new_entries = [
+                ((*origin_keys[request_rows[r]], *dest_keys[request_cols[c]]), float(fetched[r, c]))
+                for r, c in zip(*np.nonzero(~np.isnan(fetched)))
+            ]
+            for key, distance in new_entries:
+                self._cache.set(key, distance)
+            if self.persistent_cache is not None:
+                self.persistent_cache.set_many(GOOGLE_PROVIDER, new_entries)
+        
+        # Offline estimate for failed elements
+        failed = np.isnan(result)
+        if failed.any():
+            print(f"Google Maps API returned no distance for {int(failed.sum())} elements. "
+                  f"Falling back to offline distances.")
+            failed_rows = np.flatnonzero(failed.any(axis=1))
+            failed_cols = np.flatnonzero(failed[failed_rows].any(axis=0))
+            block = np.ix_(failed_rows, failed_cols)
+            fallback = self.offline_distance_matrix(
+                [origins[i] for i in failed_rows], [destinations[j] for j in failed_cols]
+            )
+            result[block] = np.where(np.isnan(result[block]), fallback, result[block])
         
         return result
     
-    def estimate_travel_time(self, distance_km: float, avg_speed_kmh: float = 25.0) -> float:
+    def estimate_travel_time(self,
+                             distance_km: float,
+                             avg_speed_kmh: Optional[float] = None,
+                             hour: Optional[float] = None) -> float:
         """
         Estimate travel time based on distance and average speed.
         
         Args:
             distance_km: Distance in kilometers
-            avg_speed_kmh: Average speed in km/h (default 25 km/h for city driving)
+            avg_speed_kmh: Average speed in km/h; when omitted the travel-time
+                model's speed for the leg's road class and hour is used
+            hour: Departure hour for the travel-time model
             
         Returns:
             Travel time in minutes
         """
-        return (distance_km / avg_speed_kmh) * 60.0
+        if avg_speed_kmh is not None:
+            return (distance_km / avg_speed_kmh) * 60.0
+        return float(self.travel_time_model.travel_times(distance_km, self.travel_time_model.resolve_hour(hour)))
@@ -0,0 +1,359 @@
+"""
+Shared distance matrix for a single optimization run.
+Distances between every depot and pickup point are computed once and each
+cluster solver reads them through a lightweight index view.
+"""
+
+import hashlib
+import os
+import numpy as np
+from typing import List, Dict, Optional, Sequence
+
+from .models import PickupPoint, Driver
+from .distance_calculator import DistanceCalculator
+from .distance_matrix import DistanceMatrix
+from .sparse_distance import SparseDistanceGraph, SPARSE_NEIGHBORS
+from .driver_registry import DriverRegistry
+
+# Runs with more locations than this keep a sparse k-nearest-neighbor graph
+# instead of the dense matrix (4000^2 float32 distances are already 64 MB)
+SPARSE_MATRIX_MIN_LOCATIONS = 4000
+
+
+class DistanceContext:
+    """Indexed distance matrix covering every depot and pickup point of a run."""
+    
+    def __init__(self,
+                 distance_calculator: DistanceCalculator,
+                 drivers: List[Driver],
+                 pickup_points: List[PickupPoint],
+                 sparse_threshold: Optional[int] = SPARSE_MATRIX_MIN_LOCATIONS,
+                 neighbors: int = SPARSE_NEIGHBORS,
+                 matrix_dir: Optional[str] = None,
+                 departure_hour: Optional[float] = None,
+                 driver_registry: Optional[DriverRegistry] = None):
+        """
+        Build the shared distance matrix.
+        
+        Depots occupy the first len(drivers) rows, pickup points follow in
+        input order. Above sparse_threshold locations only a k-nearest-neighbor
+        graph (plus all depot distances) is stored; matrix is then None and
+        distances are read through lookup().
+        
+        Args:
+            distance_calculator: Distance calculation utility
+            drivers: Drivers whose base locations act as depots
+            pickup_points: All pickup points of the run
+            sparse_threshold: Location count above which the sparse graph is used
+                (None to always keep the dense matrix)
+            neighbors: Nearest neighbors kept per location in sparse mode
+            matrix_dir: Optional directory of memory-mapped dense matrices; a run
+                with the same locations and metric reopens its matrix from there
+                instead of recomputing it
+            departure_hour: Clock hour at which routes start, used to turn
+                distances into travel times (default: the travel-time model's
+                default hour, else the current time)
+            driver_registry: Optional registry of warm depot distances; depot rows
+                and columns are read from it instead of being recomputed
+        """
+        self.distance_calculator = distance_calculator
+        self.travel_time_model = distance_calculator.travel_time_model
+        self.departure_hour = self.travel_time_model.resolve_hour(departure_hour)
+        self._time_matrices: Dict[int, np.ndarray] = {}
+        
+        self._driver_index: Dict[str, int] = {
+            driver.driver_id: i for i, driver in enumerate(drivers)
+        }
+        self._pickup_index: Dict[str, int] = {
+            point.pickup_id: len(drivers) + i for i, point in enumerate(pickup_points)
+        }
+        
+        locations = [(driver.base_lat, driver.base_lng) for driver in drivers]
+        locations.extend((point.lat, point.lng) for point in pickup_points)
+        
+        self.locations = np.array(locations, dtype=np.float64).reshape(-1, 2)
+        self.n_depots = len(drivers)
+        
+        depot_distances = (
+            driver_registry.depot_distances(distance_calculator, drivers, pickup_points)
+            if driver_registry is not None else None
+        )
+        
+        self.matrix: Optional[DistanceMatrix] = None
+        self.graph: Optional[SparseDistanceGraph] = None
+        if sparse_threshold is not None and len(self.locations) > sparse_threshold:
+            self.graph = SparseDistanceGraph(distance_calculator, self.locations, len(drivers), neighbors,
+                                             depot_distances=depot_distances)
+        else:
+            self.matrix = self._dense_matrix(distance_calculator, matrix_dir, depot_distances)
+        
+        # Road API distances are paid per element, so only the legs of the
+        # final routes are refined through it instead of the full matrix
+        self.refine_legs_with_api = distance_calculator.matrix_client is not None
+    
+    def _dense_matrix(self,
+                      distance_calculator: DistanceCalculator,
+                      matrix_dir: Optional[str],
+                      depot_distances=None) -> DistanceMatrix:
+        """Compute the dense matrix, or reopen it from matrix_dir when stored earlier."""
+        shape = (len(self.locations), len(self.locations))
+        if matrix_dir is None:
+            matrix = DistanceMatrix.empty(shape)
+            self._fill_matrix(distance_calculator, matrix.data, depot_distances)
+            return matrix
+        
+        digest = hashlib.sha1(self.locations.tobytes())
+        digest.update(distance_calculator.area_metric_id(self.locations).encode())
+        path = os.path.join(matrix_dir, f"distances-{digest.hexdigest()}.npy")
+        
+        if os.path.exists(path):
+            try:
+                matrix = DistanceMatrix.open(path)
+                if matrix.shape == shape:
+                    return matrix
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Could not open stored distance matrix {path}: {e}. Recomputing.")
+        
+        try:
+            matrix = DistanceMatrix.create(path, shape)
+            self._fill_matrix(distance_calculator, matrix.data, depot_distances)
+            return matrix.commit()
+        except OSError as e:
+            print(f"⚠️  Could not store distance matrix in {matrix_dir}: {e}. Keeping it in memory.")
+            matrix = DistanceMatrix.empty(shape)
+            self._fill_matrix(distance_calculator, matrix.data, depot_distances)
+            return matrix
+    
+    def _fill_matrix(self, distance_calculator: DistanceCalculator, data: np.ndarray, depot_distances) -> None:
+        """Fill data with all distances, taking depot rows and columns from depot_distances when given."""
+        if depot_distances is None:
+            distance_calculator.offline_distance_matrix(self.locations, out=data)
+            return
+        
+        d = self.n_depots
+        outbound, inbound = depot_distances
+        distance_calculator.offline_distance_matrix(self.locations[:d], out=data[:d, :d])
+        distance_calculator.offline_distance_matrix(self.locations[d:], out=data[d:, d:])
+        data[:d, d:] = outbound
+        data[d:, :d] = inbound
+    
+    @property
+    def size(self) -> int:
+        """Return number of indexed locations."""
+        return len(self.locations)
+    
+    @property
+    def sparse(self) -> bool:
+        """Return True when distances are held in the sparse neighbor graph."""
+        return self.graph is not None
+    
+    @property
+    def nbytes(self) -> int:
+        """Return memory held by the stored distances."""
+        return self.graph.nbytes if self.sparse else self.matrix.nbytes
+    
+    def lookup(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Return distances for (rows[i], cols[i]) global index pairs.
+        
+        Args:
+            rows: Origin matrix indices
+            cols: Destination matrix indices (same shape as rows)
+        
+        Returns:
+            Distances in kilometers, shaped like rows
+        """
+        if not self.sparse:
+            return self.matrix[rows, cols]
+        rows = np.asarray(rows, dtype=np.intp)
+        return self.graph.lookup(rows, cols).reshape(rows.shape)
+    
+    def time_matrix(self, hour: Optional[float] = None) -> np.ndarray:
+        """
+        Return travel times in minutes between all locations for one departure hour.
+        
+        The whole matrix is converted in one vectorized pass and kept per hour
+        of day. Only available with the dense matrix; in sparse mode times are
+        derived from looked-up distances (see ClusterDistanceView.to_time_array).
+        
+        Args:
+            hour: Departure hour (default: the run's departure hour)
+        
+        Returns:
+            (n, n) float32 array of minutes
+        """
+        if self.sparse:
+            raise ValueError("Time matrices need the dense distance matrix")
+        
+        hour = self.departure_hour if hour is None else hour
+        key = int(np.floor(hour)) % 24
+        if key not in self._time_matrices:
+            self._time_matrices[key] = self.travel_time_model.time_matrix(self.matrix.data, key)
+        return self._time_matrices[key]
+    
+    def driver_index(self, driver: Driver) -> int:
+        """Return matrix index of a driver's depot."""
+        return self._driver_index[driver.driver_id]
+    
+    def pickup_index(self, point: PickupPoint) -> int:
+        """Return matrix index of a pickup point."""
+        return self._pickup_index[point.pickup_id]
+    
+    def cluster_view(self,
+                     driver: Driver,
+                     pickup_points: List[PickupPoint]) -> "ClusterDistanceView":
+        """
+        Create a view over the shared matrix for one driver's cluster.
+        
+        Args:
+            driver: Driver assigned to the cluster
+            pickup_points: Pickup points of the cluster
+        
+        Returns:
+            View where local index 0 is the depot and local index i + 1 is pickup_points[i]
+        """
+        nodes = [self.driver_index(driver)]
+        nodes.extend(self.pickup_index(point) for point in pickup_points)
+        return ClusterDistanceView(self, np.array(nodes, dtype=np.intp))
+    
+    @classmethod
+    def from_matrix(cls,
+                    distance_calculator: DistanceCalculator,
+                    locations: np.ndarray,
+                    distances: np.ndarray,
+                    n_depots: int = 1,
+                    departure_hour: Optional[float] = None) -> "DistanceContext":
+        """
+        Wrap distances that were computed elsewhere, without recomputing them.
+        
+        Used by worker processes, which receive a cluster's block of the run's
+        matrix instead of the whole context.
+        
+        Args:
+            distance_calculator: Distance calculation utility (its travel-time
+                model times the legs)
+            locations: (n, 2) array of (lat, lng), depots first
+            distances: (n, n) distances in kilometers between locations
+            n_depots: Number of depot locations at the start of locations
+            departure_hour: Clock hour at which routes start
+        
+        Returns:
+            Dense context over the given locations; its pickup and driver
+            indices are empty, so views are built from local indices directly
+        """
+        context = cls.__new__(cls)
+        context.distance_calculator = distance_calculator
+        context.travel_time_model = distance_calculator.travel_time_model
+        context.departure_hour = context.travel_time_model.resolve_hour(departure_hour)
+        context._time_matrices = {}
+        context._driver_index = {}
+        context._pickup_index = {}
+        context.locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        context.n_depots = n_depots
+        context.matrix = DistanceMatrix(np.asarray(distances))
+        context.graph = None
+        context.refine_legs_with_api = False
+        return context
+    
+    @classmethod
+    def for_cluster(cls,
+                    distance_calculator: DistanceCalculator,
+                    driver: Driver,
+                    pickup_points: List[PickupPoint]) -> "ClusterDistanceView":
+        """Build a standalone context for a single cluster and return its view."""
+        context = cls(distance_calculator, [driver], pickup_points)
+        return context.cluster_view(driver, pickup_points)
+
+
+class ClusterDistanceView:
+    """
+    Distances for one cluster, looked up in the shared matrix.
+    
+    The view only stores the global indices of its locations; no distances
+    are copied until to_array is called.
+    """
+    
+    def __init__(self, context: DistanceContext, nodes: np.ndarray):
+        """
+        Initialize cluster view.
+        
+        Args:
+            context: Context owning the shared matrix
+            nodes: Global matrix index for every local index
+        """
+        self.context = context
+        self.nodes = nodes
+    
+    def __len__(self) -> int:
+        return len(self.nodes)
+    
+    def location(self, i: int) -> np.ndarray:
+        """Return (lat, lng) of local index i."""
+        return self.context.locations[self.nodes[i]]
+    
+    def distance(self, i: int, j: int) -> float:
+        """Return distance in kilometers between local indices i and j."""
+        if not self.context.sparse:
+            return float(self.context.matrix[self.nodes[i], self.nodes[j]])
+        return float(self.context.lookup(self.nodes[[i]], self.nodes[[j]])[0])
+    
+    def distances_from(self, i: int, targets: Sequence[int]) -> np.ndarray:
+        """Return distances from local index i to every local index in targets."""
+        cols = self.nodes[np.asarray(targets, dtype=np.intp)]
+        if not self.context.sparse:
+            return self.context.matrix[self.nodes[i], cols]
+        return self.context.lookup(np.full(len(cols), self.nodes[i], dtype=np.intp), cols)
+    
+    def route_legs(self, order: Sequence[int]) -> List[float]:
+        """
+        Return the driving distance of every leg of a route starting at the depot.
+        
+        When the road API is configured all legs are requested in one batch.
+        
+        Args:
+            order: Local indices of the visited locations, excluding the depot
+        
+        Returns:
+            Distance in kilometers from the previous location to each entry of order
+        """
+        path = np.concatenate(([0], np.asarray(order, dtype=np.intp)))
+        if not self.context.refine_legs_with_api:
+            return self.context.lookup(self.nodes[path[:-1]], self.nodes[path[1:]]).tolist()
+        
+        starts = self.context.locations[self.nodes[path[:-1]]]
+        ends = self.context.locations[self.nodes[path[1:]]]
+        pairs = [(float(a[0]), float(a[1]), float(b[0]), float(b[1])) for a, b in zip(starts, ends)]
+        return self.context.distance_calculator.road_distances(pairs)
+    
+    def route_times(self, legs: Sequence[float]) -> List[float]:
+        """
+        Return the travel time of every leg of a route leaving the depot at the run's departure hour.
+        
+        Each leg is timed at the hour the vehicle reaches it, so a route that
+        runs into the rush hour slows down accordingly. Legs taken from the
+        matrix get exactly the entries of the time matrix for their hour.
+        
+        Args:
+            legs: Leg distances from route_legs
+        
+        Returns:
+            Minutes from the previous location to each stop
+        """
+        return self.context.travel_time_model.route_times(legs, self.context.departure_hour).tolist()
+    
+    def subview(self, local_indices: Sequence[int]) -> "ClusterDistanceView":
+        """Create a view over a subset or reordering of this view's locations."""
+        return ClusterDistanceView(self.context, self.nodes[np.asarray(local_indices, dtype=np.intp)])
+    
+    def to_array(self) -> np.ndarray:
+        """Return a dense copy of the cluster's distance matrix."""
+        if not self.context.sparse:
+            return self.context.matrix[np.ix_(self.nodes, self.nodes)]
+        return self.context.graph.submatrix(self.nodes)
+    
+    def to_time_array(self, hour: Optional[float] = None) -> np.ndarray:
+        """Return a dense copy of the cluster's travel-time matrix in minutes."""
+        if not self.context.sparse:
+            return self.context.time_matrix(hour)[np.ix_(self.nodes, self.nodes)]
+        hour = self.context.departure_hour if hour is None else hour
+        return self.context.travel_time_model.time_matrix(self.to_array(), hour)
@@ -0,0 +1,249 @@
+"""
+Driver registry with warm depot distance vectors.
+Driver bases rarely move, so depot-to-pickup distances are kept across
+requests and only extended for drivers and pickup locations not seen before.
+"""
+
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Collection, Dict, List, Tuple
+
+from .models import PickupPoint, Driver
+from .distance_calculator import DistanceCalculator
+from .distance_matrix import DISTANCE_DTYPE
+
+# Distances (driver rows x pickup location columns) kept before the known
+# locations are dropped: 4 bytes each per direction, so at most 64 MB
+DRIVER_REGISTRY_MAX_CELLS = 16_000_000
+
+# Drivers whose depot rows are kept, least recently used replaced first
+DRIVER_REGISTRY_MAX_DRIVERS = 1024
+
+
+class DriverRegistry:
+    """
+    Depot -> pickup and pickup -> depot distances for every known driver and pickup location.
+    
+    Distances live in (drivers x locations) float32 arrays whose capacity
+    doubles as they grow. A request only computes the rows of new or moved
+    drivers and the columns of new pickup locations; everything else is read
+    back. Values come from the offline metric of the calculator passed with
+    each call (the request's own), the same one the per-run distance matrix
+    uses; the registry itself holds no calculator, so shared instances never
+    carry one request's state into the next. Once max_drivers are known, a
+    new driver takes over the row of the least recently used one, and the
+    arrays never grow past max_cells distances: when a new driver or
+    location would need more, the known locations are dropped and the
+    request's own pickups are computed afresh.
+    """
+    
+    _instances: Dict[Tuple[int, str], "DriverRegistry"] = {}
+    _instances_lock = threading.Lock()
+    
+    def __init__(self,
+                 symmetric: bool = True,
+                 max_cells: int = DRIVER_REGISTRY_MAX_CELLS,
+                 max_drivers: int = DRIVER_REGISTRY_MAX_DRIVERS):
+        """
+        Initialize an empty registry.
+        
+        Args:
+            symmetric: Whether the offline metric is symmetric (no road network),
+                so one array serves both directions
+            max_cells: Distances (drivers x pickup locations) kept before the
+                known pickup locations are cleared
+            max_drivers: Drivers kept before the least recently used one is replaced
+        """
+        self.symmetric = symmetric
+        self.max_cells = max_cells
+        self.max_drivers = max_drivers
+        self._lock = threading.Lock()
+        
+        self._driver_rows: "OrderedDict[str, int]" = OrderedDict()
+        self._driver_coords = np.empty((0, 2), dtype=np.float64)
+        self._pickup_slots: Dict[Tuple[float, float], int] = {}
+        self._pickup_coords = np.empty((0, 2), dtype=np.float64)
+        self._outbound = np.empty((0, 0), dtype=DISTANCE_DTYPE)
+        self._inbound = self._outbound
+        
+        self.computed = 0
+        self.served = 0
+    
+    @classmethod
+    def shared(cls, distance_calculator: DistanceCalculator) -> "DriverRegistry":
+        """
+        Return the registry for a calculator's offline metric, one per process.
+        
+        Every request served by the process with the same metric reuses the
+        same registry, so its distances stay warm across requests. Requests
+        still pass their own calculator to every call.
+        
+        Args:
+            distance_calculator: Calculator of the current request
+        
+        Returns:
+            Shared registry instance
+        """
+        key = (os.getpid(), distance_calculator.offline_metric_id)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(symmetric=distance_calculator.road_network is None)
+            return cls._instances[key]
+    
+    @property
+    def n_drivers(self) -> int:
+        return len(self._driver_rows)
+    
+    @property
+    def n_pickups(self) -> int:
+        return len(self._pickup_slots)
+    
+    def depot_distances(self,
+                        distance_calculator: DistanceCalculator,
+                        drivers: List[Driver],
+                        pickup_points: List[PickupPoint]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return depot distances for the given drivers and pickup points.
+        
+        Args:
+            distance_calculator: Calculator of the current request; its offline
+                metric computes the distances not known yet
+            drivers: Drivers whose base locations act as depots
+            pickup_points: Pickup points of the request
+        
+        Returns:
+            (outbound, inbound): outbound[i, j] is the distance from drivers[i]'s
+            depot to pickup_points[j], inbound[j, i] the distance back
+        """
+        with self._lock:
+            rows = self._register_drivers(distance_calculator, drivers)
+            slots = self._register_pickups(distance_calculator, np.array([(p.lat, p.lng) for p in pickup_points],
+                                                                         dtype=np.float64).reshape(-1, 2))
+            self.served += len(rows) * len(slots)
+            
+            block = np.ix_(rows, slots)
+            outbound = self._outbound[block]
+            inbound = outbound.T.copy() if self.symmetric else self._inbound[block].T
+            return outbound, inbound
+    
+    def _register_drivers(self, distance_calculator: DistanceCalculator, drivers: List[Driver]) -> np.ndarray:
+        """Add new or moved drivers and return their rows."""
+        rows = []
+        changed = []
+        current = {driver.driver_id for driver in drivers}
+        for driver in drivers:
+            position = (driver.base_lat, driver.base_lng)
+            row = self._driver_rows.get(driver.driver_id)
+            if row is None:
+                row = self._free_row(current)
+                self._driver_rows[driver.driver_id] = row
+                self._driver_coords[row] = position
+                changed.append(row)
+            else:
+                self._driver_rows.move_to_end(driver.driver_id)
+                if tuple(self._driver_coords[row]) != position:
+                    # Moved base: its whole row is stale
+                    self._driver_coords[row] = position
+                    changed.append(row)
+            rows.append(row)
+        
+        if changed and len(self._pickup_coords):
+            self._fill(distance_calculator, np.array(changed), np.arange(len(self._pickup_coords)))
+        return np.array(rows, dtype=np.intp)
+    
+    def _free_row(self, current: Collection[str]) -> int:
+        """
+        Return a row for a new driver.
+        
+        Once max_drivers are known, the least recently used driver's row is
+        reused, unless that driver is part of the current request (a request
+        with more drivers than max_drivers grows the registry instead).
+        """
+        if len(self._driver_rows) >= self.max_drivers:
+            oldest = next(iter(self._driver_rows))
+            if oldest not in current:
+                return self._driver_rows.pop(oldest)
+        row = len(self._driver_coords)
+        if (row + 1) * len(self._pickup_coords) > self.max_cells:
+            # No room for another row: the request's pickups are registered afresh
+            self._forget_pickups()
+        self._grow(row + 1, len(self._pickup_coords))
+        self._driver_coords = np.vstack((self._driver_coords, np.zeros((1, 2))))
+        return row
+    
+    def _register_pickups(self, distance_calculator: DistanceCalculator, coords: np.ndarray) -> np.ndarray:
+        """Add unseen pickup locations and return their slots."""
+        keys = [tuple(c) for c in coords.tolist()]
+        new_keys = list(dict.fromkeys(key for key in keys if key not in self._pickup_slots))
+        
+        if len(self._driver_coords) * (len(self._pickup_slots) + len(new_keys)) > self.max_cells:
+            # Too many locations seen: start over with this request's pickups
+            self._forget_pickups()
+            new_keys = list(dict.fromkeys(keys))
+        
+        if new_keys:
+            start = len(self._pickup_coords)
+            for offset, key in enumerate(new_keys):
+                self._pickup_slots[key] = start + offset
+            self._pickup_coords = np.vstack((self._pickup_coords, np.array(new_keys, dtype=np.float64)))
+            self._grow(len(self._driver_coords), len(self._pickup_coords))
+            if len(self._driver_coords):
+                self._fill(distance_calculator, np.arange(len(self._driver_coords)),
+                           np.arange(start, len(self._pickup_coords)))
+        
+        return np.array([self._pickup_slots[key] for key in keys], dtype=np.intp)
+    
+    def _fill(self, distance_calculator: DistanceCalculator, rows: np.ndarray, slots: np.ndarray) -> None:
+        """Compute distances between the depots in rows and the pickup locations in slots."""
+        depots, pickups = self._driver_coords[rows], self._pickup_coords[slots]
+        block = np.ix_(rows, slots)
+        self._outbound[block] = distance_calculator.offline_distance_matrix(depots, pickups)
+        if not self.symmetric:
+            self._inbound[block] = distance_calculator.offline_distance_matrix(pickups, depots).T
+        self.computed += len(rows) * len(slots)
+    
+    def _grow(self, n_rows: int, n_cols: int) -> None:
+        """Ensure array capacity for n_rows drivers and n_cols pickup locations."""
+        capacity = self._outbound.shape
+        if n_rows <= capacity[0] and n_cols <= capacity[1]:
+            return
+        # Doubling stops at max_cells; only a single request larger than that exceeds it
+        rows = max(n_rows, min(max(2 * capacity[0], 4), self.max_cells // max(n_cols, 1)))
+        shape = (rows, max(n_cols, min(max(2 * capacity[1], 64), self.max_cells // rows)))
+        # Columns past the known locations may be cut after the locations were dropped
+        kept = (min(capacity[0], shape[0]), min(capacity[1], shape[1]))
+        arrays = [self._outbound] if self.symmetric else [self._outbound, self._inbound]
+        grown = []
+        for array in arrays:
+            larger = np.empty(shape, dtype=DISTANCE_DTYPE)
+            larger[:kept[0], :kept[1]] = array[:kept[0], :kept[1]]
+            grown.append(larger)
+        self._outbound = grown[0]
+        self._inbound = grown[-1]
+    
+    def _forget_pickups(self) -> None:
+        """Drop all known pickup locations (driver rows are kept and refilled on use)."""
+        self._pickup_slots = {}
+        self._pickup_coords = np.empty((0, 2), dtype=np.float64)
+    
+    def stats(self) -> Dict[str, int]:
+        """Return registry size and how many depot distances were computed versus served."""
+        with self._lock:
+            return {
+                'drivers': self.n_drivers,
+                'pickup_locations': self.n_pickups,
+                'computed_distances': self.computed,
+                'served_distances': self.served
+            }
+    
+    def clear(self) -> None:
+        """Forget all drivers and pickup locations."""
+        with self._lock:
+            self._driver_rows = OrderedDict()
+            self._driver_coords = np.empty((0, 2), dtype=np.float64)
+            self._pickup_slots = {}
+            self._pickup_coords = np.empty((0, 2), dtype=np.float64)
+            self._outbound = np.empty((0, 0), dtype=DISTANCE_DTYPE)
+            self._inbound = self._outbound
@@ -0,0 +1,165 @@
+"""
+Equirectangular (local flat-earth) distances for city-scale runs.
+Projects coordinates once onto a plane around the area's middle latitude, so
+a distance is a single hypot instead of the Haversine trigonometry, and
+measures the worst-case error of doing so against Haversine.
+"""
+
+import math
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+# Mean radius of Earth in kilometers (same as distance_calculator)
+EARTH_RADIUS_KM = 6371.0
+
+# Default bound on the relative error against Haversine (0.5%)
+EQUIRECTANGULAR_ERROR_BUDGET = 0.005
+
+# Grid points per bounding-box side sampled when measuring the error
+ERROR_SAMPLE_GRID = 9
+
+Coordinates = Union[Sequence[Tuple[float, float]], np.ndarray]
+
+
+class EquirectangularProjection:
+    """
+    Plane projection x = R * lng * cos(ref_lat), y = R * lat around a reference latitude.
+    
+    Error against Haversine grows with the distance from the reference
+    latitude (east-west lengths are scaled by cos(ref_lat) / cos(lat)) and,
+    much more slowly, with pair length (Earth curvature). Within a city box of
+    about 50 km at mid latitudes both stay well below 1%.
+    """
+    
+    def __init__(self, ref_lat: float):
+        """
+        Initialize projection.
+        
+        Args:
+            ref_lat: Reference latitude in degrees (usually the middle of the area)
+        """
+        self.ref_lat = ref_lat
+        self._scale = np.array([
+            math.radians(1.0) * EARTH_RADIUS_KM,
+            math.radians(1.0) * EARTH_RADIUS_KM * math.cos(math.radians(ref_lat))
+        ])
+    
+    @staticmethod
+    def bounding_box(*coordinate_sets: Coordinates) -> Optional[Tuple[float, float, float, float]]:
+        """Return (lat_min, lat_max, lng_min, lng_max) of all given coordinates, None if empty."""
+        arrays = [np.asarray(c, dtype=np.float64).reshape(-1, 2) for c in coordinate_sets if c is not None]
+        arrays = [a for a in arrays if len(a)]
+        if not arrays:
+            return None
+        coords = np.vstack(arrays)
+        lat_min, lng_min = coords.min(axis=0)
+        lat_max, lng_max = coords.max(axis=0)
+        return float(lat_min), float(lat_max), float(lng_min), float(lng_max)
+    
+    @staticmethod
+    def contains(outer: Tuple[float, float, float, float], inner: Tuple[float, float, float, float]) -> bool:
+        """Return True when bounding box inner lies within bounding box outer."""
+        return (outer[0] <= inner[0] and inner[1] <= outer[1] and
+                outer[2] <= inner[2] and inner[3] <= outer[3])
+    
+    @classmethod
+    def for_box(cls, box: Tuple[float, float, float, float]) -> "EquirectangularProjection":
+        """Projection centered on the middle latitude of a bounding box."""
+        return cls(0.5 * (box[0] + box[1]))
+    
+    def project(self, coords: Coordinates) -> np.ndarray:
+        """Project (lat, lng) degrees to planar (y, x) kilometers."""
+        return np.asarray(coords, dtype=np.float64).reshape(-1, 2) * self._scale
+    
+    def distance_matrix(self,
+                        origins: Coordinates,
+                        destinations: Optional[Coordinates] = None,
+                        chunk_size: int = 512,
+                        out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Planar distances between all origins and destinations, in row strips.
+        
+        Strips hold about chunk_size^2 elements, so temporary memory stays
+        bounded; all arithmetic is done in place on the strip.
+        
+        Args:
+            origins: Sequence or (n, 2) array of (lat, lng) pairs
+            destinations: Sequence or (m, 2) array of (lat, lng) pairs, defaults to origins
+            chunk_size: Edge length of the equivalent square tile
+            out: Optional preallocated (n, m) array to fill
+        
+        Returns:
+            (n, m) array of distances in kilometers (out when given)
+        """
+        origin_xy = self.project(origins)
+        dest_xy = origin_xy if destinations is None else self.project(destinations)
+        
+        n_origins, n_dests = len(origin_xy), len(dest_xy)
+        if out is not None and out.shape != (n_origins, n_dests):
+            raise ValueError(f"Output shape {out.shape} does not match ({n_origins}, {n_dests})")
+        result = np.empty((n_origins, n_dests), dtype=np.float64) if out is None else out
+        if n_origins == 0 or n_dests == 0:
+            return result
+        
+        strip = max(1, int(chunk_size) ** 2 // n_dests)
+        dest_y, dest_x = dest_xy[None, :, 0], dest_xy[None, :, 1]
+        for start in range(0, n_origins, strip):
+            end = min(start + strip, n_origins)
+            dy = dest_y - origin_xy[start:end, 0, None]
+            dx = dest_x - origin_xy[start:end, 1, None]
+            dy *= dy
+            dx *= dx
+            dy += dx
+            np.sqrt(dy, out=result[start:end])
+        
+        return result
+    
+    def pair_distances(self, origins: Coordinates, destinations: Coordinates) -> np.ndarray:
+        """Planar distances between origins[i] and destinations[i] in kilometers."""
+        delta = self.project(destinations) - self.project(origins)
+        return np.hypot(delta[:, 0], delta[:, 1])
+    
+    def max_relative_error(self, box: Tuple[float, float, float, float],
+                           sample_grid: int = ERROR_SAMPLE_GRID) -> float:
+        """
+        Measure the largest relative error against Haversine inside a bounding box.
+        
+        All pairs of a sample_grid x sample_grid lattice over the box are
+        compared with Haversine (long pairs, curvature), together with the
+        analytic limit for short east-west hops at the box's northern and
+        southern edges, where the cos(lat) scaling is furthest off.
+        
+        Args:
+            box: (lat_min, lat_max, lng_min, lng_max) in degrees
+            sample_grid: Lattice points per side
+        
+        Returns:
+            Maximum |planar / haversine - 1|
+        """
+        from .distance_calculator import DistanceCalculator
+        
+        lat_min, lat_max, lng_min, lng_max = box
+        lats = np.linspace(lat_min, lat_max, sample_grid)
+        lngs = np.linspace(lng_min, lng_max, sample_grid)
+        grid = np.column_stack([np.repeat(lats, sample_grid), np.tile(lngs, sample_grid)])
+        
+        exact = DistanceCalculator.haversine_matrix(grid)
+        planar = self.distance_matrix(grid)
+        valid = exact > 1e-9
+        sampled = float(np.max(np.abs(planar[valid] / exact[valid] - 1.0))) if valid.any() else 0.0
+        
+        ref_cos = math.cos(math.radians(self.ref_lat))
+        edge_cos = np.cos(np.radians([lat_min, lat_max]))
+        local = float(np.max(np.abs(ref_cos / np.maximum(edge_cos, 1e-12) - 1.0)))
+        return max(sampled, local)
+    
+    def error_report(self, box: Tuple[float, float, float, float], error_budget: float) -> Dict[str, object]:
+        """Return the measured error of this projection over box and whether it is within budget."""
+        error = self.max_relative_error(box)
+        return {
+            'max_relative_error': error,
+            'error_budget': error_budget,
+            'within_budget': error <= error_budget,
+            'bounding_box': box,
+            'reference_lat': self.ref_lat
+        }
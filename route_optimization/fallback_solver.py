@@ -3,28 +3,45 @@ Fallback route solver that doesn't require OR-Tools.
 Uses simple heuristics for route optimization when OR-Tools is unavailable.
 """
 
-from typing import List, Dict, Tuple
+import numpy as np
+from typing import List, Dict, Tuple, Optional
 from .models import PickupPoint, Driver, RouteStop, PriorityFlag
 from .distance_calculator import DistanceCalculator
+from .distance_context import DistanceContext, ClusterDistanceView
+from .spatial_index import SpatialGridIndex
+from .local_search import RouteLocalSearch
+
+# Priority groups at least this large use the spatial index for nearest-neighbor steps
+# (below it a vectorized scan of the remaining points is still faster)
+SPATIAL_INDEX_MIN_POINTS = 10000
+
+# Spatial candidates re-ranked by the cluster's distance metric at every step
+NEAREST_CANDIDATES = 8
 
 
 class FallbackRouteSolver:
     """Simple route solver using heuristic algorithms (no OR-Tools dependency)."""
     
-    def __init__(self, distance_calculator: DistanceCalculator):
+    def __init__(self,
+                 distance_calculator: DistanceCalculator,
+                 local_search: Optional[RouteLocalSearch] = None):
         """
         Initialize fallback route solver.
         
         Args:
             distance_calculator: Distance calculation utility
+            local_search: Optional 2-opt / Or-opt stage run on every constructed
+                route (None: nearest-neighbor routes are returned as built)
         """
         self.distance_calculator = distance_calculator
+        self.local_search = local_search
     
     def solve_cluster_route(self, 
                            pickup_points: List[PickupPoint], 
                            driver: Driver,
                            priority_weight: float = 0.4,
-                           distance_weight: float = 0.6) -> List[RouteStop]:
+                           distance_weight: float = 0.6,
+                           distance_view: Optional[ClusterDistanceView] = None) -> List[RouteStop]:
         """
         Solve route using simple heuristics.
         
@@ -33,6 +50,8 @@ class FallbackRouteSolver:
             driver: Driver assigned to this cluster
             priority_weight: Weight for priority optimization (0-1)
             distance_weight: Weight for distance optimization (0-1)
+            distance_view: Distances for this cluster from the run's shared context
+                (local index 0 is the depot, i + 1 is pickup_points[i])
             
         Returns:
             Ordered list of route stops
@@ -40,126 +59,184 @@ class FallbackRouteSolver:
         if not pickup_points:
             return []
         
-        if len(pickup_points) == 1:
+        if distance_view is None:
+            distance_view = DistanceContext.for_cluster(self.distance_calculator, driver, pickup_points)
+        
+        optimized_order = self.solve_cluster_order(pickup_points, driver, priority_weight, distance_weight,
+                                                   distance_view)
+        
+        # Convert to RouteStop objects
+        return self.create_route_stops(pickup_points, optimized_order, distance_view)
+    
+    def solve_cluster_order(self,
+                            pickup_points: List[PickupPoint],
+                            driver: Driver,
+                            priority_weight: float,
+                            distance_weight: float,
+                            distance_view: ClusterDistanceView) -> List[int]:
+        """
+        Solve the visiting order of a cluster without building route stops.
+        
+        Args:
+            pickup_points: List of pickup points in the cluster
+            driver: Driver assigned to this cluster
+            priority_weight: Weight for priority optimization (0-1)
+            distance_weight: Weight for distance optimization (0-1)
+            distance_view: Distances for this cluster
+        
+        Returns:
+            Indices into pickup_points in route order
+        """
+        if len(pickup_points) <= 1:
             # Single point - simple case
-            distance = self.distance_calculator.road_distance(
-                driver.base_lat, driver.base_lng,
-                pickup_points[0].lat, pickup_points[0].lng
-            )
-            return [RouteStop(
-                pickup_point=pickup_points[0],
-                order=0,
-                distance_from_previous=distance,
-                estimated_time=self.distance_calculator.estimate_travel_time(distance)
-            )]
+            return list(range(len(pickup_points)))
         
         # Sort by priority first, then optimize within priority groups
-        priority_sorted_points = self._sort_by_priority(pickup_points)
+        priority_sorted_order = self._sort_by_priority(pickup_points)
         
         # Use nearest neighbor heuristic within priority groups
-        optimized_order = self._nearest_neighbor_route(priority_sorted_points, driver)
+        optimized_order = self._nearest_neighbor_route(pickup_points, priority_sorted_order, distance_view)
         
-        # Convert to RouteStop objects
-        return self._create_route_stops(optimized_order, driver)
+        # Shorten the route within each priority segment
+        if self.local_search is not None:
+            priorities = [point.priority_flag.priority_value for point in pickup_points]
+            optimized_order = self.local_search.improve(optimized_order, priorities, distance_view)
+        
+        return optimized_order
     
-    def _sort_by_priority(self, pickup_points: List[PickupPoint]) -> List[PickupPoint]:
+    def _sort_by_priority(self, pickup_points: List[PickupPoint]) -> List[int]:
         """
         Sort pickup points by priority (red > yellow > green).
         Within same priority, sort by volume (larger first).
-        """
-        # Group by priority
-        red_points = [p for p in pickup_points if p.priority_flag == PriorityFlag.RED]
-        yellow_points = [p for p in pickup_points if p.priority_flag == PriorityFlag.YELLOW]
-        green_points = [p for p in pickup_points if p.priority_flag == PriorityFlag.GREEN]
         
-        # Sort each group by volume (descending)
-        red_points.sort(key=lambda p: p.volume, reverse=True)
-        yellow_points.sort(key=lambda p: p.volume, reverse=True)
-        green_points.sort(key=lambda p: p.volume, reverse=True)
-        
-        # Combine in priority order
-        return red_points + yellow_points + green_points
+        Returns:
+            Indices into pickup_points in sorted order
+        """
+        return sorted(
+            range(len(pickup_points)),
+            key=lambda i: (-pickup_points[i].priority_flag.priority_value, -pickup_points[i].volume)
+        )
     
     def _nearest_neighbor_route(self, 
                                pickup_points: List[PickupPoint], 
-                               driver: Driver) -> List[PickupPoint]:
+                               order: List[int],
+                               distance_view: ClusterDistanceView) -> List[int]:
         """
         Optimize route order using nearest neighbor heuristic while respecting priority order.
+        
+        Args:
+            pickup_points: Pickup points of the cluster
+            order: Priority-sorted indices into pickup_points
+            distance_view: Distances for this cluster
+        
+        Returns:
+            Indices into pickup_points in route order
         """
-        if len(pickup_points) <= 2:
-            return pickup_points
+        if len(order) <= 2:
+            return order
         
         # Group by priority to maintain priority ordering
-        priority_groups = self._group_by_priority(pickup_points)
+        priority_groups = self._group_by_priority(pickup_points, order)
         optimized_route = []
         
-        current_lat, current_lng = driver.base_lat, driver.base_lng
+        current = 0  # Depot
         
         # Process each priority group in order
         for priority in [PriorityFlag.RED, PriorityFlag.YELLOW, PriorityFlag.GREEN]:
             if priority not in priority_groups:
                 continue
-                
-            group_points = priority_groups[priority][:]  # Make a copy
+            
+            # View indices are offset by one for the depot
+            group_nodes = np.array(priority_groups[priority], dtype=np.intp) + 1
+            
+            # The sparse graph only answers nearby pairs exactly, so always go through the index
+            if len(group_nodes) >= SPATIAL_INDEX_MIN_POINTS or distance_view.context.sparse:
+                current = self._indexed_nearest_neighbor(group_nodes, current, distance_view, optimized_route)
+                continue
             
             # Find nearest point in this priority group
-            while group_points:
-                min_distance = float('inf')
-                nearest_point = group_points[0]
-                
-                for point in group_points:
-                    distance = self.distance_calculator.haversine_distance(
-                        current_lat, current_lng, point.lat, point.lng
-                    )
-                    if distance < min_distance:
-                        min_distance = distance
-                        nearest_point = point
-                
-                optimized_route.append(nearest_point)
-                group_points.remove(nearest_point)
-                current_lat, current_lng = nearest_point.lat, nearest_point.lng
+            while len(group_nodes):
+                nearest = int(np.argmin(distance_view.distances_from(current, group_nodes)))
+                current = int(group_nodes[nearest])
+                optimized_route.append(current - 1)
+                group_nodes = np.delete(group_nodes, nearest)
         
         return optimized_route
     
-    def _group_by_priority(self, pickup_points: List[PickupPoint]) -> Dict[PriorityFlag, List[PickupPoint]]:
-        """Group pickup points by priority level."""
+    def _indexed_nearest_neighbor(self,
+                                  group_nodes: np.ndarray,
+                                  current: int,
+                                  distance_view: ClusterDistanceView,
+                                  route: List[int]) -> int:
+        """
+        Visit a large priority group nearest-neighbor first using a spatial index.
+        
+        The index proposes the closest few unvisited points by straight-line
+        distance and the cluster's distance metric picks among them, so a step
+        costs O(log n) instead of a scan over the whole group.
+        
+        Args:
+            group_nodes: View indices of the group's points
+            current: View index of the current location
+            distance_view: Distances for this cluster
+            route: Route to append the visited pickup point indices to
+        
+        Returns:
+            View index of the last visited point
+        """
+        index = SpatialGridIndex(distance_view.context.locations[distance_view.nodes[group_nodes]])
+        
+        lat, lng = distance_view.location(current)
+        candidates = index.nearest(lat, lng, NEAREST_CANDIDATES)
+        
+        while candidates:
+            distances = distance_view.distances_from(current, group_nodes[candidates])
+            best = candidates[int(np.argmin(distances))]
+            index.remove(best)
+            current = int(group_nodes[best])
+            route.append(current - 1)
+            candidates = index.nearest_to_point(best, NEAREST_CANDIDATES)
+        
+        return current
+    
+    def _group_by_priority(self,
+                           pickup_points: List[PickupPoint],
+                           order: List[int]) -> Dict[PriorityFlag, List[int]]:
+        """Group pickup point indices by priority level, keeping their order."""
         groups = {}
-        for point in pickup_points:
-            if point.priority_flag not in groups:
-                groups[point.priority_flag] = []
-            groups[point.priority_flag].append(point)
+        for i in order:
+            priority = pickup_points[i].priority_flag
+            if priority not in groups:
+                groups[priority] = []
+            groups[priority].append(i)
         return groups
     
-    def _create_route_stops(self, 
-                           pickup_points: List[PickupPoint], 
-                           driver: Driver) -> List[RouteStop]:
+    def create_route_stops(self,
+                           pickup_points: List[PickupPoint],
+                           order: List[int],
+                           distance_view: ClusterDistanceView) -> List[RouteStop]:
         """
-        Create RouteStop objects from ordered pickup points.
+        Create RouteStop objects from ordered pickup point indices.
         """
-        if not pickup_points:
+        if not order:
             return []
         
         route_stops = []
-        prev_lat, prev_lng = driver.base_lat, driver.base_lng
         
-        for order, point in enumerate(pickup_points):
-            # Calculate distance from previous location
-            distance = self.distance_calculator.road_distance(
-                prev_lat, prev_lng, point.lat, point.lng
-            )
-            
-            # Estimate travel time
-            travel_time = self.distance_calculator.estimate_travel_time(distance)
-            
+        # Distances from previous locations, looked up (or batch-requested) in one go
+        legs = distance_view.route_legs([i + 1 for i in order])
+        # Travel times follow the clock along the route (speed profile by hour)
+        times = distance_view.route_times(legs)
+        
+        for stop_order, (i, distance, travel_time) in enumerate(zip(order, legs, times)):
             route_stop = RouteStop(
-                pickup_point=point,
-                order=order,
+                pickup_point=pickup_points[i],
+                order=stop_order,
                 distance_from_previous=distance,
                 estimated_time=travel_time
             )
             
             route_stops.append(route_stop)
-            prev_lat, prev_lng = point.lat, point.lng
         
         return route_stops
     
@@ -0,0 +1,245 @@
+"""
+Client for the Google Maps Distance Matrix API.
+Splits matrices of any size into API-legal tiles and requests them
+concurrently over a pooled HTTP session, guarded by a circuit breaker.
+"""
+
+import math
+import threading
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import List, Optional, Tuple
+
+from .circuit_breaker import CircuitBreaker
+
+GOOGLE_DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+# Limits of a single Distance Matrix request (standard usage)
+MAX_ORIGINS_PER_REQUEST = 25
+MAX_DESTINATIONS_PER_REQUEST = 25
+MAX_ELEMENTS_PER_REQUEST = 100
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+
+class DistanceMatrixClient:
+    """Tiled, concurrent Google Maps Distance Matrix client with connection pooling."""
+    
+    def __init__(self,
+                 api_key: str,
+                 base_url: str = GOOGLE_DISTANCE_MATRIX_URL,
+                 max_concurrency: int = 4,
+                 timeout: float = 10.0,
+                 max_origins: int = MAX_ORIGINS_PER_REQUEST,
+                 max_destinations: int = MAX_DESTINATIONS_PER_REQUEST,
+                 max_elements: int = MAX_ELEMENTS_PER_REQUEST,
+                 circuit_breaker: Optional[CircuitBreaker] = None):
+        """
+        Initialize Distance Matrix client.
+        
+        Args:
+            api_key: Google Maps API key
+            base_url: Distance Matrix endpoint (overridable for local stubs)
+            max_concurrency: Maximum number of requests in flight at once
+            timeout: Timeout per request in seconds
+            max_origins: Maximum origins per request
+            max_destinations: Maximum destinations per request
+            max_elements: Maximum origins x destinations per request
+            circuit_breaker: Breaker guarding the endpoint; by default the
+                process-wide breaker for base_url, so its state outlives this client
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"Concurrency must be at least 1: {max_concurrency}")
+        
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_origins = max_origins
+        self.max_destinations = max_destinations
+        self.max_elements = max_elements
+        self.circuit_breaker = circuit_breaker or CircuitBreaker.shared(base_url)
+        
+        self._session_lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+    
+    @property
+    def session(self) -> requests.Session:
+        """Return the pooled HTTP session, created on first use."""
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+    
+    def close(self) -> None:
+        """Close the pooled HTTP session."""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+    
+    def tile_shape(self, n_origins: int, n_destinations: int) -> Tuple[int, int]:
+        """
+        Choose the largest API-legal tile for a matrix.
+        
+        Args:
+            n_origins: Number of origins in the full matrix
+            n_destinations: Number of destinations in the full matrix
+        
+        Returns:
+            (origins per tile, destinations per tile)
+        """
+        cols = max(1, min(n_destinations, self.max_destinations, self.max_elements))
+        rows = max(1, min(n_origins, self.max_origins, self.max_elements // cols))
+        return rows, cols
+    
+    def tiles(self, n_origins: int, n_destinations: int) -> List[Tuple[slice, slice]]:
+        """
+        Split a matrix into API-legal request blocks.
+        
+        Args:
+            n_origins: Number of origins in the full matrix
+            n_destinations: Number of destinations in the full matrix
+        
+        Returns:
+            List of (origin slice, destination slice) blocks covering the matrix
+        """
+        if n_origins == 0 or n_destinations == 0:
+            return []
+        
+        rows, cols = self.tile_shape(n_origins, n_destinations)
+        return [
+            (slice(row, min(row + rows, n_origins)), slice(col, min(col + cols, n_destinations)))
+            for row in range(0, n_origins, rows)
+            for col in range(0, n_destinations, cols)
+        ]
+    
+    def distance_matrix(self,
+                        origins: List[Tuple[float, float]],
+                        destinations: List[Tuple[float, float]]) -> np.ndarray:
+        """
+        Request the full distance matrix, tile by tile and concurrently.
+        
+        Args:
+            origins: List of (lat, lng) tuples for origin points
+            destinations: List of (lat, lng) tuples for destination points
+        
+        Returns:
+            (len(origins), len(destinations)) array of distances in kilometers,
+            NaN where the element or its whole tile failed
+        """
+        result = np.full((len(origins), len(destinations)), np.nan, dtype=np.float64)
+        blocks = self.tiles(len(origins), len(destinations))
+        if not blocks:
+            return result
+        
+        def fetch(block: Tuple[slice, slice]) -> Tuple[Tuple[slice, slice], Optional[np.ndarray]]:
+            rows, cols = block
+            try:
+                return block, self._guarded_request(origins[rows], destinations[cols])
+            except CircuitOpenError:
+                return block, None
+            except Exception as e:
+                # Any failure (network, status or malformed payload) only loses
+                # this tile; its elements fall back to offline distances
+                print(f"Google Maps API error for tile {rows.start}:{rows.stop} x "
+                      f"{cols.start}:{cols.stop}: {e}")
+                return block, None
+        
+        workers = min(self.max_concurrency, len(blocks))
+        if workers == 1:
+            fetched = [fetch(block) for block in blocks]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                fetched = list(executor.map(fetch, blocks))
+        
+        # Stitch tiles back into the full matrix
+        for (rows, cols), tile in fetched:
+            if tile is not None:
+                result[rows, cols] = tile
+        
+        return result
+    
+    def distances(self, pairs: List[Tuple[float, float, float, float]]) -> List[Optional[float]]:
+        """
+        Request independent origin-destination pairs concurrently.
+        
+        Args:
+            pairs: List of (lat1, lng1, lat2, lng2) tuples
+        
+        Returns:
+            Distance in kilometers per pair, None where the request failed
+        """
+        def fetch(pair: Tuple[float, float, float, float]) -> Optional[float]:
+            lat1, lng1, lat2, lng2 = pair
+            try:
+                value = self._guarded_request([(lat1, lng1)], [(lat2, lng2)])[0, 0]
+            except CircuitOpenError:
+                return None
+            except Exception as e:
+                print(f"Google Maps API error: {e}")
+                return None
+            return None if math.isnan(value) else float(value)
+        
+        workers = min(self.max_concurrency, len(pairs))
+        if workers <= 1:
+            return [fetch(pair) for pair in pairs]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fetch, pairs))
+    
+    def _guarded_request(self,
+                         origins: List[Tuple[float, float]],
+                         destinations: List[Tuple[float, float]]) -> np.ndarray:
+        """
+        Send one request through the circuit breaker and report its outcome.
+        
+        Any exception counts as a breaker failure and is re-raised; the fetch
+        helpers catch it and leave the tile or pair to the offline fallback.
+        """
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("Google Maps circuit breaker is open")
+        
+        try:
+            tile = self._request(origins, destinations)
+        except Exception:
+            # Any failure, including an unexpected payload, ends a half-open probe
+            self.circuit_breaker.record_failure()
+            raise
+        
+        self.circuit_breaker.record_success()
+        return tile
+    
+    def _request(self,
+                 origins: List[Tuple[float, float]],
+                 destinations: List[Tuple[float, float]]) -> np.ndarray:
+        """Send one Distance Matrix request; failed elements are NaN."""
+        params = {
+            'origins': "|".join(f"{lat},{lng}" for lat, lng in origins),
+            'destinations': "|".join(f"{lat},{lng}" for lat, lng in destinations),
+            'units': 'metric',
+            'mode': 'driving',
+            'key': self.api_key
+        }
+        
+        response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        
+        data = response.json()
+        
+        if data['status'] != 'OK':
+            raise ValueError(f"Google Maps API returned status: {data['status']}")
+        
+        tile = np.full((len(origins), len(destinations)), np.nan, dtype=np.float64)
+        for i, row in enumerate(data['rows'][:len(origins)]):
+            for j, element in enumerate(row['elements'][:len(destinations)]):
+                if element.get('status') == 'OK':
+                    tile[i, j] = element['distance']['value'] / 1000.0
+        return tile
@@ -0,0 +1,207 @@
+"""
+Warm-started incremental clustering across successive runs.
+Keeps the centroids, labels and feature scaling of each fleet's last
+clustering, so a re-optimization a few minutes later only places the points
+that changed and re-balances the clusters they touch.
+"""
+
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+from sklearn.cluster import KMeans
+
+# Share of points that may be new, moved or removed before the whole
+# clustering is redone (the frozen scaling and centroids drift too far beyond it)
+WARM_START_MAX_CHANGE = 0.3
+
+# Fleets whose last clustering is remembered, least recently used dropped first
+WARM_START_MAX_FLEETS = 64
+
+
+class ClusteringSnapshot:
+    """The last clustering of one fleet, in the feature space it was computed in."""
+    
+    def __init__(self,
+                 points: Dict[str, Tuple[tuple, int]],
+                 centers: np.ndarray,
+                 scaling: object):
+        """
+        Initialize snapshot.
+        
+        Args:
+            points: pickup_id -> (raw feature row, cluster label)
+            centers: (k, d) cluster centers in scaled feature space
+            scaling: Feature scaling the centers were computed with
+        """
+        self.points = points
+        self.centers = centers
+        self.scaling = scaling
+
+
+class IncrementalClustering:
+    """
+    Warm-starts k-means from the previous run of the same fleet.
+    
+    Unchanged points keep their label. New points, and points whose location,
+    volume or priority changed, go to the nearest previous centroid. Only the
+    clusters that gained or lost points are then re-balanced: a few Lloyd
+    iterations over their members, started from their previous centroids. The
+    other clusters and their centroids are left as they were, so the work
+    follows the size of the change rather than the size of the dataset.
+    """
+    
+    _instances: Dict[int, "IncrementalClustering"] = {}
+    _instances_lock = threading.Lock()
+    
+    def __init__(self,
+                 max_change: float = WARM_START_MAX_CHANGE,
+                 max_iter: int = 20,
+                 max_fleets: int = WARM_START_MAX_FLEETS):
+        """
+        Initialize incremental clustering.
+        
+        Args:
+            max_change: Largest share of changed points handled incrementally
+            max_iter: Lloyd iterations when re-balancing affected clusters
+            max_fleets: Fleets whose last clustering is kept
+        """
+        self.max_change = max_change
+        self.max_iter = max_iter
+        self.max_fleets = max_fleets
+        self._snapshots: "OrderedDict[Hashable, ClusteringSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def shared(cls) -> "IncrementalClustering":
+        """
+        Return the process-wide instance.
+        
+        Every request served by the process reuses it, so a fleet's last
+        clustering survives between requests.
+        """
+        key = os.getpid()
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls()
+            return cls._instances[key]
+    
+    def lookup(self, fleet_key: Hashable) -> Optional[ClusteringSnapshot]:
+        """Return the last clustering of a fleet, None if there is none."""
+        with self._lock:
+            snapshot = self._snapshots.get(fleet_key)
+            if snapshot is not None:
+                self._snapshots.move_to_end(fleet_key)
+            return snapshot
+    
+    def remember(self,
+                 fleet_key: Hashable,
+                 pickup_ids: Sequence[str],
+                 rows: Sequence[tuple],
+                 labels: np.ndarray,
+                 centers: np.ndarray,
+                 scaling: object) -> None:
+        """
+        Store a fleet's clustering for the next run.
+        
+        Args:
+            fleet_key: Identifies the fleet (drivers and feature set)
+            pickup_ids: Pickup ID of every point
+            rows: Raw feature row of every point, used to detect changed points
+            labels: Cluster label of every point
+            centers: (k, d) cluster centers in scaled feature space
+            scaling: Feature scaling the centers were computed with
+        """
+        points = dict(zip(pickup_ids, zip(rows, labels.tolist())))
+        snapshot = ClusteringSnapshot(points, np.array(centers, dtype=np.float64), scaling)
+        with self._lock:
+            self._snapshots[fleet_key] = snapshot
+            self._snapshots.move_to_end(fleet_key)
+            while len(self._snapshots) > self.max_fleets:
+                self._snapshots.popitem(last=False)
+    
+    def update(self,
+               snapshot: ClusteringSnapshot,
+               pickup_ids: Sequence[str],
+               rows: Sequence[tuple],
+               features: np.ndarray) -> Tuple[Optional[np.ndarray], np.ndarray, Dict[str, object]]:
+        """
+        Cluster the current points starting from a previous clustering.
+        
+        Args:
+            snapshot: Previous clustering of the same fleet
+            pickup_ids: Pickup ID of every current point
+            rows: Raw feature row of every current point
+            features: (n, d) features scaled with snapshot.scaling
+        
+        Returns:
+            (labels, centers, report); labels is None when too much changed
+            for a warm start and the caller should cluster from scratch
+        """
+        previous = snapshot.points
+        labels = np.full(len(pickup_ids), -1, dtype=np.intp)
+        affected = set()
+        for i, (pickup_id, row) in enumerate(zip(pickup_ids, rows)):
+            entry = previous.get(pickup_id)
+            if entry is None:
+                continue
+            if entry[0] == row:
+                labels[i] = entry[1]
+            else:
+                # Moved or re-weighted point: placed again, its old cluster loses it
+                affected.add(entry[1])
+        
+        current = set(pickup_ids)
+        removed = [label for pickup_id, (_, label) in previous.items() if pickup_id not in current]
+        placed = np.flatnonzero(labels < 0)
+        
+        report = {
+            'mode': 'incremental',
+            'placed_points': len(placed),
+            'removed_points': len(removed),
+            'affected_clusters': 0
+        }
+        if len(placed) + len(removed) > self.max_change * max(len(previous), len(pickup_ids), 1):
+            report['mode'] = 'full'
+            return None, snapshot.centers, report
+        
+        centers = snapshot.centers.copy()
+        if len(placed):
+            labels[placed] = self.nearest_centers(features[placed], centers)
+            affected.update(labels[placed].tolist())
+        affected.update(removed)
+        
+        if affected:
+            clusters = np.array(sorted(affected), dtype=np.intp)
+            members = np.flatnonzero(np.isin(labels, clusters))
+            if len(members) >= len(clusters):
+                kmeans = KMeans(n_clusters=len(clusters), init=centers[clusters], n_init=1,
+                                max_iter=self.max_iter)
+                labels[members] = clusters[kmeans.fit_predict(features[members])]
+                centers[clusters] = kmeans.cluster_centers_
+        
+        report['affected_clusters'] = len(affected)
+        return labels, centers, report
+    
+    @staticmethod
+    def nearest_centers(features: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        """Return the index of the nearest center for every feature row."""
+        distances = ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        return distances.argmin(axis=1)
+    
+    @staticmethod
+    def cluster_centers(features: np.ndarray, labels: np.ndarray, n_clusters: int) -> np.ndarray:
+        """Mean feature row per cluster; empty clusters sit at the overall mean."""
+        counts = np.bincount(labels, minlength=n_clusters).astype(np.float64)
+        sums = np.zeros((n_clusters, features.shape[1]))
+        np.add.at(sums, labels, features)
+        centers = np.tile(features.mean(axis=0), (n_clusters, 1))
+        occupied = counts > 0
+        centers[occupied] = sums[occupied] / counts[occupied, None]
+        return centers
+    
+    def clear(self) -> None:
+        """Forget every fleet's clustering."""
+        with self._lock:
+            self._snapshots.clear()
@@ -0,0 +1,184 @@
+"""
+Joint multi-vehicle routing for runs small enough to solve at once.
+The cluster pipeline fixes every pickup's driver before any route is built,
+so a pickup k-means put in the wrong cluster stays there. Here all drivers'
+routes are searched in one OR-Tools model, starting from the cluster
+pipeline's routes, so the search can move pickups between drivers.
+"""
+
+import time
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+from .models import PickupPoint, Driver
+from .distance_calculator import DistanceCalculator
+from .distance_context import DistanceContext, ClusterDistanceView
+from .route_solver import (
+    RouteSolver, ORTOOLS_AVAILABLE, ORTOOLS_TIME_LIMIT, ORTOOLS_METAHEURISTIC, VOLUME_SCALE
+)
+
+if ORTOOLS_AVAILABLE:
+    from ortools.constraint_solver import pywrapcp
+
+# Runs with more pickups than this keep the cluster pipeline: the model holds
+# a (pickups + drivers)^2 matrix and every move is tried for every driver
+JOINT_MAX_POINTS = 400
+
+
+class JointRouteSolver(RouteSolver):
+    """
+    Solves the routes of all drivers in one OR-Tools model.
+    
+    Every driver is a vehicle starting at its own depot with its own
+    capacity, and routes are open as in the cluster pipeline. Any driver may
+    take any pickup, each pickup can be dropped at its skip penalty, and
+    every route keeps the red -> yellow -> green order. Distances come from
+    the run's shared context, rounded once into an integer matrix.
+    
+    The time limit is strict: it covers building the model as well as the
+    search, and callers may start it earlier by passing a deadline (e.g. to
+    include solving the seed routes). When no solution is found within it,
+    solve_routes returns None and the caller keeps its cluster routes.
+    """
+    
+    def __init__(self,
+                 distance_calculator: DistanceCalculator,
+                 time_limit: float = ORTOOLS_TIME_LIMIT,
+                 solution_limit: Optional[int] = None,
+                 metaheuristic: str = ORTOOLS_METAHEURISTIC,
+                 max_points: int = JOINT_MAX_POINTS):
+        """
+        Initialize joint solver.
+        
+        Args:
+            distance_calculator: Distance calculation utility
+            time_limit: Wall-clock seconds for the whole fleet, model building included
+            solution_limit: Stop after this many improving solutions (None: no limit)
+            metaheuristic: OR-Tools local search metaheuristic (see RouteSolver)
+            max_points: Largest pickup count solved jointly
+        """
+        if time_limit is None:
+            raise ValueError("Joint routing needs a time limit")
+        if max_points < 1:
+            raise ValueError(f"Joint routing limit must be at least 1 pickup: {max_points}")
+        super().__init__(distance_calculator, time_limit, solution_limit, metaheuristic)
+        self.max_points = max_points
+        self.last_report: Dict[str, object] = {}
+    
+    def fits(self, pickup_points: List[PickupPoint]) -> bool:
+        """Return whether a run is small enough to be solved jointly."""
+        return 0 < len(pickup_points) <= self.max_points
+    
+    def solve_routes(self,
+                     pickup_points: List[PickupPoint],
+                     drivers: List[Driver],
+                     distance_context: DistanceContext,
+                     initial_routes: Optional[Sequence[List[PickupPoint]]] = None,
+                     deadline: Optional[float] = None) -> Optional[List[List[PickupPoint]]]:
+        """
+        Solve every driver's route at once.
+        
+        Args:
+            pickup_points: Pickup points of the run
+            drivers: Drivers of the run
+            distance_context: Run's shared distances, covering every driver and pickup
+            initial_routes: Optional starting route per driver (e.g. the cluster
+                pipeline's); pickups on none of them start unassigned
+            deadline: time.perf_counter() value the solve must end by
+                (default: time_limit from now)
+        
+        Returns:
+            Pickups in visiting order per driver (in the order of drivers),
+            or None when no solution was found within the time limit
+        """
+        if deadline is None:
+            deadline = time.perf_counter() + self.time_limit
+        n_drivers = len(drivers)
+        self.last_report = {'points': len(pickup_points), 'drivers': n_drivers, 'status': 'out_of_time'}
+        if time.perf_counter() >= deadline:
+            return None
+        
+        nodes = [distance_context.driver_index(driver) for driver in drivers]
+        nodes.extend(distance_context.pickup_index(point) for point in pickup_points)
+        view = ClusterDistanceView(distance_context, np.array(nodes, dtype=np.intp))
+        
+        distance_matrix = self.integer_matrix(view.to_array())
+        # Open routes: arriving back at any depot is free
+        distance_matrix[:, :n_drivers] = 0
+        
+        depots = list(range(n_drivers))
+        manager = pywrapcp.RoutingIndexManager(len(nodes), n_drivers, depots, depots)
+        routing = pywrapcp.RoutingModel(manager)
+        
+        # The matrix is indexed by node, so the per-vehicle start and end indices need no remapping
+        transit_callback_index = routing.RegisterTransitMatrix(distance_matrix.tolist())
+        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+        
+        demands = np.zeros(len(nodes), dtype=np.int64)
+        demands[n_drivers:] = np.array([point.volume for point in pickup_points]) * VOLUME_SCALE
+        demand_callback_index = routing.RegisterUnaryTransitVector(demands.tolist())
+        routing.AddDimensionWithVehicleCapacity(
+            demand_callback_index,
+            0,
+            [int(driver.max_capacity * VOLUME_SCALE) for driver in drivers],
+            True,
+            'Capacity'
+        )
+        
+        # Keep red -> yellow -> green on every route: no arc leads back to a more urgent pickup
+        indices = [manager.NodeToIndex(n_drivers + i) for i in range(len(pickup_points))]
+        more_urgent: List[int] = []
+        for value in sorted({point.priority_flag.priority_value for point in pickup_points}, reverse=True):
+            level = [index for index, point in zip(indices, pickup_points)
+                     if point.priority_flag.priority_value == value]
+            if more_urgent:
+                for index in level:
+                    routing.NextVar(index).RemoveValues(more_urgent)
+            more_urgent.extend(level)
+        
+        for index, point in zip(indices, pickup_points):
+            routing.AddDisjunction([index], self._calculate_skip_penalty(point))
+        
+        search_parameters = self.search_parameters()
+        solution = None
+        if initial_routes is not None and self._set_remaining_time(search_parameters, deadline):
+            routing.CloseModelWithParameters(search_parameters)
+            index_of = {point.pickup_id: index for index, point in zip(indices, pickup_points)}
+            # None when a route breaks a constraint (e.g. overloads its driver)
+            initial_assignment = routing.ReadAssignmentFromRoutes(
+                [[index_of[point.pickup_id] for point in route] for route in initial_routes], True
+            )
+            if initial_assignment is not None:
+                solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+        if solution is None and self._set_remaining_time(search_parameters, deadline):
+            solution = routing.SolveWithParameters(search_parameters)
+        
+        if solution is None:
+            if time.perf_counter() < deadline:
+                self.last_report['status'] = 'no_solution'
+            return None
+        
+        routes = []
+        for vehicle in range(n_drivers):
+            route = []
+            index = solution.Value(routing.NextVar(routing.Start(vehicle)))
+            while not routing.IsEnd(index):
+                route.append(pickup_points[manager.IndexToNode(index) - n_drivers])
+                index = solution.Value(routing.NextVar(index))
+            routes.append(route)
+        
+        self.last_report.update({
+            'status': 'solved',
+            'dropped_points': len(pickup_points) - sum(len(route) for route in routes),
+            'elapsed_seconds': self.time_limit - (deadline - time.perf_counter())
+        })
+        return routes
+    
+    @staticmethod
+    def _set_remaining_time(search_parameters, deadline: float) -> bool:
+        """Limit the search to the time left before deadline; False when none is left."""
+        remaining_ms = int((deadline - time.perf_counter()) * 1000)
+        if remaining_ms <= 0:
+            return False
+        search_parameters.time_limit.FromMilliseconds(remaining_ms)
+        return True
@@ -0,0 +1,378 @@
+"""
+2-opt and Or-opt improvement of constructed routes.
+Shortens a nearest-neighbor route in place of a full re-solve: candidate
+moves are limited to each stop's nearest neighbors and stops whose
+surroundings did not change are not looked at again, so an improvement pass
+costs about O(n * k) distance lookups instead of O(n^2).
+"""
+
+import time
+import numpy as np
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .distance_context import ClusterDistanceView
+from .spatial_index import SpatialGridIndex
+
+# Nearest neighbors (within the same priority segment) tried as move partners
+LOCAL_SEARCH_NEIGHBORS = 8
+
+# Longest chain of consecutive stops relocated by one Or-opt move
+OR_OPT_MAX_CHAIN = 3
+
+# Wall-clock seconds spent improving one route (None for no limit)
+LOCAL_SEARCH_TIME_BUDGET = 0.05
+
+# Stops taken off the work queue per stop of the route before giving up
+LOCAL_SEARCH_ITERATIONS_PER_STOP = 50
+
+# Clusters up to this size copy their distances into nested lists, the
+# fastest lookup from Python (1000^2 entries hold about 32 MB while searching)
+LOCAL_MATRIX_MAX_POINTS = 1000
+
+# Segments up to this size find neighbors through their distance submatrix;
+# larger ones (and sparse runs) use straight-line neighbors from a spatial index
+NEIGHBOR_MATRIX_MAX_POINTS = 2000
+
+# Smallest improvement in kilometers accepted as a move
+MIN_GAIN_KM = 1e-9
+
+
+class RouteLocalSearch:
+    """
+    Improves an open route (depot first, no return leg) with 2-opt and Or-opt moves.
+    
+    The route is split into segments of consecutive stops with the same
+    priority (red, then yellow, then green). A move only reorders stops within
+    one segment, so the segment order is never broken; the edges into and out
+    of a segment may still change.
+    
+    Every stop starts on a work queue. A stop taken off the queue tries to
+    link itself to each of its nearest neighbors, by reversing the path
+    between them (2-opt) or by moving a chain of up to OR_OPT_MAX_CHAIN stops
+    starting at it next to the neighbor (Or-opt), and applies the first move
+    that shortens the route. The stops at the ends of changed edges go back on
+    the queue; a stop without an improving move stays off it (its don't-look
+    bit is set). The search ends when the queue is empty or the time or
+    iteration budget runs out.
+    """
+    
+    def __init__(self,
+                 neighbors: int = LOCAL_SEARCH_NEIGHBORS,
+                 time_budget: Optional[float] = LOCAL_SEARCH_TIME_BUDGET,
+                 iterations_per_stop: int = LOCAL_SEARCH_ITERATIONS_PER_STOP):
+        """
+        Initialize local search.
+        
+        Args:
+            neighbors: Nearest neighbors tried as move partners per stop
+            time_budget: Wall-clock seconds per route (None for no limit)
+            iterations_per_stop: Queue pops allowed per stop of the route
+        """
+        if neighbors < 1:
+            raise ValueError(f"Local search needs at least one neighbor: {neighbors}")
+        self.neighbors = neighbors
+        self.time_budget = time_budget
+        self.iterations_per_stop = iterations_per_stop
+        self.last_report: Dict[str, float] = {}
+    
+    def improve(self,
+                order: List[int],
+                priorities: Sequence[int],
+                distance_view: ClusterDistanceView) -> List[int]:
+        """
+        Shorten a route without moving any stop out of its priority segment.
+        
+        Args:
+            order: Indices into the cluster's pickup points in route order
+            priorities: Priority value of every pickup point of the cluster;
+                segments are runs of equal priority along order
+            distance_view: Distances for this cluster (local index 0 is the
+                depot, i + 1 is pickup point i)
+        
+        Returns:
+            Indices into the cluster's pickup points in improved route order
+        """
+        started = time.perf_counter()
+        self.last_report = {'two_opt_moves': 0, 'or_opt_moves': 0, 'iterations': 0, 'gain_km': 0.0}
+        if len(order) < 3:
+            return list(order)
+        
+        # Positions 1..n of route hold view indices, position 0 the depot and
+        # position n + 1 a sentinel for the open end, at distance 0 from every stop
+        end_node = len(distance_view)
+        route = [0] + [i + 1 for i in order] + [end_node]
+        segment_of = [0] * (end_node + 1)
+        bounds = []
+        for position in range(1, len(route) - 1):
+            if position == 1 or priorities[order[position - 1]] != priorities[order[position - 2]]:
+                bounds.append([position, position])
+            bounds[-1][1] = position + 1
+            segment_of[route[position]] = len(bounds) - 1
+        
+        # Ordinary clusters copy their distances once; larger ones read them on demand
+        matrix = None
+        if end_node - 1 <= LOCAL_MATRIX_MAX_POINTS:
+            matrix = np.pad(np.asarray(distance_view.to_array(), dtype=np.float64), ((0, 1), (0, 1)))
+        rows = matrix.tolist() if matrix is not None else _LookupRows(distance_view)
+        neighbor_lists = self._neighbor_lists(distance_view, route, bounds, matrix)
+        if matrix is not None:
+            symmetric = bool(np.allclose(matrix, matrix.T, rtol=0.0, atol=MIN_GAIN_KM))
+        else:
+            symmetric = self._is_symmetric(rows, neighbor_lists)
+        
+        search = _RouteState(route, segment_of, bounds, rows, symmetric)
+        queue = deque(route[1:-1])
+        # The depot and the sentinel stay marked as queued, so they are never added
+        queued = [True] * (end_node + 1)
+        max_iterations = self.iterations_per_stop * len(order)
+        deadline = None if self.time_budget is None else started + self.time_budget
+        
+        iterations = 0
+        while queue and iterations < max_iterations:
+            if deadline is not None and iterations % 64 == 0 and time.perf_counter() > deadline:
+                break
+            iterations += 1
+            node = queue.popleft()
+            queued[node] = False
+            
+            touched = search.two_opt(node, neighbor_lists[node])
+            if touched:
+                self.last_report['two_opt_moves'] += 1
+            else:
+                touched = search.or_opt(node, neighbor_lists[node])
+                if touched:
+                    self.last_report['or_opt_moves'] += 1
+            
+            for other in touched:
+                if not queued[other]:
+                    queued[other] = True
+                    queue.append(other)
+        
+        self.last_report['iterations'] = iterations
+        self.last_report['gain_km'] = search.gain
+        return [node - 1 for node in search.route[1:-1]]
+    
+    def _neighbor_lists(self,
+                        distance_view: ClusterDistanceView,
+                        route: List[int],
+                        bounds: List[List[int]],
+                        matrix: Optional[np.ndarray]) -> List[List[int]]:
+        """
+        Return the nearest view indices within its segment for every stop.
+        
+        Args:
+            distance_view: Distances for this cluster
+            route: View indices in route order, with depot and sentinel
+            bounds: [start, end) positions of every segment
+            matrix: The cluster's copied distances, None when they were not copied
+        
+        Returns:
+            Neighbor view indices (nearest first) per view index
+        """
+        neighbor_lists: List[List[int]] = [[] for _ in range(len(distance_view) + 1)]
+        for start, end in bounds:
+            members = np.array(route[start:end], dtype=np.intp)
+            k = min(self.neighbors, len(members) - 1)
+            if k < 1:
+                continue
+            
+            if matrix is not None or (len(members) <= NEIGHBOR_MATRIX_MAX_POINTS
+                                      and not distance_view.context.sparse):
+                if matrix is not None:
+                    distances = matrix[np.ix_(members, members)]
+                else:
+                    distances = np.asarray(distance_view.subview(members).to_array(), dtype=np.float64)
+                np.fill_diagonal(distances, np.inf)
+                nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+                for node, row in zip(members.tolist(), members[np.take_along_axis(nearest, order, axis=1)].tolist()):
+                    neighbor_lists[node] = row
+                continue
+            
+            index = SpatialGridIndex(distance_view.context.locations[distance_view.nodes[members]])
+            for local, node in enumerate(members.tolist()):
+                neighbor_lists[node] = members[index.nearest_to_point(local, k + 1)].tolist()
+                if node in neighbor_lists[node]:
+                    neighbor_lists[node].remove(node)
+                del neighbor_lists[node][k:]
+        return neighbor_lists
+    
+    @staticmethod
+    def _is_symmetric(rows: Sequence[Sequence[float]], neighbor_lists: List[List[int]]) -> bool:
+        """Return True when every stop's neighbor distances read the same both ways."""
+        for node, neighbors in enumerate(neighbor_lists):
+            for other in neighbors:
+                if abs(rows[node][other] - rows[other][node]) > MIN_GAIN_KM:
+                    return False
+        return True
+
+
+class _LookupRows:
+    """
+    Row access to a large cluster's distances without copying them.
+    
+    Distances are read from the shared dense matrix on demand. Sparse graph
+    lookups are searches, so those are remembered: the search reads the same
+    edges many times.
+    """
+    
+    def __init__(self, distance_view: ClusterDistanceView):
+        self.context = distance_view.context
+        self.nodes = distance_view.nodes.tolist()
+        self.cache: Dict[Tuple[int, int], float] = {}
+        self._item = None if self.context.sparse else self.context.matrix.data.item
+    
+    def __getitem__(self, a: int) -> "_LookupRow":
+        return _LookupRow(self, a)
+    
+    def distance(self, a: int, b: int) -> float:
+        """Distance from view index a to view index b (0 to the end-of-route sentinel)."""
+        if b == len(self.nodes):
+            return 0.0
+        if self._item is not None:
+            return self._item(self.nodes[a], self.nodes[b])
+        key = (a, b)
+        value = self.cache.get(key)
+        if value is None:
+            rows, cols = np.array([self.nodes[a]]), np.array([self.nodes[b]])
+            value = self.cache[key] = float(self.context.lookup(rows, cols)[0])
+        return value
+
+
+class _LookupRow:
+    """One row of _LookupRows."""
+    
+    __slots__ = ("rows", "a")
+    
+    def __init__(self, rows: _LookupRows, a: int):
+        self.rows = rows
+        self.a = a
+    
+    def __getitem__(self, b: int) -> float:
+        return self.rows.distance(self.a, b)
+
+
+class _RouteState:
+    """Route under improvement: the visiting order and the position of every stop."""
+    
+    def __init__(self,
+                 route: List[int],
+                 segment_of: List[int],
+                 bounds: List[List[int]],
+                 rows: Sequence[Sequence[float]],
+                 symmetric: bool):
+        self.route = route
+        self.position = [0] * len(segment_of)
+        for position, node in enumerate(route):
+            self.position[node] = position
+        self.segment_of = segment_of
+        self.bounds = bounds
+        self.rows = rows
+        self.symmetric = symmetric
+        self.gain = 0.0
+    
+    def two_opt(self, node: int, neighbors: List[int]) -> List[int]:
+        """
+        Apply the first improving reversal that links node to one of its neighbors.
+        
+        Reversing positions i..j replaces the edges (i - 1, i) and (j, j + 1)
+        with (i - 1, j) and (i, j + 1). With node and neighbor at positions p < q
+        the new edge node-neighbor is made by reversing p + 1..q (node stays
+        before the path) or p..q - 1 (node ends the path, neighbor follows).
+        
+        Returns:
+            Nodes whose edges changed, empty when no move improves the route
+        """
+        route, rows = self.route, self.rows
+        start, end = self.bounds[self.segment_of[node]]
+        p = self.position[node]
+        for other in neighbors:
+            q = self.position[other]
+            first, last = (p, q) if p < q else (q, p)
+            for i, j in ((first + 1, last), (first, last - 1)):
+                if i < start or j >= end or j <= i:
+                    continue
+                before, a, b = route[i - 1], route[i], route[j]
+                after = route[j + 1]
+                gain = rows[before][a] + rows[b][after] - rows[before][b] - rows[a][after]
+                if gain <= MIN_GAIN_KM:
+                    continue
+                if not self.symmetric:
+                    # Directed distances: the reversed path is driven the other way
+                    gain += sum(rows[route[k]][route[k + 1]] - rows[route[k + 1]][route[k]]
+                                for k in range(i, j))
+                    if gain <= MIN_GAIN_KM:
+                        continue
+                
+                route[i:j + 1] = route[i:j + 1][::-1]
+                for k in range(i, j + 1):
+                    self.position[route[k]] = k
+                self.gain += gain
+                return [before, a, b, after]
+        return []
+    
+    def or_opt(self, node: int, neighbors: List[int]) -> List[int]:
+        """
+        Apply the first improving move of a chain starting at node next to one of its neighbors.
+        
+        Chains of 1..OR_OPT_MAX_CHAIN stops within the segment are tried, inserted
+        before or after the neighbor, in their own or reversed direction.
+        
+        Returns:
+            Nodes whose edges changed, empty when no move improves the route
+        """
+        route, rows = self.route, self.rows
+        start, end = self.bounds[self.segment_of[node]]
+        p = self.position[node]
+        for length in range(1, OR_OPT_MAX_CHAIN + 1):
+            if p + length > end:
+                break
+            head, tail = route[p], route[p + length - 1]
+            before, after = route[p - 1], route[p + length]
+            removal = rows[before][head] + rows[tail][after] - rows[before][after]
+            if removal <= MIN_GAIN_KM:
+                continue
+            inner = 0.0
+            if not self.symmetric and length > 1:
+                inner = sum(rows[route[k + 1]][route[k]] - rows[route[k]][route[k + 1]]
+                            for k in range(p, p + length - 1))
+            
+            for other in neighbors:
+                q = self.position[other]
+                if p <= q < p + length:
+                    continue
+                # Insert before position slot: between slot - 1 and slot
+                for slot in (q, q + 1):
+                    if p <= slot <= p + length:
+                        continue
+                    left, right = route[slot - 1], route[slot]
+                    added = rows[left][right]
+                    forward = rows[left][head] + rows[tail][right] - added
+                    backward = rows[left][tail] + rows[head][right] - added + inner
+                    reverse = backward < forward
+                    gain = removal - min(forward, backward)
+                    if gain <= MIN_GAIN_KM:
+                        continue
+                    
+                    self._move_chain(p, length, slot, reverse)
+                    self.gain += gain
+                    return [before, after, head, tail, left, right]
+        return []
+    
+    def _move_chain(self, p: int, length: int, slot: int, reverse: bool) -> None:
+        """Move route[p:p + length] to just before position slot, updating positions."""
+        route = self.route
+        chain = route[p:p + length]
+        if reverse:
+            chain.reverse()
+        if slot > p:
+            route[p:slot - length] = route[p + length:slot]
+            route[slot - length:slot] = chain
+            low, high = p, slot
+        else:
+            route[slot + length:p + length] = route[slot:p]
+            route[slot:slot + length] = chain
+            low, high = slot, p + length
+        for k in range(low, high):
+            self.position[route[k]] = k
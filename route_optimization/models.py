@@ -29,6 +29,7 @@ class PickupPoint:
     priority_flag: PriorityFlag
     volume: float  # Volume of waste in cubic meters
     description: Optional[str] = None
+    members: Optional[List['PickupPoint']] = None  # Reports merged into this stop
     
     def __post_init__(self):
         """Validate pickup point data."""
@@ -38,6 +39,13 @@ class PickupPoint:
             raise ValueError(f"Invalid longitude: {self.lng}")
         if self.volume < 0:
             raise ValueError(f"Volume cannot be negative: {self.volume}")
+    
+    @property
+    def member_ids(self) -> List[str]:
+        """Return the IDs of the reports this stop collects."""
+        if not self.members:
+            return [self.pickup_id]
+        return [member.pickup_id for member in self.members]
 
 
 @dataclass
@@ -123,6 +131,11 @@ class OptimizationResult:
         """Return workload balance score (lower std dev = better balance)."""
         return max(0, 1 - (self.workload_std_deviation / self.average_workload))
     
+    @property
+    def total_reports_covered(self) -> int:
+        """Return the number of reports collected (merged stops count every member)."""
+        return sum(len(stop.pickup_point.member_ids) for route in self.routes for stop in route.stops)
+    
     def get_route_by_driver(self, driver_id: str) -> Optional[OptimizedRoute]:
         """Get route for specific driver."""
         for route in self.routes:
@@ -3,7 +3,9 @@ Main route optimization engine that orchestrates clustering, routing, and optimi
 This is the primary interface for the route optimization module.
 """
 
+import time
 import numpy as np
+from functools import partial
 from typing import List, Dict, Optional, Tuple
 import statistics
 
@@ -11,9 +13,26 @@ from .models import (
     PickupPoint, Driver, RouteStop, OptimizedRoute, 
     OptimizationResult, PriorityFlag
 )
-from .distance_calculator import DistanceCalculator
+from .distance_calculator import DistanceCalculator, HAVERSINE, EQUIRECTANGULAR
+from .distance_cache import PersistentDistanceCache
+from .road_network import RoadNetworkProvider
+from .coordinate_snapping import CoordinateSnapper
+from .travel_time import TravelTimeModel
+from .distance_context import DistanceContext, ClusterDistanceView, SPARSE_MATRIX_MIN_LOCATIONS
+from .driver_registry import DriverRegistry
+from .clustering_engine import ClusteringEngine, CLUSTERING_TIME_BUDGET
 from .clustering import PickupClusterer
+from .incremental_clustering import IncrementalClustering
+from .report_aggregation import ReportAggregator
+from .zone_decomposition import ZoneDecomposer, ZoneBoundaryRepair
+from .local_search import RouteLocalSearch, LOCAL_SEARCH_TIME_BUDGET
 from .simple_route_solver import SimpleRouteSolver
+from .route_solver import RouteSolver, ORTOOLS_AVAILABLE, ORTOOLS_TIME_LIMIT, ORTOOLS_METAHEURISTIC
+from .joint_solver import JointRouteSolver, JOINT_MAX_POINTS
+from .parallel_solver import ParallelClusterSolver
+
+# Route solvers selectable by name
+ROUTE_SOLVERS = ("heuristic", "ortools", "joint")
 
 
 class RouteOptimizer:
@@ -22,23 +41,151 @@ class RouteOptimizer:
     Orchestrates clustering, route solving, and optimization.
     """
     
-    def __init__(self, google_maps_api_key: Optional[str] = None):
+    def __init__(self,
+                 google_maps_api_key: Optional[str] = None,
+                 distance_cache_path: Optional[str] = None,
+                 road_network_path: Optional[str] = None,
+                 cache_snapping: Optional[str] = None,
+                 sparse_matrix_threshold: Optional[int] = SPARSE_MATRIX_MIN_LOCATIONS,
+                 distance_matrix_dir: Optional[str] = None,
+                 speed_profile=None,
+                 distance_metric: str = HAVERSINE,
+                 driver_registry: Optional[DriverRegistry] = None,
+                 clustering_strategy: str = "auto",
+                 clustering_time_budget: Optional[float] = CLUSTERING_TIME_BUDGET,
+                 capacity_aware_clustering: bool = False,
+                 warm_start_clustering: bool = False,
+                 aggregation_radius_m: Optional[float] = None,
+                 hierarchical_zone_size: Optional[int] = None,
+                 local_search: bool = True,
+                 local_search_time_budget: Optional[float] = LOCAL_SEARCH_TIME_BUDGET,
+                 parallel_workers: Optional[int] = None,
+                 route_solver: str = "heuristic",
+                 ortools_time_limit: Optional[float] = ORTOOLS_TIME_LIMIT,
+                 ortools_solution_limit: Optional[int] = None,
+                 ortools_metaheuristic: str = ORTOOLS_METAHEURISTIC,
+                 joint_max_points: int = JOINT_MAX_POINTS):
         """
         Initialize route optimizer.
         
         Args:
             google_maps_api_key: Optional Google Maps API key for accurate distances
+            distance_cache_path: Optional SQLite file for a distance cache that persists
+                across runs and is shared by all worker processes
+            road_network_path: Optional road graph file (see RoadNetworkProvider.save)
+                for accurate offline distances
+            cache_snapping: Optional snapping of distance cache keys, 'grid:<meters>'
+                or 'geohash:<precision>' (see CoordinateSnapper for the error bound)
+            sparse_matrix_threshold: Location count above which runs keep a sparse
+                k-nearest-neighbor distance graph instead of a dense matrix
+                (None to always use the dense matrix)
+            distance_matrix_dir: Optional directory where dense matrices are stored as
+                memory-mapped float32 files and reopened by later runs (and other
+                worker processes) over the same locations
+            speed_profile: Optional travel-time speed profile by hour and road class:
+                a TravelTimeModel, a configuration dict, 'city' for the built-in
+                rush-hour profile or the path of a JSON profile (default: 25 km/h)
+            distance_metric: Straight-line metric for offline distances, 'haversine' or
+                'equirectangular' (faster; switches back to Haversine when the
+                area is too large for its error budget)
+            driver_registry: Registry of depot distances kept warm across requests
+                (default: the process-wide registry for the distance metric; none
+                for 'equirectangular', whose distances depend on the run's area)
+            clustering_strategy: 'auto', 'kmeans++', 'minibatch' or 'kmeans' (see
+                ClusteringEngine)
+            clustering_time_budget: Wall-clock seconds for repeated clustering
+                attempts (None for no limit)
+            capacity_aware_clustering: Build clusters whose volume fits each driver's
+                max_capacity, with loads balanced relative to capacity
+            warm_start_clustering: Start k-means from the previous clustering of the
+                same fleet (kept per process), placing only new or changed points
+                and re-balancing the clusters they touch
+            aggregation_radius_m: Merge reports within this many meters of each other
+                into one stop before clustering (None: every report is its own stop)
+            hierarchical_zone_size: Runs with more pickups than this are split into
+                geographic zones of at most this many pickups, optimized one at a
+                time and joined by a boundary repair (None: one flat run). Zone runs
+                keep depot distances per zone instead of in the process-wide registry.
+            local_search: Improve every constructed route with 2-opt and Or-opt
+                moves that keep the red -> yellow -> green order
+            local_search_time_budget: Wall-clock seconds of local search per route
+                (None for no limit; an iteration cap still applies)
+            parallel_workers: Solve clusters concurrently in this many worker
+                processes (0: one per CPU; None: one after another in this process)
+            route_solver: 'heuristic' (nearest neighbor plus local search),
+                'ortools' (OR-Tools search, falling back to the heuristic when
+                OR-Tools is not installed or finds no solution) or 'joint' (one
+                OR-Tools model for all drivers, started from the heuristic
+                cluster routes, which are kept when the run is too large or
+                no solution is found in time)
+            ortools_time_limit: Wall-clock seconds of OR-Tools search per route
+                (None: stop on the solution limit only); in joint mode, the
+                strict limit of the whole joint solve
+            ortools_solution_limit: Solutions OR-Tools may find per route before
+                stopping (None: stop on the time limit only)
+            ortools_metaheuristic: OR-Tools local search metaheuristic, e.g.
+                'guided_local_search', 'simulated_annealing', 'tabu_search' or
+                'greedy_descent'
+            joint_max_points: Runs (or zones) with more pickups than this are
+                routed cluster by cluster in joint mode
         """
-        self.distance_calculator = DistanceCalculator(google_maps_api_key)
-        self.clusterer = PickupClusterer(self.distance_calculator)
-        self.route_solver = SimpleRouteSolver(self.distance_calculator)
+        if route_solver not in ROUTE_SOLVERS:
+            raise ValueError(f"Unknown route solver: {route_solver} (expected one of {', '.join(ROUTE_SOLVERS)})")
+        persistent_cache = (
+            PersistentDistanceCache.open(distance_cache_path) if distance_cache_path else None
+        )
+        road_network = RoadNetworkProvider.open(road_network_path) if road_network_path else None
+        self.distance_calculator = DistanceCalculator(
+            google_maps_api_key, persistent_cache, road_network=road_network,
+            snapper=CoordinateSnapper.from_spec(cache_snapping),
+            travel_time_model=TravelTimeModel.load(speed_profile),
+            metric=distance_metric
+        )
+        self.zone_decomposer = ZoneDecomposer(hierarchical_zone_size) if hierarchical_zone_size else None
+        # The registry spans every pickup location seen, which zone runs must not
+        # depend on; equirectangular distances depend on each request's area, so
+        # rows computed for one request would not match another's matrix
+        if (driver_registry is None and self.zone_decomposer is None
+                and self.distance_calculator.metric != EQUIRECTANGULAR):
+            driver_registry = DriverRegistry.shared(self.distance_calculator)
+        self.driver_registry = driver_registry
+        self.clusterer = PickupClusterer(
+            self.distance_calculator, self.driver_registry,
+            ClusteringEngine(clustering_strategy, clustering_time_budget),
+            capacity_aware=capacity_aware_clustering,
+            incremental=IncrementalClustering.shared() if warm_start_clustering else None
+        )
+        self.aggregator = ReportAggregator(aggregation_radius_m) if aggregation_radius_m else None
+        self.boundary_repair = ZoneBoundaryRepair(self.distance_calculator)
+        route_search = RouteLocalSearch(time_budget=local_search_time_budget) if local_search else None
+        if route_solver == "ortools":
+            solver_factory = partial(RouteSolver, time_limit=ortools_time_limit,
+                                     solution_limit=ortools_solution_limit,
+                                     metaheuristic=ortools_metaheuristic, local_search=route_search)
+        else:
+            solver_factory = partial(SimpleRouteSolver, local_search=route_search)
+        self.route_solver = solver_factory(self.distance_calculator)
+        self.joint_solver = None
+        if route_solver == "joint":
+            if ORTOOLS_AVAILABLE:
+                self.joint_solver = JointRouteSolver(self.distance_calculator, ortools_time_limit,
+                                                     ortools_solution_limit, ortools_metaheuristic,
+                                                     joint_max_points)
+            else:
+                print("⚠️  OR-Tools not available, joint routing keeps the cluster routes")
+        self.parallel_solver = (
+            ParallelClusterSolver(parallel_workers, solver_factory) if parallel_workers is not None else None
+        )
+        self.sparse_matrix_threshold = sparse_matrix_threshold
+        self.distance_matrix_dir = distance_matrix_dir
     
     def optimize_routes(self,
                        pickup_points: List[PickupPoint],
                        drivers: List[Driver],
                        priority_weight: float = 0.4,
                        distance_weight: float = 0.4,
-                       balance_weight: float = 0.2) -> OptimizationResult:
+                       balance_weight: float = 0.2,
+                       departure_hour: Optional[float] = None) -> OptimizationResult:
         """
         Optimize routes for all drivers and pickup points.
         
@@ -48,6 +195,9 @@ class RouteOptimizer:
             priority_weight: Weight for priority coverage (0-1)
             distance_weight: Weight for path efficiency (0-1)
             balance_weight: Weight for workload balance (0-1)
+            departure_hour: Clock hour (e.g. 8.5 for 08:30) at which drivers leave
+                their depots; travel times use the speeds of the hours each leg
+                is driven in (default: now)
             
         Returns:
             Complete optimization result
@@ -60,6 +210,54 @@ class RouteOptimizer:
         
         print(f"🚛 Optimizing routes for {len(drivers)} drivers and {len(pickup_points)} pickup points")
         
+        if self.aggregator is not None:
+            pickup_points = self.aggregator.aggregate(pickup_points)
+            print(f"🧲 Merged near-duplicate reports: {len(pickup_points)} stops "
+                  f"({self.aggregator.last_report['merged_stops']} merged)")
+        
+        if self.zone_decomposer is not None and len(pickup_points) > self.zone_decomposer.max_points:
+            optimized_routes = self._solve_by_zone(
+                pickup_points, drivers, priority_weight, distance_weight, departure_hour
+            )
+        else:
+            optimized_routes = self._solve_routes(
+                pickup_points, drivers, priority_weight, distance_weight, departure_hour
+            )
+        
+        # Step 3: Calculate global metrics and create result
+        print("📈 Step 3: Calculating optimization metrics...")
+        result = self._create_optimization_result(
+            optimized_routes, pickup_points,
+            priority_weight, distance_weight, balance_weight
+        )
+        
+        print(f"🎯 Optimization complete:")
+        print(f"   📏 Total distance: {result.total_distance:.1f}km")
+        print(f"   ⏱️  Total time: {result.total_time:.0f} minutes")
+        print(f"   🎨 Priority coverage: {result.total_red_covered}R/{result.total_yellow_covered}Y/{result.total_green_covered}G")
+        print(f"   ⚖️  Workload balance: {result.workload_balance_score:.3f}")
+        
+        return result
+    
+    def _solve_routes(self,
+                      pickup_points: List[PickupPoint],
+                      drivers: List[Driver],
+                      priority_weight: float,
+                      distance_weight: float,
+                      departure_hour: Optional[float]) -> List[OptimizedRoute]:
+        """
+        Cluster pickups and solve one route per cluster (steps 1 and 2).
+        
+        Args:
+            pickup_points: Pickup points to route
+            drivers: Drivers to route them with
+            priority_weight: Weight for priority coverage (0-1)
+            distance_weight: Weight for path efficiency (0-1)
+            departure_hour: Clock hour at which drivers leave their depots
+        
+        Returns:
+            Optimized routes, one per non-empty cluster
+        """
         # Step 1: Cluster pickup points based on density and driver capacity
         print("📍 Step 1: Clustering pickup points...")
         clustered_points = self.clusterer.cluster_pickups(
@@ -69,23 +267,74 @@ class RouteOptimizer:
         # Analyze clustering balance
         cluster_balance = self.clusterer.analyze_cluster_balance(clustered_points)
         print(f"   ✅ Created {len(clustered_points)} clusters with balance score: {cluster_balance['balance_score']:.3f}")
+        clustering_run = self.clusterer.engine.last_run
+        if self.clusterer.capacitated is not None:
+            capacity_report = self.clusterer.capacitated.last_report
+            print(f"   ⚖️  Capacity-aware clusters: max utilization {capacity_report['max_utilization']:.0%}")
+            if capacity_report['overflow_volume'] > 0:
+                print(f"   ⚠️  {capacity_report['overflow_volume']:.1f} volume exceeds the total driver capacity")
+        elif self.clusterer.last_warm_start.get('mode') == 'incremental':
+            warm_start = self.clusterer.last_warm_start
+            print(f"   ♻️  Warm start: {warm_start['placed_points']} points placed, "
+                  f"{warm_start['removed_points']} removed, {warm_start['affected_clusters']} clusters re-balanced")
+        elif clustering_run:
+            print(f"   🔁 {clustering_run['strategy']}: {clustering_run['attempts']} attempts in "
+                  f"{clustering_run['elapsed_seconds']:.2f}s ({clustering_run['stop_reason']})")
         
         # Step 2: Solve routes for each cluster
         print("🗺️  Step 2: Solving optimal routes...")
         optimized_routes = []
         
+        # Distances between all depots and pickups are computed once per run
+        distance_context = DistanceContext(
+            self.distance_calculator, drivers, pickup_points,
+            sparse_threshold=self.sparse_matrix_threshold,
+            matrix_dir=self.distance_matrix_dir,
+            departure_hour=departure_hour,
+            driver_registry=self.driver_registry
+        )
+        if distance_context.sparse:
+            print(f"   📏 Sparse neighbor graph: {distance_context.size} locations, "
+                  f"{distance_context.graph.nnz} distances ({distance_context.nbytes / 1e6:.1f} MB)")
+        else:
+            print(f"   📏 Shared distance matrix: {distance_context.size}x{distance_context.size} locations")
+        metric_report = self.distance_calculator.metric_report
+        if metric_report is not None:
+            print(f"   📐 Metric: {metric_report['metric']} (max error vs Haversine "
+                  f"{metric_report['max_relative_error']:.3%}, budget {metric_report['error_budget']:.3%})")
+        
+        clusters = []
         for cluster_id, cluster_points in clustered_points.items():
             if cluster_id >= len(drivers):
                 print(f"   ⚠️  Skipping cluster {cluster_id} - no driver available")
                 continue
-                
             driver = drivers[cluster_id]
+            clusters.append((cluster_points, driver, distance_context.cluster_view(driver, cluster_points)))
+        
+        orders = None
+        if self.parallel_solver is not None:
+            print(f"   🧵 Solving {len(clusters)} clusters in up to {self.parallel_solver.workers} worker processes")
+            orders = self.parallel_solver.solve_orders(clusters, self.route_solver, priority_weight, distance_weight)
+        
+        if self.joint_solver is not None:
+            if self.joint_solver.fits(pickup_points):
+                clusters, orders = self._solve_jointly(
+                    pickup_points, drivers, clusters, orders, distance_context, priority_weight, distance_weight
+                )
+            else:
+                print(f"   ℹ️  {len(pickup_points)} pickups exceed the joint routing limit of "
+                      f"{self.joint_solver.max_points}, routing clusters separately")
+        
+        for index, (cluster_points, driver, distance_view) in enumerate(clusters):
             print(f"   🚗 Optimizing route for driver {driver.driver_id} ({len(cluster_points)} points)")
             
             # Solve route for this cluster
-            route_stops = self.route_solver.solve_cluster_route(
-                cluster_points, driver, priority_weight, distance_weight
-            )
+            if orders is not None:
+                route_stops = self.route_solver.create_route_stops(cluster_points, orders[index], distance_view)
+            else:
+                route_stops = self.route_solver.solve_cluster_route(
+                    cluster_points, driver, priority_weight, distance_weight, distance_view
+                )
             
             # Create optimized route object
             optimized_route = self._create_optimized_route(driver, route_stops)
@@ -95,20 +344,145 @@ class RouteOptimizer:
                   f"{optimized_route.total_stops} stops, "
                   f"{optimized_route.red_stops}R/{optimized_route.yellow_stops}Y/{optimized_route.green_stops}G")
         
-        # Step 3: Calculate global metrics and create result
-        print("📈 Step 3: Calculating optimization metrics...")
-        result = self._create_optimization_result(
-            optimized_routes, pickup_points,
-            priority_weight, distance_weight, balance_weight
+        return optimized_routes
+    
+    def _solve_jointly(self,
+                       pickup_points: List[PickupPoint],
+                       drivers: List[Driver],
+                       clusters: List[Tuple[List[PickupPoint], Driver, ClusterDistanceView]],
+                       orders: Optional[List[List[int]]],
+                       distance_context: DistanceContext,
+                       priority_weight: float,
+                       distance_weight: float) -> Tuple[list, List[List[int]]]:
+        """
+        Re-solve the cluster routes as one multi-vehicle model.
+        
+        The heuristic cluster routes seed the joint search and are returned
+        unchanged when it finds no solution within its time limit, or when
+        its solution drops a pickup the cluster routes visit. The time limit
+        also covers solving the seed routes when they are not solved yet.
+        
+        Args:
+            pickup_points: Pickup points of the run
+            drivers: Drivers of the run
+            clusters: (pickup points, driver, distance view) per cluster
+            orders: Visiting order per cluster when already solved, else None
+            distance_context: Run's shared distances
+            priority_weight: Weight for priority coverage (0-1)
+            distance_weight: Weight for path efficiency (0-1)
+        
+        Returns:
+            (clusters, orders) to build the routes from: one cluster per driver
+            with a non-empty joint route, each in visiting order
+        """
+        deadline = time.perf_counter() + self.joint_solver.time_limit
+        if orders is None:
+            orders = [
+                self.route_solver.solve_cluster_order(points, driver, priority_weight, distance_weight, view)
+                for points, driver, view in clusters
+            ]
+        seeds = {driver.driver_id: [points[i] for i in order] for (points, driver, _), order in zip(clusters, orders)}
+        
+        print(f"   🧮 Joint routing: {len(pickup_points)} pickups, {len(drivers)} drivers, "
+              f"up to {self.joint_solver.time_limit:g}s")
+        routes = self.joint_solver.solve_routes(
+            pickup_points, drivers, distance_context, [seeds.get(driver.driver_id, []) for driver in drivers],
+            deadline=deadline
         )
+        if routes is None:
+            print(f"   ⚠️  Joint routing found no solution ({self.joint_solver.last_report['status']}), "
+                  f"keeping the cluster routes")
+            return clusters, orders
+        
+        routed = {point.pickup_id for route in routes for point in route}
+        dropped = sum(1 for route in seeds.values() for point in route if point.pickup_id not in routed)
+        if dropped:
+            print(f"   ⚠️  Joint routing dropped {dropped} pickups the cluster routes visit, "
+                  f"keeping the cluster routes")
+            return clusters, orders
+        
+        joint_clusters = [
+            (route, driver, distance_context.cluster_view(driver, route))
+            for route, driver in zip(routes, drivers) if route
+        ]
+        return joint_clusters, [list(range(len(route))) for route, _, _ in joint_clusters]
+    
+    def _solve_by_zone(self,
+                       pickup_points: List[PickupPoint],
+                       drivers: List[Driver],
+                       priority_weight: float,
+                       distance_weight: float,
+                       departure_hour: Optional[float]) -> List[OptimizedRoute]:
+        """
+        Optimize zone by zone, then repair the zone boundaries.
         
-        print(f"🎯 Optimization complete:")
-        print(f"   📏 Total distance: {result.total_distance:.1f}km")
-        print(f"   ⏱️  Total time: {result.total_time:.0f} minutes")
-        print(f"   🎨 Priority coverage: {result.total_red_covered}R/{result.total_yellow_covered}Y/{result.total_green_covered}G")
-        print(f"   ⚖️  Workload balance: {result.workload_balance_score:.3f}")
+        Only one zone's distances are held at a time, so memory and time per
+        step depend on the zone size rather than the city size.
         
-        return result
+        Args:
+            pickup_points: Pickup points to route
+            drivers: Drivers to route them with
+            priority_weight: Weight for priority coverage (0-1)
+            distance_weight: Weight for path efficiency (0-1)
+            departure_hour: Clock hour at which drivers leave their depots
+        
+        Returns:
+            Optimized routes of all zones
+        """
+        zones = self.zone_decomposer.decompose(pickup_points, drivers)
+        print(f"🧩 Hierarchical mode: {len(zones)} zones of up to {self.zone_decomposer.max_points} points")
+        
+        zone_routes = []
+        for zone in zones:
+            print(f"🧩 Zone {zone.zone_id}: {len(zone.drivers)} drivers, {len(zone.pickup_points)} points")
+            zone_routes.append(self._solve_routes(
+                zone.pickup_points, zone.drivers, priority_weight, distance_weight, departure_hour
+            ))
+        
+        # Boundary repair: only the changed routes are rebuilt
+        changed = self.boundary_repair.repair(zones, zone_routes)
+        for (zone_index, route_index), order in changed.items():
+            driver = zone_routes[zone_index][route_index].driver
+            zone_routes[zone_index][route_index] = self._route_from_order(driver, order, departure_hour)
+        print(f"   🩹 Boundary repair moved {self.boundary_repair.moved} pickups between neighboring zones")
+        
+        return [route for routes in zone_routes for route in routes]
+    
+    def _route_from_order(self,
+                          driver: Driver,
+                          pickup_points: List[PickupPoint],
+                          departure_hour: Optional[float]) -> OptimizedRoute:
+        """
+        Build a route that visits pickups in the given order.
+        
+        Legs are priced like the legs of solved routes: through the road API
+        when one is configured, otherwise with the offline metric.
+        
+        Args:
+            driver: Driver of the route
+            pickup_points: Pickups in visiting order
+            departure_hour: Clock hour at which the driver leaves the depot
+        
+        Returns:
+            Optimized route object
+        """
+        if not pickup_points:
+            return self._create_optimized_route(driver, [])
+        
+        locations = [(driver.base_lat, driver.base_lng)] + [(p.lat, p.lng) for p in pickup_points]
+        if self.distance_calculator.matrix_client is not None:
+            legs = self.distance_calculator.road_distances([
+                (a[0], a[1], b[0], b[1]) for a, b in zip(locations[:-1], locations[1:])
+            ])
+        else:
+            legs = self.distance_calculator.offline_pair_distances(locations[:-1], locations[1:]).tolist()
+        times = self.distance_calculator.travel_time_model.route_times(legs, departure_hour).tolist()
+        
+        route_stops = [
+            RouteStop(pickup_point=point, order=order, distance_from_previous=distance, estimated_time=travel_time)
+            for order, (point, distance, travel_time) in enumerate(zip(pickup_points, legs, times))
+        ]
+        return self._create_optimized_route(driver, route_stops)
     
     def _validate_inputs(self,
                         pickup_points: List[PickupPoint],
@@ -347,23 +721,28 @@ class RouteOptimizer:
                 'stops': []
             }
             
-            # Add detailed stop information
+            # Add detailed stop information; merged stops expand to one entry per
+            # member report, all at the stop's place in the route
             for stop in route.stops:
-                stop_data = {
-                    'stop_number': stop.order + 1,
-                    'pickup_id': stop.pickup_point.pickup_id,
-                    'location': {
-                        'lat': stop.pickup_point.lat,
-                        'lng': stop.pickup_point.lng
-                    },
-                    'priority': stop.pickup_point.priority_flag.value,
-                    'volume_m3': stop.pickup_point.volume,
-                    'description': stop.pickup_point.description,
-                    'distance_from_previous_km': round(stop.distance_from_previous, 2),
-                    'estimated_travel_time_minutes': round(stop.estimated_time, 0),
-                    'navigation_url': self._generate_navigation_url(stop.pickup_point)
-                }
-                driver_data['stops'].append(stop_data)
+                reports = stop.pickup_point.members or [stop.pickup_point]
+                for position, report in enumerate(reports):
+                    stop_data = {
+                        'stop_number': len(driver_data['stops']) + 1,
+                        'pickup_id': report.pickup_id,
+                        'location': {
+                            'lat': report.lat,
+                            'lng': report.lng
+                        },
+                        'priority': report.priority_flag.value,
+                        'volume_m3': report.volume,
+                        'description': report.description,
+                        'distance_from_previous_km': round(stop.distance_from_previous, 2) if position == 0 else 0.0,
+                        'estimated_travel_time_minutes': round(stop.estimated_time, 0) if position == 0 else 0.0,
+                        'navigation_url': self._generate_navigation_url(stop.pickup_point)
+                    }
+                    if stop.pickup_point.members:
+                        stop_data['merged_stop_id'] = stop.pickup_point.pickup_id
+                    driver_data['stops'].append(stop_data)
             
             export_data[route.driver.driver_id] = driver_data
         
@@ -390,6 +769,9 @@ class RouteOptimizer:
         if not pickup_points or not drivers:
             return {}
         
+        if self.aggregator is not None:
+            pickup_points = self.aggregator.aggregate(pickup_points)
+        
         # Use clustering to suggest assignments
         clustered_points = self.clusterer.cluster_pickups(
             pickup_points, drivers, balance_workload=True
@@ -399,7 +781,7 @@ class RouteOptimizer:
         for cluster_id, cluster_points in clustered_points.items():
             if cluster_id < len(drivers):
                 driver_id = drivers[cluster_id].driver_id
-                pickup_ids = [point.pickup_id for point in cluster_points]
+                pickup_ids = [pickup_id for point in cluster_points for pickup_id in point.member_ids]
                 assignments[driver_id] = pickup_ids
         
         return assignments
@@ -0,0 +1,150 @@
+"""
+Process-pool route solving for the clusters of a run.
+Clusters are independent once the distances are known, so each one is sent
+to a worker process as a few flat arrays (its block of the run's distance
+matrix and the coordinates, priorities and volumes of its points) and only
+the visiting order comes back.
+"""
+
+import os
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .models import PickupPoint, Driver, PriorityFlag
+from .distance_calculator import DistanceCalculator
+from .distance_context import DistanceContext, ClusterDistanceView
+from .travel_time import TravelTimeModel
+from .simple_route_solver import SimpleRouteSolver
+
+# Clusters larger than this are solved in the calling process: their
+# distance block (n^2 float32) would cost more to ship than to keep local
+PARALLEL_MAX_CLUSTER_POINTS = 3000
+
+# Priority flags by the int8 code used in shipped clusters
+PRIORITY_CODES = list(PriorityFlag)
+
+# (locations, distances, priority codes, volumes, driver id, driver capacity)
+# of one cluster; index 0 of locations and distances is the depot
+PackedCluster = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, str, float]
+
+# Builds a route solver from a distance calculator (a solver class, or a
+# functools.partial of one carrying its settings); must be picklable
+SolverFactory = Callable[[DistanceCalculator], object]
+
+# Solver of the current worker process, built once by _init_worker
+_worker_solver = None
+_worker_weights: Tuple[float, float] = (0.4, 0.6)
+
+
+def _init_worker(solver_factory: SolverFactory,
+                 priority_weight: float,
+                 distance_weight: float) -> None:
+    """Build the worker's route solver (runs once in every worker process)."""
+    global _worker_solver, _worker_weights
+    _worker_solver = solver_factory(DistanceCalculator(travel_time_model=TravelTimeModel.constant()))
+    _worker_weights = (priority_weight, distance_weight)
+
+
+def _solve_packed(cluster: PackedCluster) -> np.ndarray:
+    """Solve one shipped cluster in a worker; returns the visiting order as int32 indices."""
+    locations, distances, codes, volumes, driver_id, max_capacity = cluster
+    points = [
+        PickupPoint(str(i), lat, lng, PRIORITY_CODES[code], volume)
+        for i, ((lat, lng), code, volume) in enumerate(zip(locations[1:].tolist(), codes.tolist(), volumes.tolist()))
+    ]
+    driver = Driver(driver_id, float(locations[0, 0]), float(locations[0, 1]), max_capacity)
+    context = DistanceContext.from_matrix(_worker_solver.distance_calculator, locations, distances)
+    view = ClusterDistanceView(context, np.arange(len(locations), dtype=np.intp))
+    order = _worker_solver.solve_cluster_order(points, driver, *_worker_weights, view)
+    return np.asarray(order, dtype=np.int32)
+
+
+class ParallelClusterSolver:
+    """
+    Solves the routes of a run's clusters concurrently in a process pool.
+    
+    A pool is started per run and shut down afterwards, so no worker outlives
+    the request. Clusters are sent as NumPy arrays, which pickle as raw
+    buffers, rather than as PickupPoint objects; workers rebuild throwaway
+    points and the driver (with its capacity) from them and send back only
+    the visiting order. Leg distances and times are then filled in by the
+    calling process, through the run's own distance context (and road API,
+    when configured). Orders come back in the order the clusters were given.
+    """
+    
+    def __init__(self,
+                 workers: Optional[int] = None,
+                 solver_factory: SolverFactory = SimpleRouteSolver,
+                 max_cluster_points: int = PARALLEL_MAX_CLUSTER_POINTS):
+        """
+        Initialize parallel solver.
+        
+        Args:
+            workers: Worker processes, at most one per CPU (None or 0: one per CPU)
+            solver_factory: Builds the route solver of every worker, configured
+                like the calling process's solver
+            max_cluster_points: Clusters above this size stay in the calling process
+        """
+        if workers is not None and workers < 0:
+            raise ValueError(f"Worker count cannot be negative: {workers}")
+        cpus = os.cpu_count() or 1
+        # More processes than CPUs only add fork and memory cost
+        self.workers = min(workers, cpus) if workers else cpus
+        self.solver_factory = solver_factory
+        self.max_cluster_points = max_cluster_points
+    
+    @staticmethod
+    def pack(pickup_points: List[PickupPoint], driver: Driver, distance_view: ClusterDistanceView) -> PackedCluster:
+        """Flatten a cluster and its distances into the arrays shipped to a worker."""
+        return (
+            distance_view.context.locations[distance_view.nodes],
+            np.asarray(distance_view.to_array(), dtype=np.float32),
+            np.array([PRIORITY_CODES.index(point.priority_flag) for point in pickup_points], dtype=np.int8),
+            np.array([point.volume for point in pickup_points], dtype=np.float64),
+            driver.driver_id,
+            float(driver.max_capacity)
+        )
+    
+    def solve_orders(self,
+                     clusters: Sequence[Tuple[List[PickupPoint], Driver, ClusterDistanceView]],
+                     route_solver,
+                     priority_weight: float,
+                     distance_weight: float) -> List[List[int]]:
+        """
+        Solve the visiting order of every cluster.
+        
+        Args:
+            clusters: (pickup points, driver, distance view) per cluster
+            route_solver: Solver used in this process for clusters too large to ship
+            priority_weight: Weight for priority optimization (0-1)
+            distance_weight: Weight for distance optimization (0-1)
+        
+        Returns:
+            Indices into each cluster's pickup points in route order, in the
+            order of clusters
+        """
+        shipped = [i for i, (points, _, _) in enumerate(clusters) if len(points) <= self.max_cluster_points]
+        orders: List[Optional[List[int]]] = [None] * len(clusters)
+        
+        if len(shipped) > 1 and self.workers > 1:
+            workers = min(self.workers, len(shipped))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.solver_factory, priority_weight, distance_weight)) as pool:
+                # Clusters are packed just before they are needed, so only a few
+                # distance blocks exist at a time
+                pending = deque()
+                for i in shipped:
+                    points, driver, view = clusters[i]
+                    pending.append((i, pool.submit(_solve_packed, self.pack(points, driver, view))))
+                    if len(pending) >= 2 * workers:
+                        done, future = pending.popleft()
+                        orders[done] = future.result().tolist()
+                for done, future in pending:
+                    orders[done] = future.result().tolist()
+        
+        for i, (points, driver, view) in enumerate(clusters):
+            if orders[i] is None:
+                orders[i] = route_solver.solve_cluster_order(points, driver, priority_weight, distance_weight, view)
+        return orders
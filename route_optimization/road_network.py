@@ -0,0 +1,317 @@
+"""
+Offline road-network distance provider.
+Answers many-to-many shortest-path queries on a local road graph so accurate
+distance matrices need no network access and have no per-request cost.
+"""
+
+import hashlib
+import os
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+# Kilometers per degree of latitude
+KM_PER_DEGREE = 111.32
+
+# Upper bound on shortest-path distances held in memory at once (floats)
+DIJKSTRA_BATCH_CELLS = 20_000_000
+
+
+class RoadNetworkProvider:
+    """
+    Shortest-path distances on a preprocessed road graph.
+    
+    The graph is stored as CSR arrays (indptr, indices, weights in km) plus
+    node coordinates, in a compact .npz file. Query points are snapped to the
+    nearest graph node; the snap offsets are added to the network distance.
+    Points farther than max_snap_km from the network, and unreachable pairs,
+    are reported as NaN so callers can fall back to another metric.
+    """
+    
+    name = "road_network"
+    
+    _instances: Dict[Tuple[int, str], "RoadNetworkProvider"] = {}
+    _instances_lock = threading.Lock()
+    
+    def __init__(self,
+                 node_coords: np.ndarray,
+                 indptr: np.ndarray,
+                 indices: np.ndarray,
+                 weights: np.ndarray,
+                 max_snap_km: float = 0.5,
+                 snap_factor: float = 1.3,
+                 search_radius_km: Optional[float] = None):
+        """
+        Initialize road network provider.
+        
+        Args:
+            node_coords: (n, 2) array of node (lat, lng)
+            indptr: CSR row pointer of the directed adjacency, length n + 1
+            indices: CSR column indices (edge targets)
+            weights: Edge lengths in kilometers
+            max_snap_km: Largest distance between a query point and its nearest node
+            snap_factor: Road factor applied to the straight snap offsets
+            search_radius_km: Optional bound on each Dijkstra search; farther pairs
+                are reported as unknown, which keeps city-wide graphs fast
+        """
+        self.node_coords = np.asarray(node_coords, dtype=np.float64).reshape(-1, 2)
+        n_nodes = len(self.node_coords)
+        self.graph = csr_matrix(
+            (np.asarray(weights, dtype=np.float64),
+             np.asarray(indices, dtype=np.int32),
+             np.asarray(indptr, dtype=np.int32)),
+            shape=(n_nodes, n_nodes)
+        )
+        self.max_snap_km = max_snap_km
+        self.snap_factor = snap_factor
+        self.search_radius_km = search_radius_km
+        self._fingerprint: Optional[str] = None
+        
+        # Local equirectangular projection so KD-tree distances are in km
+        self._ref_lat = float(np.radians(self.node_coords[:, 0].mean())) if n_nodes else 0.0
+        self._tree = cKDTree(self._project(self.node_coords)) if n_nodes else None
+    
+    @classmethod
+    def from_edges(cls,
+                   node_coords: np.ndarray,
+                   sources: Sequence[int],
+                   targets: Sequence[int],
+                   lengths_km: Sequence[float],
+                   oneway: Optional[Sequence[bool]] = None,
+                   **kwargs) -> "RoadNetworkProvider":
+        """
+        Build a provider from an edge list (e.g. a preprocessed OSM extract).
+        
+        Args:
+            node_coords: (n, 2) array of node (lat, lng)
+            sources: Edge start node per edge
+            targets: Edge end node per edge
+            lengths_km: Edge length in kilometers per edge
+            oneway: Per-edge flag; two-way edges are added in both directions
+            **kwargs: Passed to the constructor
+        
+        Returns:
+            Road network provider
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        lengths = np.asarray(lengths_km, dtype=np.float64)
+        two_way = np.ones(len(sources), dtype=bool) if oneway is None else ~np.asarray(oneway, dtype=bool)
+        
+        rows = np.concatenate((sources, targets[two_way]))
+        cols = np.concatenate((targets, sources[two_way]))
+        data = np.concatenate((lengths, lengths[two_way]))
+        
+        n_nodes = len(node_coords)
+        # Parallel edges keep the shortest length
+        order = np.lexsort((data, cols, rows))
+        rows, cols, data = rows[order], cols[order], data[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        graph = csr_matrix((data[first], (rows[first], cols[first])), shape=(n_nodes, n_nodes))
+        
+        return cls(node_coords, graph.indptr, graph.indices, graph.data, **kwargs)
+    
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "RoadNetworkProvider":
+        """
+        Load a graph saved with save().
+        
+        Args:
+            path: .npz graph file
+            **kwargs: Passed to the constructor
+        
+        Returns:
+            Road network provider
+        """
+        with np.load(path) as data:
+            return cls(data['node_coords'], data['indptr'], data['indices'], data['weights'], **kwargs)
+    
+    @classmethod
+    def open(cls, path: str) -> "RoadNetworkProvider":
+        """Load a graph once per process and reuse it for later calls."""
+        key = (os.getpid(), os.path.abspath(path))
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls.load(path)
+            return cls._instances[key]
+    
+    def save(self, path: str) -> None:
+        """
+        Save the graph in the compact binary format read by load().
+        
+        Args:
+            path: Destination .npz file
+        """
+        np.savez_compressed(
+            path,
+            node_coords=self.node_coords,
+            indptr=self.graph.indptr.astype(np.int32),
+            indices=self.graph.indices.astype(np.int32),
+            weights=self.graph.data.astype(np.float32)
+        )
+    
+    @property
+    def node_count(self) -> int:
+        """Return number of graph nodes."""
+        return len(self.node_coords)
+    
+    @property
+    def fingerprint(self) -> str:
+        """Return a digest of the graph and query settings, for keying derived data."""
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for array in (self.node_coords, self.graph.indptr, self.graph.indices, self.graph.data):
+                digest.update(np.ascontiguousarray(array).tobytes())
+            digest.update(repr((self.max_snap_km, self.snap_factor, self.search_radius_km)).encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+    
+    def _project(self, coords: np.ndarray) -> np.ndarray:
+        """Project (lat, lng) degrees to local planar kilometers."""
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        return np.column_stack((
+            coords[:, 0] * KM_PER_DEGREE,
+            coords[:, 1] * KM_PER_DEGREE * np.cos(self._ref_lat)
+        ))
+    
+    def snap(self, points: Sequence[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Snap points to their nearest graph node.
+        
+        Args:
+            points: Sequence of (lat, lng)
+        
+        Returns:
+            (node index per point or -1 if too far, snap offset in km per point)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self._tree is None or len(points) == 0:
+            return np.full(len(points), -1, dtype=np.int64), np.full(len(points), np.inf)
+        
+        offsets, nodes = self._tree.query(self._project(points))
+        nodes = np.where(offsets <= self.max_snap_km, nodes, -1).astype(np.int64)
+        return nodes, offsets * self.snap_factor
+    
+    def _node_distances(self, source_nodes: np.ndarray, target_nodes: np.ndarray) -> np.ndarray:
+        """
+        Shortest-path distances from every source node to every target node.
+        
+        Dijkstra runs from all unique sources in batches sized so the full-graph
+        distance rows held at once stay bounded.
+        """
+        result = np.full((len(source_nodes), len(target_nodes)), np.nan, dtype=np.float64)
+        valid_sources = np.flatnonzero(source_nodes >= 0)
+        valid_targets = np.flatnonzero(target_nodes >= 0)
+        if len(valid_sources) == 0 or len(valid_targets) == 0:
+            return result
+        
+        unique_sources, source_rows = np.unique(source_nodes[valid_sources], return_inverse=True)
+        target_cols = target_nodes[valid_targets]
+        batch = max(1, DIJKSTRA_BATCH_CELLS // max(self.node_count, 1))
+        
+        paths = np.empty((len(unique_sources), len(target_cols)), dtype=np.float64)
+        for start in range(0, len(unique_sources), batch):
+            rows = dijkstra(self.graph, directed=True, indices=unique_sources[start:start + batch],
+                            limit=self.search_radius_km or np.inf)
+            paths[start:start + batch] = np.atleast_2d(rows)[:, target_cols]
+        
+        paths[np.isinf(paths)] = np.nan
+        result[np.ix_(valid_sources, valid_targets)] = paths[source_rows]
+        return result
+    
+    def distance_matrix(self,
+                        origins: Sequence[Tuple[float, float]],
+                        destinations: Optional[Sequence[Tuple[float, float]]] = None) -> np.ndarray:
+        """
+        Calculate road distances between all origins and destinations.
+        
+        Args:
+            origins: Sequence of (lat, lng) origin points
+            destinations: Sequence of (lat, lng) destination points, defaults to origins
+        
+        Returns:
+            (len(origins), len(destinations)) array in kilometers, NaN where unknown
+        """
+        origin_nodes, origin_offsets = self.snap(origins)
+        if destinations is None or destinations is origins:
+            dest_nodes, dest_offsets = origin_nodes, origin_offsets
+        else:
+            dest_nodes, dest_offsets = self.snap(destinations)
+        
+        matrix = self._node_distances(origin_nodes, dest_nodes)
+        matrix += origin_offsets[:, None]
+        matrix += dest_offsets[None, :]
+        
+        # Points snapped to the same node are not connected through the network
+        same_node = (origin_nodes[:, None] == dest_nodes[None, :]) & (origin_nodes[:, None] >= 0)
+        if same_node.any():
+            rows, cols = np.nonzero(same_node)
+            origin_xy = self._project(np.asarray(origins, dtype=np.float64).reshape(-1, 2)[rows])
+            dest_xy = self._project(np.asarray(
+                origins if destinations is None else destinations, dtype=np.float64
+            ).reshape(-1, 2)[cols])
+            direct = np.hypot(*(origin_xy - dest_xy).T) * self.snap_factor
+            matrix[rows, cols] = np.minimum(matrix[rows, cols], direct)
+        
+        return matrix
+    
+    def pair_distances(self, pairs: List[Tuple[float, float, float, float]]) -> np.ndarray:
+        """
+        Calculate road distances for independent origin-destination pairs.
+        
+        Args:
+            pairs: List of (lat1, lng1, lat2, lng2) tuples
+        
+        Returns:
+            Distance in kilometers per pair, NaN where unknown
+        """
+        if not len(pairs):
+            return np.empty(0, dtype=np.float64)
+        
+        pairs_array = np.asarray(pairs, dtype=np.float64).reshape(-1, 4)
+        origin_nodes, origin_offsets = self.snap(pairs_array[:, :2])
+        dest_nodes, dest_offsets = self.snap(pairs_array[:, 2:])
+        
+        distances = self._node_pair_distances(origin_nodes, dest_nodes)
+        distances += origin_offsets + dest_offsets
+        
+        # Points snapped to the same node are not connected through the network
+        same_node = np.flatnonzero((origin_nodes == dest_nodes) & (origin_nodes >= 0))
+        if len(same_node):
+            offsets = self._project(pairs_array[same_node, :2]) - self._project(pairs_array[same_node, 2:])
+            direct = np.hypot(offsets[:, 0], offsets[:, 1]) * self.snap_factor
+            distances[same_node] = np.minimum(distances[same_node], direct)
+        
+        return distances
+    
+    def _node_pair_distances(self, source_nodes: np.ndarray, target_nodes: np.ndarray) -> np.ndarray:
+        """
+        Shortest-path distance for each (source node, target node) pair.
+        
+        Unlike _node_distances only the requested pairs are kept, so memory
+        stays linear in the number of pairs.
+        """
+        result = np.full(len(source_nodes), np.nan, dtype=np.float64)
+        valid = np.flatnonzero((source_nodes >= 0) & (target_nodes >= 0))
+        if len(valid) == 0:
+            return result
+        
+        unique_sources, source_rank = np.unique(source_nodes[valid], return_inverse=True)
+        by_source = np.argsort(source_rank, kind='stable')
+        sorted_rank = source_rank[by_source]
+        batch = max(1, DIJKSTRA_BATCH_CELLS // max(self.node_count, 1))
+        
+        for start in range(0, len(unique_sources), batch):
+            rows = np.atleast_2d(dijkstra(self.graph, directed=True,
+                                          indices=unique_sources[start:start + batch],
+                                          limit=self.search_radius_km or np.inf))
+            lo, hi = np.searchsorted(sorted_rank, [start, start + batch])
+            selected = valid[by_source[lo:hi]]
+            result[selected] = rows[sorted_rank[lo:hi] - start, target_nodes[selected]]
+        
+        result[np.isinf(result)] = np.nan
+        return result
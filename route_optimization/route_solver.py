@@ -9,6 +9,7 @@ from typing import List, Dict, Optional, Tuple
 
 from .models import PickupPoint, Driver, RouteStop, PriorityFlag
 from .distance_calculator import DistanceCalculator
+from .distance_context import DistanceContext, ClusterDistanceView
 
 # Try to import OR-Tools, fall back to heuristic solver if unavailable
 ORTOOLS_AVAILABLE = False
@@ -32,28 +33,71 @@ except ImportError:
 
 # Always import fallback solver as backup
 from .fallback_solver import FallbackRouteSolver
+from .local_search import RouteLocalSearch
+
+# Wall-clock seconds OR-Tools searches per cluster (guided local search only
+# stops at a limit, so every cluster takes about this long)
+ORTOOLS_TIME_LIMIT = 2.0
+
+# Local search metaheuristic run after the first solution
+ORTOOLS_METAHEURISTIC = "guided_local_search"
+
+# Distances are passed to OR-Tools as integer meters
+DISTANCE_SCALE = 1000
+
+# Volumes are passed to OR-Tools as integer hundredths of a cubic meter
+VOLUME_SCALE = 100
 
 
 class RouteSolver:
     """Solves Vehicle Routing Problem with priority and capacity constraints."""
     
-    def __init__(self, distance_calculator: DistanceCalculator):
+    def __init__(self,
+                 distance_calculator: DistanceCalculator,
+                 time_limit: Optional[float] = ORTOOLS_TIME_LIMIT,
+                 solution_limit: Optional[int] = None,
+                 metaheuristic: str = ORTOOLS_METAHEURISTIC,
+                 local_search: Optional[RouteLocalSearch] = None,
+                 heuristic_start: bool = True):
         """
         Initialize route solver.
         
         Args:
             distance_calculator: Distance calculation utility
+            time_limit: Seconds OR-Tools searches per cluster (None: no time
+                limit, only allowed together with a solution limit)
+            solution_limit: Stop after this many improving solutions (None: no limit)
+            metaheuristic: OR-Tools local search metaheuristic: 'guided_local_search',
+                'simulated_annealing', 'tabu_search', 'generic_tabu_search',
+                'greedy_descent' or 'automatic'
+            local_search: Optional improvement stage of the fallback heuristic
+            heuristic_start: Start the OR-Tools search from the fallback
+                heuristic's route instead of a cheapest-arc first solution
         """
+        if time_limit is None and solution_limit is None:
+            raise ValueError("OR-Tools needs a time limit or a solution limit")
+        if time_limit is not None and time_limit <= 0:
+            raise ValueError(f"OR-Tools time limit must be positive: {time_limit}")
+        if solution_limit is not None and solution_limit < 1:
+            raise ValueError(f"OR-Tools solution limit must be at least 1: {solution_limit}")
         self.distance_calculator = distance_calculator
+        self.time_limit = time_limit
+        self.solution_limit = solution_limit
+        self.metaheuristic = metaheuristic.lower()
+        self.heuristic_start = heuristic_start
+        if ORTOOLS_AVAILABLE:
+            # Fails early on an unknown name instead of at the first cluster
+            self._metaheuristic_value()
         
         # Always initialize fallback solver as backup
-        self.fallback_solver = FallbackRouteSolver(distance_calculator)
+        self.fallback_solver = FallbackRouteSolver(distance_calculator, local_search)
     
     def solve_cluster_route(self, 
                            pickup_points: List[PickupPoint], 
                            driver: Driver,
                            priority_weight: float = 0.4,
-                           distance_weight: float = 0.6) -> List[RouteStop]:
+                           distance_weight: float = 0.6,
+                           distance_view: Optional[ClusterDistanceView] = None) -> List[RouteStop]:
         """
         Solve optimal route for a single cluster assigned to one driver.
         
@@ -62,6 +106,8 @@ class RouteSolver:
             driver: Driver assigned to this cluster
             priority_weight: Weight for priority optimization (0-1)
             distance_weight: Weight for distance optimization (0-1)
+            distance_view: Distances for this cluster from the run's shared context
+                (local index 0 is the depot, i + 1 is pickup_points[i])
             
         Returns:
             Ordered list of route stops
@@ -69,121 +115,149 @@ class RouteSolver:
         # Use fallback solver if OR-Tools is not available
         if not ORTOOLS_AVAILABLE:
             return self.fallback_solver.solve_cluster_route(
-                pickup_points, driver, priority_weight, distance_weight
+                pickup_points, driver, priority_weight, distance_weight, distance_view
             )
         
         if not pickup_points:
             return []
         
-        if len(pickup_points) == 1:
-            # Single point - simple case
-            distance = self.distance_calculator.road_distance(
-                driver.base_lat, driver.base_lng,
-                pickup_points[0].lat, pickup_points[0].lng
+        if distance_view is None:
+            distance_view = DistanceContext.for_cluster(self.distance_calculator, driver, pickup_points)
+        
+        route_indices = self.solve_cluster_order(pickup_points, driver, priority_weight, distance_weight,
+                                                 distance_view)
+        return self.create_route_stops(pickup_points, route_indices, distance_view)
+    
+    def solve_cluster_order(self,
+                            pickup_points: List[PickupPoint],
+                            driver: Driver,
+                            priority_weight: float,
+                            distance_weight: float,
+                            distance_view: ClusterDistanceView) -> List[int]:
+        """
+        Solve the visiting order of a cluster without building route stops.
+        
+        Args:
+            pickup_points: List of pickup points in the cluster
+            driver: Driver assigned to this cluster
+            priority_weight: Weight for priority optimization (0-1)
+            distance_weight: Weight for distance optimization (0-1)
+            distance_view: Distances for this cluster
+        
+        Returns:
+            Indices into pickup_points in route order; when OR-Tools drops a
+            pickup (e.g. the cluster exceeds the driver's capacity) the
+            heuristic route, which visits every pickup, is returned instead
+        """
+        if not ORTOOLS_AVAILABLE:
+            return self.fallback_solver.solve_cluster_order(
+                pickup_points, driver, priority_weight, distance_weight, distance_view
             )
-            return [RouteStop(
-                pickup_point=pickup_points[0],
-                order=0,
-                distance_from_previous=distance,
-                estimated_time=self.distance_calculator.estimate_travel_time(distance)
-            )]
+        
+        if len(pickup_points) <= 1:
+            # Single point - simple case
+            return list(range(len(pickup_points)))
+        
+        # One dense copy of the cluster's distances serves the sort and the model
+        distances = distance_view.to_array()
         
         # Sort points by priority first, then optimize within priority groups
-        priority_sorted_points = self._sort_by_priority(pickup_points)
+        sorted_order = self._sort_by_priority(pickup_points, distances)
+        priority_sorted_points = [pickup_points[i] for i in sorted_order]
+        
+        # Reorder the matrix to match the sorted points (depot stays at index 0)
+        nodes = [0] + [i + 1 for i in sorted_order]
+        sorted_distances = distances[np.ix_(nodes, nodes)]
+        
+        heuristic_order = None
+        initial_route = None
+        if self.heuristic_start:
+            # The heuristic route seeds the search, as nodes of the sorted matrix
+            heuristic_order = self.fallback_solver.solve_cluster_order(
+                pickup_points, driver, priority_weight, distance_weight, distance_view
+            )
+            sorted_nodes = {point_index: node for node, point_index in enumerate(sorted_order, start=1)}
+            initial_route = [sorted_nodes[i] for i in heuristic_order]
         
         try:
             # Create VRP model
-            route_indices = self._solve_vrp(priority_sorted_points, driver, distance_weight)
+            route_indices = self._solve_vrp(priority_sorted_points, driver, distance_weight, sorted_distances,
+                                            initial_route)
             
-            # Convert indices to RouteStop objects
-            return self._create_route_stops(priority_sorted_points, route_indices, driver)
+            dropped = len(pickup_points) - len(route_indices)
+            if not dropped:
+                # Map sorted indices back to the caller's points
+                return [sorted_order[i] for i in route_indices]
+            # Skip penalties let OR-Tools drop pickups the driver cannot carry;
+            # the heuristic route visits them all
+            print(f"⚠️  OR-Tools dropped {dropped} of {len(pickup_points)} pickups for driver "
+                  f"{driver.driver_id}. Using fallback solver.")
         except Exception as e:
             print(f"⚠️  OR-Tools solver failed: {e}. Using fallback solver.")
-            # Fall back to heuristic solver
-            fallback_solver = FallbackRouteSolver(self.distance_calculator)
-            return fallback_solver.solve_cluster_route(
-                pickup_points, driver, priority_weight, distance_weight
-            )
+        
+        if heuristic_order is not None:
+            return heuristic_order
+        # Fall back to heuristic solver
+        return self.fallback_solver.solve_cluster_order(
+            pickup_points, driver, priority_weight, distance_weight, distance_view
+        )
     
-    def _sort_by_priority(self, pickup_points: List[PickupPoint]) -> List[PickupPoint]:
+    def _sort_by_priority(self, pickup_points: List[PickupPoint], distances: np.ndarray) -> List[int]:
         """
         Sort pickup points by priority (red > yellow > green).
         Within same priority, maintain geographic clustering.
         
         Args:
             pickup_points: List of pickup points to sort
+            distances: Cluster distances, depot at index 0 and pickup_points[i] at i + 1
             
         Returns:
-            Priority-sorted list of pickup points
+            Indices into pickup_points in priority order
         """
-        # Group by priority
-        red_points = [p for p in pickup_points if p.priority_flag == PriorityFlag.RED]
-        yellow_points = [p for p in pickup_points if p.priority_flag == PriorityFlag.YELLOW]
-        green_points = [p for p in pickup_points if p.priority_flag == PriorityFlag.GREEN]
-        
-        # Sort each group geographically to maintain spatial coherence
-        red_points = self._sort_geographically(red_points)
-        yellow_points = self._sort_geographically(yellow_points)
-        green_points = self._sort_geographically(green_points)
-        
-        # Combine in priority order
-        return red_points + yellow_points + green_points
+        order = []
+        for flag in (PriorityFlag.RED, PriorityFlag.YELLOW, PriorityFlag.GREEN):
+            group = [i for i, point in enumerate(pickup_points) if point.priority_flag == flag]
+            # Sort each group geographically to maintain spatial coherence
+            order.extend(self._sort_geographically(group, distances))
+        return order
     
-    def _sort_geographically(self, points: List[PickupPoint]) -> List[PickupPoint]:
+    def _sort_geographically(self, group: List[int], distances: np.ndarray) -> List[int]:
         """
         Sort points geographically using nearest neighbor heuristic.
         
         Args:
-            points: List of pickup points to sort
+            group: Indices of the points to sort (row i + 1 of distances)
+            distances: Cluster distances, depot at index 0
             
         Returns:
-            Geographically sorted points
+            Group indices in nearest-neighbor order
         """
-        if len(points) <= 1:
-            return points
-        
-        # Start from centroid point
-        centroid_lat = sum(p.lat for p in points) / len(points)
-        centroid_lng = sum(p.lng for p in points) / len(points)
-        
-        # Find nearest point to centroid as starting point
-        min_distance = float('inf')
-        start_point = points[0]
-        for point in points:
-            distance = self.distance_calculator.haversine_distance(
-                centroid_lat, centroid_lng, point.lat, point.lng
-            )
-            if distance < min_distance:
-                min_distance = distance
-                start_point = point
-        
-        # Nearest neighbor traversal
-        sorted_points = [start_point]
-        remaining_points = [p for p in points if p.pickup_id != start_point.pickup_id]
-        
-        current_point = start_point
-        while remaining_points:
-            min_distance = float('inf')
-            nearest_point = remaining_points[0]
-            
-            for point in remaining_points:
-                distance = self.distance_calculator.haversine_distance(
-                    current_point.lat, current_point.lng, point.lat, point.lng
-                )
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_point = point
-            
-            sorted_points.append(nearest_point)
-            remaining_points.remove(nearest_point)
-            current_point = nearest_point
+        if len(group) <= 1:
+            return group
+        
+        rows = np.asarray(group, dtype=np.intp) + 1
+        block = distances[np.ix_(rows, rows)]
         
-        return sorted_points
+        # Start from the group's medoid (least total distance to the others)
+        current = int(block.sum(axis=1).argmin())
+        visited = np.zeros(len(group), dtype=bool)
+        visited[current] = True
+        order = [current]
+        
+        # Nearest neighbor traversal over the matrix row of the current point
+        for _ in range(len(group) - 1):
+            current = int(np.where(visited, np.inf, block[current]).argmin())
+            visited[current] = True
+            order.append(current)
+        
+        return [group[i] for i in order]
     
     def _solve_vrp(self, 
                    pickup_points: List[PickupPoint], 
                    driver: Driver,
-                   distance_weight: float) -> List[int]:
+                   distance_weight: float,
+                   distances: np.ndarray,
+                   initial_route: Optional[List[int]] = None) -> List[int]:
         """
         Solve VRP using OR-Tools.
         
@@ -191,6 +265,9 @@ class RouteSolver:
             pickup_points: Priority-sorted pickup points
             driver: Driver for this route
             distance_weight: Weight for distance optimization
+            distances: Distances in kilometers with the depot at index 0 followed by pickup_points
+            initial_route: Optional route (nodes of distances, depot excluded)
+                the search starts from
             
         Returns:
             List of point indices in optimal order
@@ -199,12 +276,12 @@ class RouteSolver:
             # Should not reach here, but fallback to simple ordering
             return list(range(len(pickup_points)))
         
-        # Create distance matrix (including depot)
-        locations = [(driver.base_lat, driver.base_lng)]  # Depot at index 0
-        for point in pickup_points:
-            locations.append((point.lat, point.lng))
-        
-        distance_matrix = self._create_distance_matrix(locations)
+        # Integer meters (including depot) from the shared context, registered
+        # as a matrix so OR-Tools reads arcs natively instead of calling back into Python
+        distance_matrix = self.integer_matrix(distances)
+        # Routes end at their last stop (as route legs and the heuristic count
+        # them), so driving back to the depot is free
+        distance_matrix[:, 0] = 0
         
         # Create VRP model
         manager = pywrapcp.RoutingIndexManager(
@@ -215,52 +292,53 @@ class RouteSolver:
         
         routing = pywrapcp.RoutingModel(manager)
         
-        # Define distance callback
-        def distance_callback(from_index, to_index):
-            """Returns the distance between the two nodes."""
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return int(distance_matrix[from_node][to_node] * 1000)  # Convert to meters
-        
-        transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+        # With a single depot, node i is routing index i, so the matrix needs no remapping
+        transit_callback_index = routing.RegisterTransitMatrix(distance_matrix.tolist())
         routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
         
-        # Add capacity constraint
-        def demand_callback(from_index):
-            """Returns the demand of the node."""
-            from_node = manager.IndexToNode(from_index)
-            if from_node == 0:  # Depot has no demand
-                return 0
-            point_index = from_node - 1  # Adjust for depot
-            return int(pickup_points[point_index].volume * 100)  # Convert to units
-        
-        demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
+        # Add capacity constraint (the depot has no demand)
+        demands = np.zeros(len(distance_matrix), dtype=np.int64)
+        demands[1:] = np.array([point.volume for point in pickup_points]) * VOLUME_SCALE
+        demand_callback_index = routing.RegisterUnaryTransitVector(demands.tolist())
         routing.AddDimensionWithVehicleCapacity(
             demand_callback_index,
             0,  # null capacity slack
-            [int(driver.max_capacity * 100)],  # vehicle maximum capacities
+            [int(driver.max_capacity * VOLUME_SCALE)],  # vehicle maximum capacities
             True,  # start cumul to zero
             'Capacity'
         )
         
+        # Keep red -> yellow -> green: no arc leads from a point back to a more
+        # urgent one (points are priority-sorted, so those form a prefix)
+        group_start = 1
+        for i, point in enumerate(pickup_points):
+            if i and point.priority_flag != pickup_points[i - 1].priority_flag:
+                group_start = i + 1
+            if group_start > 1:
+                routing.NextVar(manager.NodeToIndex(i + 1)).RemoveValues(
+                    [manager.NodeToIndex(node) for node in range(1, group_start)]
+                )
+        
         # Add priority constraints by setting penalties for skipping high-priority nodes
         for i, point in enumerate(pickup_points):
             node_index = i + 1  # Adjust for depot
             penalty = self._calculate_skip_penalty(point)
             routing.AddDisjunction([manager.NodeToIndex(node_index)], penalty)
         
-        # Set search parameters
-        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-        search_parameters.first_solution_strategy = (
-            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-        )
-        search_parameters.local_search_metaheuristic = (
-            routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-        )
-        search_parameters.time_limit.FromSeconds(30)  # 30 second time limit
-        
         # Solve the problem
-        solution = routing.SolveWithParameters(search_parameters)
+        search_parameters = self.search_parameters()
+        solution = None
+        if initial_route:
+            routing.CloseModelWithParameters(search_parameters)
+            # None when the route breaks a constraint (e.g. it overloads the
+            # vehicle); the search then builds its own first solution
+            initial_assignment = routing.ReadAssignmentFromRoutes(
+                [[manager.NodeToIndex(node) for node in initial_route]], True
+            )
+            if initial_assignment is not None:
+                solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+        if solution is None:
+            solution = routing.SolveWithParameters(search_parameters)
         
         if solution:
             return self._extract_route_from_solution(manager, routing, solution)
@@ -269,32 +347,36 @@ class RouteSolver:
             print("VRP solver failed, using fallback ordering")
             return list(range(len(pickup_points)))
     
-    def _create_distance_matrix(self, locations: List[Tuple[float, float]]) -> List[List[float]]:
+    @staticmethod
+    def integer_matrix(distances: np.ndarray) -> np.ndarray:
+        """Convert a kilometer distance matrix to rounded integer meters."""
+        return np.rint(np.asarray(distances, dtype=np.float64) * DISTANCE_SCALE).astype(np.int64)
+    
+    def _metaheuristic_value(self) -> int:
+        """Return the OR-Tools enum value of the configured metaheuristic."""
+        value = getattr(routing_enums_pb2.LocalSearchMetaheuristic, self.metaheuristic.upper(), None)
+        if not isinstance(value, int) or self.metaheuristic == "unset":
+            raise ValueError(f"Unknown OR-Tools metaheuristic: {self.metaheuristic}")
+        return value
+    
+    def search_parameters(self):
         """
-        Create distance matrix for all locations.
+        Build the OR-Tools search parameters from the configured limits.
         
-        Args:
-            locations: List of (lat, lng) tuples
-            
         Returns:
-            Distance matrix
+            RoutingSearchParameters with cheapest-arc first solutions, the
+            configured metaheuristic and time / solution limits
         """
-        n = len(locations)
-        matrix = [[0.0] * n for _ in range(n)]
-        
-        # Calculate distances using batch processing where possible
-        try:
-            batch_matrix = self.distance_calculator.batch_distances(locations, locations)
-            return batch_matrix
-        except Exception:
-            # Fallback to individual calculations
-            for i in range(n):
-                for j in range(n):
-                    if i != j:
-                        lat1, lng1 = locations[i]
-                        lat2, lng2 = locations[j]
-                        matrix[i][j] = self.distance_calculator.road_distance(lat1, lng1, lat2, lng2)
-            return matrix
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        search_parameters.first_solution_strategy = (
+            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+        )
+        search_parameters.local_search_metaheuristic = self._metaheuristic_value()
+        if self.time_limit is not None:
+            search_parameters.time_limit.FromMilliseconds(int(round(self.time_limit * 1000)))
+        if self.solution_limit is not None:
+            search_parameters.solution_limit = self.solution_limit
+        return search_parameters
     
     def _calculate_skip_penalty(self, point: PickupPoint) -> int:
         """
@@ -343,17 +425,17 @@ class RouteSolver:
         
         return route
     
-    def _create_route_stops(self, 
-                           pickup_points: List[PickupPoint], 
+    def create_route_stops(self,
+                           pickup_points: List[PickupPoint],
                            route_indices: List[int],
-                           driver: Driver) -> List[RouteStop]:
+                           distance_view: ClusterDistanceView) -> List[RouteStop]:
         """
         Create RouteStop objects from optimized route.
         
         Args:
             pickup_points: List of all pickup points
             route_indices: Optimized order of point indices
-            driver: Driver for this route
+            distance_view: Distances with the depot at index 0 followed by pickup_points
             
         Returns:
             List of RouteStop objects
@@ -362,22 +444,18 @@ class RouteSolver:
             return []
         
         route_stops = []
-        prev_lat, prev_lng = driver.base_lat, driver.base_lng
         
-        for order, point_index in enumerate(route_indices):
-            if point_index >= len(pickup_points):
-                continue  # Skip invalid indices
-                
+        # Skip invalid indices
+        route_indices = [i for i in route_indices if i < len(pickup_points)]
+        
+        # Distances from previous locations, looked up (or batch-requested) in one go
+        legs = distance_view.route_legs([i + 1 for i in route_indices])
+        # Travel times follow the clock along the route (speed profile by hour)
+        times = distance_view.route_times(legs)
+        
+        for order, (point_index, distance, travel_time) in enumerate(zip(route_indices, legs, times)):
             point = pickup_points[point_index]
             
-            # Calculate distance from previous location
-            distance = self.distance_calculator.road_distance(
-                prev_lat, prev_lng, point.lat, point.lng
-            )
-            
-            # Estimate travel time
-            travel_time = self.distance_calculator.estimate_travel_time(distance)
-            
             route_stop = RouteStop(
                 pickup_point=point,
                 order=order,
@@ -386,7 +464,6 @@ class RouteSolver:
             )
             
             route_stops.append(route_stop)
-            prev_lat, prev_lng = point.lat, point.lng
         
         return route_stops
     
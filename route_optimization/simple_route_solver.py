@@ -3,30 +3,36 @@ Simple route solver that works without OR-Tools dependency.
 This is the main route solver that uses heuristic algorithms.
 """
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 from .models import PickupPoint, Driver, RouteStop, PriorityFlag
 from .distance_calculator import DistanceCalculator
+from .distance_context import ClusterDistanceView
 from .fallback_solver import FallbackRouteSolver
+from .local_search import RouteLocalSearch
 
 
 class SimpleRouteSolver:
     """Route solver using heuristic algorithms (no external dependencies)."""
     
-    def __init__(self, distance_calculator: DistanceCalculator):
+    def __init__(self,
+                 distance_calculator: DistanceCalculator,
+                 local_search: Optional[RouteLocalSearch] = None):
         """
         Initialize simple route solver.
         
         Args:
             distance_calculator: Distance calculation utility
+            local_search: Optional 2-opt / Or-opt improvement of constructed routes
         """
         self.distance_calculator = distance_calculator
-        self.fallback_solver = FallbackRouteSolver(distance_calculator)
+        self.fallback_solver = FallbackRouteSolver(distance_calculator, local_search)
     
     def solve_cluster_route(self, 
                            pickup_points: List[PickupPoint], 
                            driver: Driver,
                            priority_weight: float = 0.4,
-                           distance_weight: float = 0.6) -> List[RouteStop]:
+                           distance_weight: float = 0.6,
+                           distance_view: Optional[ClusterDistanceView] = None) -> List[RouteStop]:
         """
         Solve optimal route for a single cluster assigned to one driver.
         
@@ -35,14 +41,55 @@ class SimpleRouteSolver:
             driver: Driver assigned to this cluster
             priority_weight: Weight for priority optimization (0-1)
             distance_weight: Weight for distance optimization (0-1)
+            distance_view: Distances for this cluster from the run's shared context
             
         Returns:
             Ordered list of route stops
         """
         return self.fallback_solver.solve_cluster_route(
-            pickup_points, driver, priority_weight, distance_weight
+            pickup_points, driver, priority_weight, distance_weight, distance_view
         )
     
+    def solve_cluster_order(self,
+                            pickup_points: List[PickupPoint],
+                            driver: Driver,
+                            priority_weight: float,
+                            distance_weight: float,
+                            distance_view: ClusterDistanceView) -> List[int]:
+        """
+        Solve the visiting order of a cluster without building route stops.
+        
+        Args:
+            pickup_points: List of pickup points in the cluster
+            driver: Driver assigned to this cluster
+            priority_weight: Weight for priority optimization (0-1)
+            distance_weight: Weight for distance optimization (0-1)
+            distance_view: Distances for this cluster
+            
+        Returns:
+            Indices into pickup_points in route order
+        """
+        return self.fallback_solver.solve_cluster_order(
+            pickup_points, driver, priority_weight, distance_weight, distance_view
+        )
+    
+    def create_route_stops(self,
+                           pickup_points: List[PickupPoint],
+                           order: List[int],
+                           distance_view: ClusterDistanceView) -> List[RouteStop]:
+        """
+        Create route stops, with leg distances and times, for a solved order.
+        
+        Args:
+            pickup_points: List of pickup points in the cluster
+            order: Indices into pickup_points in route order
+            distance_view: Distances for this cluster
+            
+        Returns:
+            Ordered list of route stops
+        """
+        return self.fallback_solver.create_route_stops(pickup_points, order, distance_view)
+    
     def calculate_route_metrics(self, route_stops: List[RouteStop]) -> Dict[str, float]:
         """
         Calculate performance metrics for a route.
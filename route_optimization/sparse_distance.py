@@ -0,0 +1,198 @@
+"""
+Sparse k-nearest-neighbor distance graph for very large instances.
+Keeps only each point's nearest neighbors plus every depot in CSR arrays, so
+memory grows linearly with the number of locations instead of quadratically.
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+from typing import Optional, Sequence, Tuple
+
+from .distance_calculator import DistanceCalculator, ROAD_FACTOR
+
+# Kilometers per degree of latitude
+KM_PER_DEGREE = 111.32
+
+# Default number of nearest neighbors kept per location
+SPARSE_NEIGHBORS = 16
+
+
+class SparseDistanceGraph:
+    """
+    Distances between nearby locations and from every location to every depot.
+    
+    Rows are stored in CSR form (indptr, indices, float32 data). Depot rows
+    are complete; every other row holds its k nearest locations (by
+    straight-line distance, valued with the calculator's offline metric) and
+    all depots. Pairs outside the graph are answered from the reverse entry
+    when present, otherwise estimated with the calculator's straight-line
+    metric and road factor.
+    """
+    
+    def __init__(self,
+                 distance_calculator: DistanceCalculator,
+                 locations: np.ndarray,
+                 n_depots: int,
+                 neighbors: int = SPARSE_NEIGHBORS,
+                 depot_distances: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        """
+        Build the graph.
+        
+        Args:
+            distance_calculator: Distance calculation utility (its offline metric
+                values the stored entries)
+            locations: (n, 2) array of (lat, lng); the first n_depots rows are depots
+            n_depots: Number of depot locations at the start of locations
+            neighbors: Nearest neighbors kept per location
+            depot_distances: Optional precomputed (outbound, inbound) depot distances
+                (see DriverRegistry.depot_distances) used for depot rows and columns
+        """
+        self.locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        self.n_depots = n_depots
+        self.neighbors = neighbors
+        # Projection for estimates of pairs outside the graph (None: Haversine)
+        self._projection = distance_calculator.planar_projection(self.locations)
+        n = len(self.locations)
+        
+        # Candidate neighbors by straight-line distance in a local projection
+        ref_cos = np.cos(np.radians(self.locations[:, 0].mean())) if n else 1.0
+        projected = self.locations * np.array([KM_PER_DEGREE, KM_PER_DEGREE * ref_cos])
+        k = min(neighbors + 1, n)
+        if k > 0:
+            _, nearest = cKDTree(projected).query(projected, k=k)
+            nearest = np.asarray(nearest, dtype=np.int64).reshape(n, k)
+        else:
+            nearest = np.empty((0, 0), dtype=np.int64)
+        
+        rows = [np.repeat(np.arange(n, dtype=np.int64), k)]
+        cols = [nearest.ravel()]
+        # Every location links to every depot and every depot to every location
+        depots = np.arange(n_depots, dtype=np.int64)
+        rows.append(np.repeat(np.arange(n, dtype=np.int64), n_depots))
+        cols.append(np.tile(depots, n))
+        rows.append(np.repeat(depots, n))
+        cols.append(np.tile(np.arange(n, dtype=np.int64), n_depots))
+        
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        keys = np.unique(rows * n + cols)
+        rows, cols = keys // max(n, 1), keys % max(n, 1)
+        
+        if depot_distances is None:
+            values = distance_calculator.offline_pair_distances(self.locations[rows], self.locations[cols])
+        else:
+            outbound, inbound = depot_distances
+            from_depot = (rows < n_depots) & (cols >= n_depots)
+            to_depot = (rows >= n_depots) & (cols < n_depots)
+            compute = ~(from_depot | to_depot)
+            values = np.empty(len(rows), dtype=np.float64)
+            values[compute] = distance_calculator.offline_pair_distances(
+                self.locations[rows[compute]], self.locations[cols[compute]]
+            )
+            values[from_depot] = outbound[rows[from_depot], cols[from_depot] - n_depots]
+            values[to_depot] = inbound[rows[to_depot] - n_depots, cols[to_depot]]
+        graph = csr_matrix((values.astype(np.float32), (rows, cols)), shape=(n, n))
+        graph.sort_indices()
+        
+        self.indptr = graph.indptr
+        self.indices = graph.indices
+        self.data = graph.data
+        # Flattened (row, col) keys in CSR order for vectorized lookups
+        self._keys = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr)) * n + self.indices
+    
+    @property
+    def size(self) -> int:
+        """Return number of locations."""
+        return len(self.locations)
+    
+    @property
+    def nnz(self) -> int:
+        """Return number of stored distances."""
+        return len(self.data)
+    
+    @property
+    def nbytes(self) -> int:
+        """Return memory held by the graph arrays."""
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes + self._keys.nbytes
+    
+    def row(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (neighbor indices, distances) stored for location i."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+    
+    def _find(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Return positions of (row, col) entries in data, -1 where absent."""
+        keys = rows * self.size + cols
+        positions = np.searchsorted(self._keys, keys)
+        positions = np.minimum(positions, max(len(self._keys) - 1, 0))
+        found = (self._keys[positions] == keys) if len(self._keys) else np.zeros(len(keys), dtype=bool)
+        return np.where(found, positions, -1)
+    
+    def lookup(self, rows: Sequence[int], cols: Sequence[int]) -> np.ndarray:
+        """
+        Return distances for (rows[i], cols[i]) pairs.
+        
+        Args:
+            rows: Origin location indices
+            cols: Destination location indices (same length as rows)
+        
+        Returns:
+            Distances in kilometers
+        """
+        rows = np.asarray(rows, dtype=np.int64).ravel()
+        cols = np.asarray(cols, dtype=np.int64).ravel()
+        result = np.empty(len(rows), dtype=np.float64)
+        
+        positions = self._find(rows, cols)
+        stored = positions >= 0
+        result[stored] = self.data[positions[stored]]
+        
+        missing = np.flatnonzero(~stored)
+        if len(missing):
+            # Road distances are close to symmetric: reuse the reverse entry
+            reverse = self._find(cols[missing], rows[missing])
+            has_reverse = reverse >= 0
+            result[missing[has_reverse]] = self.data[reverse[has_reverse]]
+            
+            estimate = missing[~has_reverse]
+            origins, destinations = self.locations[rows[estimate]], self.locations[cols[estimate]]
+            if self._projection is not None:
+                result[estimate] = self._projection.pair_distances(origins, destinations) * ROAD_FACTOR
+            else:
+                result[estimate] = DistanceCalculator.haversine_pairs(origins, destinations) * ROAD_FACTOR
+        
+        return result
+    
+    def submatrix(self, nodes: Sequence[int]) -> np.ndarray:
+        """
+        Return distances between all pairs of the given locations.
+        
+        Answers every pair the way lookup does (stored entry, else the reverse
+        entry, else the straight-line estimate), but with one vectorized
+        estimate over the block and the stored entries sliced out of the CSR
+        arrays instead of a search per pair.
+        
+        Args:
+            nodes: Location indices
+        
+        Returns:
+            (len(nodes), len(nodes)) float64 array of kilometers
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        coords = self.locations[nodes]
+        if self._projection is not None:
+            result = self._projection.distance_matrix(coords)
+        else:
+            result = DistanceCalculator.haversine_matrix(coords)
+        result *= ROAD_FACTOR
+        
+        stored = self.to_csr()[nodes][:, nodes].tocoo()
+        # Reverse entries first, so entries stored in both directions keep their own
+        result[stored.col, stored.row] = stored.data
+        result[stored.row, stored.col] = stored.data
+        return result
+    
+    def to_csr(self) -> csr_matrix:
+        """Return the stored distances as a scipy CSR matrix."""
+        return csr_matrix((self.data, self.indices, self.indptr), shape=(self.size, self.size))
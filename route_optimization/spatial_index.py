@@ -0,0 +1,204 @@
+"""
+Spatial index for nearest-neighbor queries over pickup points.
+A uniform grid of buckets on locally projected coordinates that supports
+point deletion, so greedy route construction does not rescan visited points.
+"""
+
+import itertools
+import math
+import numpy as np
+from typing import Dict, List, Optional, Set, Tuple
+
+# Kilometers per degree of latitude
+KM_PER_DEGREE = 111.32
+
+# Target average number of points per grid cell
+POINTS_PER_CELL = 2.0
+
+
+class SpatialGridIndex:
+    """
+    Uniform grid index with deletion and k-nearest queries.
+    
+    Points are projected to planar kilometers (equirectangular around the
+    mean latitude) and bucketed into square cells sized for about
+    POINTS_PER_CELL points each. A query scans rings of cells around the
+    query position and stops as soon as no unscanned cell can hold a closer
+    point, so for evenly spread points a query touches O(1) cells and n
+    queries with deletions run in about O(n log n).
+    """
+    
+    def __init__(self, coords: np.ndarray, cell_km: Optional[float] = None):
+        """
+        Build the index.
+        
+        Args:
+            coords: (n, 2) array of (lat, lng); point ids are the row indices
+            cell_km: Cell edge in kilometers (chosen from the point density when omitted)
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self._ref_cos = math.cos(math.radians(float(coords[:, 0].mean()))) if len(coords) else 1.0
+        self.xy = self.project(coords)
+        
+        if cell_km is None:
+            if len(coords) > 1:
+                extent = self.xy.max(axis=0) - self.xy.min(axis=0)
+                area = max(float(extent[0]) * float(extent[1]), float(extent.max()) ** 2 / len(coords), 1e-9)
+                cell_km = math.sqrt(area * POINTS_PER_CELL / len(coords))
+            else:
+                cell_km = 1.0
+        self.cell_km = max(cell_km, 1e-6)
+        
+        self._cells = np.floor(self.xy / self.cell_km).astype(np.int64)
+        self._buckets: Dict[Tuple[int, int], Set[int]] = {}
+        for i, (cx, cy) in enumerate(self._cells.tolist()):
+            self._buckets.setdefault((cx, cy), set()).add(i)
+        # Plain tuples are much faster than array indexing for scalar lookups
+        self._points: List[Tuple[float, float]] = [tuple(p) for p in self.xy.tolist()]
+        self._alive = np.ones(len(coords), dtype=bool)
+        self._size = len(coords)
+    
+    def project(self, coords: np.ndarray) -> np.ndarray:
+        """Project (lat, lng) degrees to the index's planar kilometers."""
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        return np.column_stack((
+            coords[:, 0] * KM_PER_DEGREE,
+            coords[:, 1] * KM_PER_DEGREE * self._ref_cos
+        ))
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __contains__(self, point_id: int) -> bool:
+        return 0 <= point_id < len(self._alive) and bool(self._alive[point_id])
+    
+    def remove(self, point_id: int) -> None:
+        """
+        Delete a point from the index.
+        
+        Args:
+            point_id: Row index of the point in the coordinates the index was built from
+        """
+        if not self._alive[point_id]:
+            raise KeyError(f"Point {point_id} is not in the index")
+        cell = (int(self._cells[point_id, 0]), int(self._cells[point_id, 1]))
+        bucket = self._buckets[cell]
+        bucket.discard(point_id)
+        if not bucket:
+            del self._buckets[cell]
+        self._alive[point_id] = False
+        self._size -= 1
+    
+    def nearest(self, lat: float, lng: float, k: int = 1) -> List[int]:
+        """
+        Find the k indexed points closest to a position.
+        
+        Args:
+            lat, lng: Query position
+            k: Number of neighbors to return
+        
+        Returns:
+            Point ids ordered by increasing planar distance (fewer than k if the
+            index holds fewer points)
+        """
+        x = lat * KM_PER_DEGREE
+        y = lng * KM_PER_DEGREE * self._ref_cos
+        return self._nearest_xy(x, y, k)
+    
+    def nearest_to_point(self, point_id: int, k: int = 1) -> List[int]:
+        """
+        Find the k indexed points closest to a (possibly removed) indexed point.
+        
+        Args:
+            point_id: Row index of the query point
+            k: Number of neighbors to return
+        
+        Returns:
+            Point ids ordered by increasing planar distance
+        """
+        x, y = self._points[point_id]
+        return self._nearest_xy(x, y, k)
+    
+    def within_point(self, point_id: int, radius_km: float) -> List[int]:
+        """
+        Find every indexed point within a radius of a (possibly removed) indexed point.
+        
+        Args:
+            point_id: Row index of the query point
+            radius_km: Search radius in planar kilometers
+        
+        Returns:
+            Point ids within radius_km (the query point itself if still indexed), unordered
+        """
+        x, y = self._points[point_id]
+        cx, cy = int(math.floor(x / self.cell_km)), int(math.floor(y / self.cell_km))
+        reach = int(math.ceil(radius_km / self.cell_km))
+        
+        buckets, points = self._buckets, self._points
+        found = []
+        for gx in range(cx - reach, cx + reach + 1):
+            for gy in range(cy - reach, cy + reach + 1):
+                bucket = buckets.get((gx, gy))
+                if bucket:
+                    for other in bucket:
+                        px, py = points[other]
+                        if math.hypot(px - x, py - y) <= radius_km:
+                            found.append(other)
+        return found
+    
+    def _nearest_xy(self, x: float, y: float, k: int) -> List[int]:
+        """k-nearest search around a projected position."""
+        k = min(k, self._size)
+        if k <= 0:
+            return []
+        
+        cx, cy = int(math.floor(x / self.cell_km)), int(math.floor(y / self.cell_km))
+        
+        buckets, points = self._buckets, self._points
+        found: List[Tuple[float, int]] = []
+        radius = 0
+        scanned_cells = 0
+        while True:
+            scanned_cells += 1 if radius == 0 else 8 * radius
+            if scanned_cells > len(self._buckets):
+                # Far from the remaining points: checking them all is cheaper
+                return self._nearest_brute_force(x, y, k)
+            
+            for cell in self._ring(cx, cy, radius):
+                bucket = buckets.get(cell)
+                if bucket:
+                    for point_id in bucket:
+                        px, py = points[point_id]
+                        found.append((math.hypot(px - x, py - y), point_id))
+            
+            # Points in unscanned rings are at least radius cells away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= radius * self.cell_km:
+                    return [point_id for _, point_id in found[:k]]
+            radius += 1
+    
+    def _nearest_brute_force(self, x: float, y: float, k: int) -> List[int]:
+        """Rank every remaining point by planar distance."""
+        ids = np.fromiter(itertools.chain.from_iterable(self._buckets.values()),
+                          dtype=np.intp, count=self._size)
+        distances = np.hypot(self.xy[ids, 0] - x, self.xy[ids, 1] - y)
+        if k < len(ids):
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(distances[top], kind='stable')]
+        return ids[top].tolist()
+    
+    @staticmethod
+    def _ring(cx: int, cy: int, radius: int):
+        """Yield the cells at Chebyshev distance radius from (cx, cy)."""
+        if radius == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-radius, radius + 1):
+            yield (cx + dx, cy - radius)
+            yield (cx + dx, cy + radius)
+        for dy in range(-radius + 1, radius):
+            yield (cx - radius, cy + dy)
+            yield (cx + radius, cy + dy)
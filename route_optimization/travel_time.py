@@ -0,0 +1,240 @@
+"""
+Travel-time estimation with time-of-day speed profiles.
+Converts whole distance matrices (or the legs of a route) to minutes at once,
+using speeds that depend on the hour of day and the road class of each leg.
+"""
+
+import json
+import os
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Union
+
+HOURS_PER_DAY = 24
+
+# Road class of a leg, picked by its length: short hops run on local streets,
+# long legs mostly on arterial roads
+DEFAULT_ROAD_CLASSES = ["local", "collector", "arterial"]
+DEFAULT_CLASS_BOUNDS_KM = [1.0, 5.0]
+
+# Speeds in km/h for a dense Indian city: free-flowing at night, roughly half
+# speed in the morning (8-11) and evening (17-21) rush
+CITY_SPEED_PROFILE = {
+    "class_bounds_km": DEFAULT_CLASS_BOUNDS_KM,
+    "speeds_kmh": {
+        "local": {"default": 20, "0-6": 25, "8-11": 11, "17-21": 12, "22-24": 25},
+        "collector": {"default": 28, "0-6": 38, "8-11": 14, "17-21": 15, "22-24": 38},
+        "arterial": {"default": 38, "0-6": 55, "8-11": 18, "17-21": 19, "22-24": 55},
+    }
+}
+
+SpeedSpec = Union[float, Sequence[float], Dict[str, float]]
+
+
+class TravelTimeModel:
+    """
+    Hour-of-day x road-class speed table applied with vectorized operations.
+    
+    Speeds live in an (n_classes, 24) array. The road class of a distance is
+    found with np.digitize against class_bounds_km, so converting an n x n
+    matrix is a handful of array operations regardless of n.
+    """
+    
+    def __init__(self,
+                 speeds_kmh: np.ndarray,
+                 class_bounds_km: Sequence[float] = (),
+                 class_names: Optional[Sequence[str]] = None,
+                 default_hour: Optional[float] = None):
+        """
+        Initialize travel-time model.
+        
+        Args:
+            speeds_kmh: (n_classes, 24) array of speeds in km/h by road class and hour
+            class_bounds_km: n_classes - 1 increasing leg lengths separating road classes
+            class_names: Optional name per road class
+            default_hour: Hour used when a call gives none (None: current local time)
+        """
+        speeds = np.asarray(speeds_kmh, dtype=np.float64)
+        if speeds.ndim == 1:
+            speeds = speeds.reshape(1, -1)
+        if speeds.shape[1] != HOURS_PER_DAY:
+            raise ValueError(f"Speed table needs {HOURS_PER_DAY} hourly columns, got {speeds.shape[1]}")
+        if len(class_bounds_km) != speeds.shape[0] - 1:
+            raise ValueError(f"{speeds.shape[0]} road classes need {speeds.shape[0] - 1} class bounds")
+        if np.any(speeds <= 0):
+            raise ValueError("Speeds must be positive")
+        
+        self.speeds_kmh = speeds
+        self.class_bounds_km = np.asarray(class_bounds_km, dtype=np.float64)
+        self.class_names = list(class_names) if class_names else [f"class_{i}" for i in range(len(speeds))]
+        self.default_hour = default_hour
+        
+        # Minutes per kilometer, the quantity actually multiplied in
+        self._minutes_per_km = 60.0 / speeds
+    
+    @classmethod
+    def constant(cls, speed_kmh: float = 25.0) -> "TravelTimeModel":
+        """Model with one speed for every hour and road (the legacy estimate)."""
+        return cls(np.full((1, HOURS_PER_DAY), speed_kmh), default_hour=0.0)
+    
+    @classmethod
+    def from_dict(cls, config: Dict, default_hour: Optional[float] = None) -> "TravelTimeModel":
+        """
+        Build a model from a configuration dictionary.
+        
+        Format:
+            {
+                "class_bounds_km": [1.0, 5.0],
+                "speeds_kmh": {
+                    "local": {"default": 20, "8-11": 11},   # hour ranges [start, end)
+                    "collector": 28,                        # same speed all day
+                    "arterial": [..24 hourly speeds..]
+                }
+            }
+        
+        Args:
+            config: Configuration dictionary
+            default_hour: Hour used when a call gives none
+        
+        Returns:
+            Travel-time model
+        """
+        speeds = config.get("speeds_kmh")
+        if not speeds:
+            raise ValueError("Speed profile needs a 'speeds_kmh' mapping")
+        
+        names = list(speeds.keys())
+        table = np.array([cls._hourly_speeds(speeds[name], name) for name in names])
+        bounds = config.get("class_bounds_km", DEFAULT_CLASS_BOUNDS_KM[:len(names) - 1])
+        return cls(table, bounds, names, default_hour)
+    
+    @classmethod
+    def city(cls, default_hour: Optional[float] = None) -> "TravelTimeModel":
+        """Built-in rush-hour profile for dense city traffic (CITY_SPEED_PROFILE)."""
+        return cls.from_dict(CITY_SPEED_PROFILE, default_hour)
+    
+    @classmethod
+    def load(cls, spec: Union[str, Dict, "TravelTimeModel", None]) -> Optional["TravelTimeModel"]:
+        """
+        Resolve a speed profile setting.
+        
+        Args:
+            spec: None, a model, a configuration dict, 'city' for the built-in
+                profile, 'constant:<km/h>', or the path of a JSON profile
+        
+        Returns:
+            Travel-time model, or None when spec is None
+        """
+        if spec is None or isinstance(spec, TravelTimeModel):
+            return spec
+        if isinstance(spec, dict):
+            return cls.from_dict(spec)
+        if spec == "city":
+            return cls.city()
+        if spec.startswith("constant:"):
+            return cls.constant(float(spec.partition(":")[2]))
+        if os.path.exists(spec):
+            with open(spec) as f:
+                return cls.from_dict(json.load(f))
+        raise ValueError(f"Unknown speed profile: {spec}")
+    
+    @staticmethod
+    def _hourly_speeds(spec: SpeedSpec, name: str) -> List[float]:
+        """Expand a per-class speed setting to 24 hourly speeds."""
+        if isinstance(spec, (int, float)):
+            return [float(spec)] * HOURS_PER_DAY
+        if isinstance(spec, dict):
+            if "default" not in spec:
+                raise ValueError(f"Speed profile for '{name}' needs a 'default' speed")
+            hourly = [float(spec["default"])] * HOURS_PER_DAY
+            for hours, speed in spec.items():
+                if hours == "default":
+                    continue
+                start, _, end = hours.partition("-")
+                for hour in range(int(start), int(end or int(start) + 1)):
+                    hourly[hour % HOURS_PER_DAY] = float(speed)
+            return hourly
+        hourly = [float(speed) for speed in spec]
+        if len(hourly) != HOURS_PER_DAY:
+            raise ValueError(f"Speed profile for '{name}' needs {HOURS_PER_DAY} hourly values")
+        return hourly
+    
+    def resolve_hour(self, hour: Optional[float]) -> float:
+        """Return hour, falling back to the default hour or the current local time."""
+        if hour is not None:
+            return float(hour)
+        if self.default_hour is not None:
+            return float(self.default_hour)
+        from datetime import datetime
+        now = datetime.now()
+        return now.hour + now.minute / 60.0
+    
+    def road_classes(self, distances_km: np.ndarray) -> np.ndarray:
+        """Return the road class index of every distance."""
+        return np.digitize(distances_km, self.class_bounds_km)
+    
+    def travel_times(self,
+                     distances_km: Union[np.ndarray, Sequence[float], float],
+                     hours: Union[np.ndarray, Sequence[float], float, None] = None) -> np.ndarray:
+        """
+        Convert distances to travel times.
+        
+        Args:
+            distances_km: Distances of any shape (a full matrix, a row, a route's legs)
+            hours: Departure hour per distance (broadcast against distances_km), or
+                a single hour; fractional and >= 24 hours wrap around the day
+        
+        Returns:
+            Travel times in minutes, shaped like distances_km
+        """
+        distances = np.asarray(distances_km, dtype=np.float64)
+        hours = self.resolve_hour(None) if hours is None else hours
+        hour_index = np.floor(np.asarray(hours, dtype=np.float64)).astype(np.intp) % HOURS_PER_DAY
+        
+        if len(self._minutes_per_km) == 1:
+            return distances * self._minutes_per_km[0, hour_index]
+        return distances * self._minutes_per_km[self.road_classes(distances), hour_index]
+    
+    def time_matrix(self, distance_matrix: np.ndarray, hour: Optional[float] = None,
+                    dtype=np.float32) -> np.ndarray:
+        """
+        Convert a whole distance matrix to a travel-time matrix for one departure hour.
+        
+        Args:
+            distance_matrix: Distances in kilometers
+            hour: Departure hour (default hour when omitted)
+            dtype: Result dtype
+        
+        Returns:
+            Travel times in minutes
+        """
+        return self.travel_times(np.asarray(distance_matrix), self.resolve_hour(hour)).astype(dtype, copy=False)
+    
+    def route_times(self, leg_distances_km: Sequence[float], departure_hour: Optional[float] = None) -> np.ndarray:
+        """
+        Travel time of every leg of a route driven in order.
+        
+        The hour of each leg depends on when the previous legs end. Hours are
+        found by fixed-point iteration over the whole route at once (leg times
+        -> cumulative clock -> hourly speeds) rather than leg by leg; since the
+        speed table is piecewise constant this settles after a few passes.
+        
+        Args:
+            leg_distances_km: Distance of each leg in driving order
+            departure_hour: Clock hour at the start of the first leg
+        
+        Returns:
+            Minutes per leg
+        """
+        legs = np.asarray(leg_distances_km, dtype=np.float64)
+        start = self.resolve_hour(departure_hour)
+        hours = np.full(len(legs), start)
+        times = self.travel_times(legs, hours)
+        
+        for _ in range(HOURS_PER_DAY):
+            clock = start + np.concatenate(([0.0], np.cumsum(times)[:-1])) / 60.0
+            if np.array_equal(np.floor(clock), np.floor(hours)):
+                break
+            hours = clock
+            times = self.travel_times(legs, hours)
+        
+        return times
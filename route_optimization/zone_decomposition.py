@@ -0,0 +1,337 @@
+"""
+Hierarchical zone decomposition for city-scale runs.
+Splits the pickups into geographic zones with a density-adaptive quadtree and
+shares the drivers out among them, so every zone can be clustered and routed
+on its own with memory and time bounded by the zone size.
+"""
+
+import heapq
+import numpy as np
+from typing import Dict, List, Tuple
+from scipy.optimize import linear_sum_assignment
+
+from .models import PickupPoint, Driver, OptimizedRoute
+from .distance_calculator import DistanceCalculator
+from .equirectangular import EquirectangularProjection
+from .spatial_index import SpatialGridIndex
+
+# Pickups above which a zone is split into quadrants
+ZONE_MAX_POINTS = 5000
+
+# Pickups closer than this to a neighboring zone are checked by the boundary repair
+ZONE_BOUNDARY_BAND_KM = 1.0
+
+Box = Tuple[float, float, float, float]
+
+
+class Zone:
+    """A rectangle of the city with the pickups inside it and the drivers serving it."""
+    
+    def __init__(self, zone_id: int, box: Box, pickup_points: List[PickupPoint], drivers: List[Driver]):
+        """
+        Initialize zone.
+        
+        Args:
+            zone_id: Zone number
+            box: (lat_min, lat_max, lng_min, lng_max) of the zone
+            pickup_points: Pickup points inside the box
+            drivers: Drivers allocated to the zone
+        """
+        self.zone_id = zone_id
+        self.box = box
+        self.pickup_points = pickup_points
+        self.drivers = drivers
+
+
+class ZoneDecomposer:
+    """
+    Quadtree decomposition of pickups into zones, with drivers shared out by workload.
+    
+    The zone with the most pickups is split at the median latitude and
+    longitude of its points (so dense areas get small zones) until every zone
+    holds at most max_points pickups. A zone is never split when that would
+    leave more zones than drivers, because every zone needs a driver.
+    
+    Drivers are shared out in proportion to zone volume (at least one each)
+    and matched to zones by base-to-zone distance with an optimal assignment.
+    """
+    
+    def __init__(self, max_points: int = ZONE_MAX_POINTS):
+        """
+        Initialize zone decomposer.
+        
+        Args:
+            max_points: Pickups above which a zone is split
+        """
+        if max_points < 1:
+            raise ValueError(f"Zone size must be positive: {max_points}")
+        self.max_points = max_points
+    
+    def decompose(self, pickup_points: List[PickupPoint], drivers: List[Driver]) -> List[Zone]:
+        """
+        Partition pickups and drivers into zones.
+        
+        Args:
+            pickup_points: Pickup points of the run
+            drivers: Available drivers
+        
+        Returns:
+            Zones, each with at least one driver and one pickup
+        """
+        coords = np.array([(p.lat, p.lng) for p in pickup_points], dtype=np.float64).reshape(-1, 2)
+        bases = np.array([(d.base_lat, d.base_lng) for d in drivers], dtype=np.float64).reshape(-1, 2)
+        box = EquirectangularProjection.bounding_box(coords)
+        projection = EquirectangularProjection.for_box(EquirectangularProjection.bounding_box(coords, bases))
+        
+        leaves = self._split_leaves(coords, box, len(drivers))
+        quotas = self._driver_quotas([[pickup_points[i].volume for i in indices] for _, indices in leaves],
+                                     len(drivers))
+        
+        # One slot per driver place in a zone; drivers take the slots closest to their bases
+        slots = np.repeat(np.arange(len(leaves)), quotas)
+        centroids = np.array([coords[indices].mean(axis=0) for _, indices in leaves])
+        cost = projection.distance_matrix(bases, centroids[slots])
+        driver_rows, slot_cols = linear_sum_assignment(cost)
+        
+        zone_drivers: List[List[Driver]] = [[] for _ in leaves]
+        for row, col in sorted(zip(driver_rows.tolist(), slot_cols.tolist())):
+            zone_drivers[slots[col]].append(drivers[row])
+        
+        return [
+            Zone(zone_id, leaf_box, [pickup_points[i] for i in indices], zone_drivers[zone_id])
+            for zone_id, (leaf_box, indices) in enumerate(leaves)
+        ]
+    
+    def _split_leaves(self, coords: np.ndarray, box: Box, max_zones: int) -> List[Tuple[Box, np.ndarray]]:
+        """Split the largest zone until all fit max_points or no more zones are allowed."""
+        # Heap of (-size, tiebreak, box, indices); unsplittable zones are set aside
+        heap = [(-len(coords), 0, box, np.arange(len(coords)))]
+        final: List[Tuple[Box, np.ndarray]] = []
+        counter = 1
+        
+        while heap:
+            size = -heap[0][0]
+            if size <= self.max_points:
+                break
+            _, _, leaf_box, indices = heapq.heappop(heap)
+            children = self._quadrants(coords, leaf_box, indices)
+            if len(children) < 2 or len(heap) + len(final) + len(children) > max_zones:
+                final.append((leaf_box, indices))
+                continue
+            for child_box, child_indices in children:
+                heapq.heappush(heap, (-len(child_indices), counter, child_box, child_indices))
+                counter += 1
+        
+        final.extend((leaf_box, indices) for _, _, leaf_box, indices in heap)
+        # Deterministic order: south-west to north-east
+        final.sort(key=lambda leaf: (leaf[0][0], leaf[0][2]))
+        return final
+    
+    @staticmethod
+    def _quadrants(coords: np.ndarray, box: Box, indices: np.ndarray) -> List[Tuple[Box, np.ndarray]]:
+        """Split a zone at the median latitude and longitude of its points; empty quadrants are dropped."""
+        lat_min, lat_max, lng_min, lng_max = box
+        points = coords[indices]
+        mid_lat, mid_lng = np.median(points, axis=0).tolist()
+        south = points[:, 0] <= mid_lat
+        west = points[:, 1] <= mid_lng
+        
+        children = []
+        for lat_side, lat_range in ((south, (lat_min, mid_lat)), (~south, (mid_lat, lat_max))):
+            for lng_side, lng_range in ((west, (lng_min, mid_lng)), (~west, (mid_lng, lng_max))):
+                mask = lat_side & lng_side
+                if mask.any():
+                    children.append(((lat_range[0], lat_range[1], lng_range[0], lng_range[1]), indices[mask]))
+        return children
+    
+    @staticmethod
+    def _driver_quotas(zone_volumes: List[List[float]], n_drivers: int) -> np.ndarray:
+        """Drivers per zone in proportion to zone volume (largest remainder, at least one each)."""
+        weights = np.array([sum(volumes) for volumes in zone_volumes], dtype=np.float64)
+        if weights.sum() <= 0:
+            weights = np.array([len(volumes) for volumes in zone_volumes], dtype=np.float64)
+        share = n_drivers * weights / weights.sum()
+        quotas = np.maximum(1, np.floor(share)).astype(np.intp)
+        
+        while quotas.sum() > n_drivers:
+            reducible = np.flatnonzero(quotas > 1)
+            quotas[reducible[np.argmax(quotas[reducible] - share[reducible])]] -= 1
+        while quotas.sum() < n_drivers:
+            quotas[np.argmax(share - quotas)] += 1
+        return quotas
+    
+    @staticmethod
+    def neighbors(zones: List[Zone]) -> List[Tuple[int, int]]:
+        """Return index pairs of zones that share a border segment."""
+        pairs = []
+        for a in range(len(zones)):
+            lat_min, lat_max, lng_min, lng_max = zones[a].box
+            for b in range(a + 1, len(zones)):
+                other = zones[b].box
+                lat_overlap = min(lat_max, other[1]) - max(lat_min, other[0])
+                lng_overlap = min(lng_max, other[3]) - max(lng_min, other[2])
+                touch_lat = lat_max == other[0] or other[1] == lat_min
+                touch_lng = lng_max == other[2] or other[3] == lng_min
+                if (touch_lat and lng_overlap > 0) or (touch_lng and lat_overlap > 0):
+                    pairs.append((a, b))
+        return pairs
+
+
+class ZoneBoundaryRepair:
+    """
+    Moves pickups along zone borders to routes of the neighboring zone.
+    
+    Zones are routed independently, so a pickup just inside one zone may sit
+    next to a route of the other. For every pickup within band_km of a
+    neighboring zone, the route of that zone passing closest to it is tried:
+    the pickup moves when its cheapest insertion there (within its priority
+    segment, so red -> yellow -> green order holds) costs less than removing
+    it saves, and the receiving driver stays within capacity. Costs are
+    offline road distances of the affected legs only, so the repair never
+    builds a matrix larger than a route's priority segment.
+    """
+    
+    def __init__(self,
+                 distance_calculator: DistanceCalculator,
+                 band_km: float = ZONE_BOUNDARY_BAND_KM):
+        """
+        Initialize boundary repair.
+        
+        Args:
+            distance_calculator: Calculator whose offline metric prices moves
+            band_km: Width of the band along zone borders whose pickups are checked
+        """
+        self.distance_calculator = distance_calculator
+        self.band_km = band_km
+        self.moved = 0
+    
+    def repair(self,
+               zones: List[Zone],
+               zone_routes: List[List[OptimizedRoute]]) -> Dict[Tuple[int, int], List[PickupPoint]]:
+        """
+        Relocate boundary pickups between the routes of neighboring zones.
+        
+        Args:
+            zones: Zones of the run
+            zone_routes: Solved routes per zone (not modified)
+        
+        Returns:
+            (zone index, route index) -> new pickup order of every changed route
+        """
+        plans = [[[stop.pickup_point for stop in route.stops] for route in routes] for routes in zone_routes]
+        loads = [[route.total_volume for route in routes] for routes in zone_routes]
+        drivers = [[route.driver for route in routes] for routes in zone_routes]
+        projection = EquirectangularProjection.for_box(EquirectangularProjection.bounding_box(
+            [(p.lat, p.lng) for zone in zones for p in zone.pickup_points]
+        ))
+        
+        # (zone, route) -> (depot + stop coordinates, stop priority values), kept in step with plans
+        arrays: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+        
+        def route_arrays(key: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+            if key not in arrays:
+                driver, plan = drivers[key[0]][key[1]], plans[key[0]][key[1]]
+                coords = np.array([(driver.base_lat, driver.base_lng)] + [(p.lat, p.lng) for p in plan])
+                values = np.array([p.priority_flag.priority_value for p in plan], dtype=np.intp)
+                arrays[key] = (coords, values)
+            return arrays[key]
+        
+        changed = set()
+        self.moved = 0
+        for a, b in ZoneDecomposer.neighbors(zones):
+            for source, target in ((a, b), (b, a)):
+                if not plans[target]:
+                    continue
+                # Target route owning each depot and stop, found through one spatial index per pass
+                route_nodes = [route_arrays((target, r))[0] for r in range(len(plans[target]))]
+                owners = np.repeat(np.arange(len(route_nodes)), [len(nodes) for nodes in route_nodes])
+                index = SpatialGridIndex(np.vstack(route_nodes))
+                
+                for i, k in self._boundary_stops(zones[target], [route_arrays((source, r))[0]
+                                                                 for r in range(len(plans[source]))], projection):
+                    point = plans[source][i][k]
+                    here = np.array([[point.lat, point.lng]])
+                    j = int(owners[index.nearest(point.lat, point.lng)[0]])
+                    if loads[target][j] + point.volume > drivers[target][j].max_capacity:
+                        continue
+                    
+                    gain = self._removal_gain(route_arrays((source, i))[0], k)
+                    cost, position = self._best_insertion(*route_arrays((target, j)), here[0],
+                                                          point.priority_flag.priority_value)
+                    if cost >= gain - 1e-9:
+                        continue
+                    
+                    del plans[source][i][k]
+                    plans[target][j].insert(position, point)
+                    loads[source][i] -= point.volume
+                    loads[target][j] += point.volume
+                    source_coords, source_values = arrays[(source, i)]
+                    target_coords, target_values = arrays[(target, j)]
+                    arrays[(source, i)] = (np.delete(source_coords, k + 1, axis=0), np.delete(source_values, k))
+                    arrays[(target, j)] = (np.insert(target_coords, position + 1, here[0], axis=0),
+                                           np.insert(target_values, position, point.priority_flag.priority_value))
+                    changed.update({(source, i), (target, j)})
+                    self.moved += 1
+        
+        return {key: plans[key[0]][key[1]] for key in sorted(changed)}
+    
+    def _boundary_stops(self,
+                        target: Zone,
+                        route_coords: List[np.ndarray],
+                        projection: EquirectangularProjection) -> List[Tuple[int, int]]:
+        """
+        Return (route index, stop index) of stops within band_km of the target zone's box.
+        
+        Stops are listed from the end of each route backwards, so relocating
+        one leaves the indices of the ones still to visit unchanged.
+        """
+        lat_min, lat_max, lng_min, lng_max = target.box
+        lo, hi = projection.project([(lat_min, lng_min), (lat_max, lng_max)])
+        
+        found = []
+        for i, coords in enumerate(route_coords):
+            xy = projection.project(coords[1:])
+            gap = np.maximum(np.maximum(lo - xy, xy - hi), 0.0)
+            near = np.flatnonzero(np.hypot(gap[:, 0], gap[:, 1]) <= self.band_km)
+            found.extend((i, k) for k in near[::-1].tolist())
+        return found
+    
+    def _removal_gain(self, coords: np.ndarray, k: int) -> float:
+        """Distance saved by dropping stop k of a route (coords[0] is the depot; routes end at their last stop)."""
+        prev, here = coords[k], coords[k + 1]
+        if k + 2 == len(coords):
+            return float(self.distance_calculator.offline_pair_distances([prev], [here])[0])
+        nxt = coords[k + 2]
+        legs = self.distance_calculator.offline_pair_distances([prev, here, prev], [here, nxt, nxt])
+        return float(legs[0] + legs[1] - legs[2])
+    
+    def _best_insertion(self,
+                        coords: np.ndarray,
+                        values: np.ndarray,
+                        here: np.ndarray,
+                        value: int) -> Tuple[float, int]:
+        """
+        Cheapest insertion of a stop within its priority segment of a route.
+        
+        Args:
+            coords: Depot and stop coordinates of the route
+            values: Priority values of the stops (non-increasing along the route)
+            here: Coordinates of the stop to insert
+            value: Its priority value
+        
+        Returns:
+            (added distance, stop index to insert at)
+        """
+        first = int(np.count_nonzero(values > value))
+        last = int(np.count_nonzero(values >= value))
+        prevs = coords[first:last + 1]
+        nexts = coords[first + 1:last + 2]
+        
+        calculator = self.distance_calculator
+        cost = calculator.offline_pair_distances(prevs, np.broadcast_to(here, prevs.shape))
+        if len(nexts):
+            cost[:len(nexts)] += (calculator.offline_pair_distances(np.broadcast_to(here, nexts.shape), nexts)
+                                  - calculator.offline_pair_distances(prevs[:len(nexts)], nexts))
+        
+        best = int(np.argmin(cost))
+        return float(cost[best]), first + best
@@ -13,11 +13,134 @@ from flask_cors import CORS
 # Add current directory to path for importing route_optimization
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from route_optimization import optimize_waste_collection_routes
+from route_optimization import optimize_waste_collection_routes, CircuitBreaker
+from route_optimization.distance_calculator import HAVERSINE
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React app
 
+# Optional SQLite distance cache shared by all gunicorn workers on this host
+DISTANCE_CACHE_PATH = os.environ.get('DISTANCE_CACHE_PATH')
+
+# Optional preprocessed road graph (.npz) for accurate offline distances
+ROAD_NETWORK_PATH = os.environ.get('ROAD_NETWORK_PATH')
+
+# Optional snapping of distance cache keys, e.g. "grid:10" or "geohash:8"
+DISTANCE_CACHE_SNAPPING = os.environ.get('DISTANCE_CACHE_SNAPPING')
+
+# Optional directory of memory-mapped distance matrices shared by all workers
+DISTANCE_MATRIX_DIR = os.environ.get('DISTANCE_MATRIX_DIR')
+
+# Optional travel-time speed profile: "city" or a JSON file of speeds by hour and road class
+SPEED_PROFILE = os.environ.get('SPEED_PROFILE')
+
+# Offline straight-line metric: "haversine" (default) or "equirectangular"
+DISTANCE_METRIC = os.environ.get('DISTANCE_METRIC', HAVERSINE)
+
+# Upper bound on the worker processes a request may ask for ("parallel_workers")
+MAX_PARALLEL_WORKERS = int(os.environ.get('MAX_PARALLEL_WORKERS', os.cpu_count() or 1))
+
+# Upper bounds on the search limits a request may ask for, so no single request
+# holds a worker for long: seconds per route (OR-Tools, local search) or per run
+# (clustering), improving solutions per route, and pickups solved jointly
+MAX_ORTOOLS_TIME_LIMIT = float(os.environ.get('MAX_ORTOOLS_TIME_LIMIT', 30.0))
+MAX_ORTOOLS_SOLUTION_LIMIT = int(os.environ.get('MAX_ORTOOLS_SOLUTION_LIMIT', 100000))
+MAX_CLUSTERING_TIME_BUDGET = float(os.environ.get('MAX_CLUSTERING_TIME_BUDGET', 10.0))
+MAX_LOCAL_SEARCH_TIME_BUDGET = float(os.environ.get('MAX_LOCAL_SEARCH_TIME_BUDGET', 10.0))
+MAX_JOINT_POINTS = int(os.environ.get('MAX_JOINT_POINTS', 1000))
+
+# Search limit options: (server maximum, whether the value must be an integer,
+# whether null is accepted); null time limits would leave the search unbounded
+SEARCH_LIMITS = {
+    'ortools_time_limit': (MAX_ORTOOLS_TIME_LIMIT, False, False),
+    'ortools_solution_limit': (MAX_ORTOOLS_SOLUTION_LIMIT, True, True),
+    'clustering_time_budget': (MAX_CLUSTERING_TIME_BUDGET, False, False),
+    'local_search_time_budget': (MAX_LOCAL_SEARCH_TIME_BUDGET, False, False),
+    'joint_max_points': (MAX_JOINT_POINTS, True, False)
+}
+
+
+def _parallel_workers(value):
+    """
+    Validate the parallel_workers option of a request.
+    
+    Returns:
+        None (solve clusters in the request's process) or a worker count
+        capped at MAX_PARALLEL_WORKERS; 0 asks for the cap
+    
+    Raises:
+        ValueError: If the value is not a non-negative integer
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"parallel_workers must be a non-negative integer: {value!r}")
+    return min(value or MAX_PARALLEL_WORKERS, MAX_PARALLEL_WORKERS)
+
+
+def _search_limit(name, value):
+    """
+    Validate a search limit option of a request (see SEARCH_LIMITS).
+    
+    Returns:
+        The value capped at the option's server maximum (None where accepted)
+    
+    Raises:
+        ValueError: If the value is not a positive number (integer where
+            required), or null where that would lift the limit
+    """
+    maximum, integer, nullable = SEARCH_LIMITS[name]
+    if value is None and nullable:
+        return None
+    kinds = (int,) if integer else (int, float)
+    if isinstance(value, bool) or not isinstance(value, kinds) or not 0 < value < float('inf'):
+        kind = "integer" if integer else "number"
+        raise ValueError(f"{name} must be a positive {kind}: {value!r}")
+    return min(value, maximum)
+
+
+# Request options passed on to optimize_waste_collection_routes; options a
+# request leaves out keep the library's defaults
+OPTIMIZER_OPTIONS = (
+    'priority_weight', 'distance_weight', 'balance_weight', 'departure_hour',
+    'clustering_strategy', 'clustering_time_budget', 'capacity_aware', 'warm_start',
+    'aggregation_radius_m', 'hierarchical_zone_size', 'local_search', 'local_search_time_budget',
+    'parallel_workers', 'route_solver', 'ortools_time_limit', 'ortools_solution_limit',
+    'ortools_metaheuristic', 'joint_max_points'
+)
+
+
+def _optimizer_options(options):
+    """
+    Build the optimizer keyword arguments of a request.
+    
+    Args:
+        options: The request's "options" object
+    
+    Returns:
+        Keyword arguments for optimize_waste_collection_routes: the server
+        configuration plus every supported option the request sets
+    
+    Raises:
+        ValueError: If parallel_workers or a search limit is malformed
+    """
+    kwargs = {name: options[name] for name in OPTIMIZER_OPTIONS if name in options}
+    if 'parallel_workers' in kwargs:
+        kwargs['parallel_workers'] = _parallel_workers(kwargs['parallel_workers'])
+    for name in SEARCH_LIMITS:
+        if name in kwargs:
+            kwargs[name] = _search_limit(name, kwargs[name])
+    kwargs.update(
+        google_maps_api_key=None,  # Can be configured later
+        distance_cache_path=DISTANCE_CACHE_PATH,
+        road_network_path=ROAD_NETWORK_PATH,
+        cache_snapping=DISTANCE_CACHE_SNAPPING,
+        distance_matrix_dir=DISTANCE_MATRIX_DIR,
+        speed_profile=SPEED_PROFILE,
+        distance_metric=DISTANCE_METRIC
+    )
+    return kwargs
+
 @app.route('/')
 def home():
     """Health check endpoint."""
@@ -35,7 +158,11 @@ def home():
 @app.route('/health')
 def health():
     """Health check endpoint."""
-    return jsonify({"status": "healthy", "service": "route-optimization"})
+    return jsonify({
+        "status": "healthy",
+        "service": "route-optimization",
+        "distance_api_circuits": CircuitBreaker.shared_stats()
+    })
 
 @app.route('/optimize', methods=['POST'])
 def optimize_routes():
@@ -100,16 +227,18 @@ def optimize_routes():
                 if field not in driver:
                     return jsonify({"error": f"Driver {i} missing required field: {field}"}), 400
         
+        try:
+            optimizer_options = _optimizer_options(options)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
         # Run optimization
         print(f"🚛 Optimizing routes for {len(drivers)} drivers and {len(pickup_points)} pickup points")
         
         result = optimize_waste_collection_routes(
             pickup_points_data=pickup_points,
             drivers_data=drivers,
-            google_maps_api_key=None,  # Can be configured later
-            priority_weight=options.get('priority_weight', 0.4),
-            distance_weight=options.get('distance_weight', 0.4),
-            balance_weight=options.get('balance_weight', 0.2)
+            **optimizer_options
         )
         
         print("✅ Optimization completed successfully")
@@ -163,16 +292,18 @@ def optimize_driver_routes():
         if not target_driver:
             return jsonify({"error": f"Driver {target_driver_id} not found"}), 400
         
+        try:
+            optimizer_options = _optimizer_options(options)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
         print(f"🚛 Optimizing routes for driver {target_driver_id} with {len(pickup_points)} pickup points")
         
         # Run full optimization
         result = optimize_waste_collection_routes(
             pickup_points_data=pickup_points,
             drivers_data=drivers,
-            google_maps_api_key=None,
-            priority_weight=options.get('priority_weight', 0.4),
-            distance_weight=options.get('distance_weight', 0.4),
-            balance_weight=options.get('balance_weight', 0.2)
+            **optimizer_options
         )
         
         # Extract only the target driver's route
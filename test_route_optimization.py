@@ -181,6 +181,1639 @@ def test_data_validation():
         traceback.print_exc()
         return False
 
+def test_distance_matrix_kernel():
+    """Test the vectorized distance matrix against scalar calculations."""
+    print("\n📐 Testing distance matrix kernel...")
+    
+    try:
+        from route_optimization import DistanceCalculator
+        
+        calculator = DistanceCalculator()
+        locations = [(28.6139 + i * 0.01, 77.2090 - i * 0.007) for i in range(7)]
+        depots = [(28.6130, 77.2080), (28.7041, 77.1025)]
+        
+        # Small chunks force the tiled and mirrored code paths
+        symmetric = calculator.haversine_matrix(locations, chunk_size=3)
+        rectangular = calculator.haversine_matrix(depots, locations, chunk_size=3)
+        
+        for i, (lat1, lng1) in enumerate(locations):
+            for j, (lat2, lng2) in enumerate(locations):
+                expected = calculator.haversine_distance(lat1, lng1, lat2, lng2)
+                assert abs(symmetric[i, j] - expected) < 1e-9
+        
+        for i, (lat1, lng1) in enumerate(depots):
+            for j, (lat2, lng2) in enumerate(locations):
+                expected = calculator.haversine_distance(lat1, lng1, lat2, lng2)
+                assert abs(rectangular[i, j] - expected) < 1e-9
+        
+        # Batch results keep the road factor of road_distance
+        batch = calculator.batch_distances(depots, locations)
+        expected = calculator.road_distance(*depots[1], *locations[4])
+        assert abs(batch[1][4] - expected) < 1e-9
+        
+        print("   ✅ Distance matrix kernel test passed")
+        return True
+    
+    except Exception as e:
+        print(f"   ❌ Distance matrix kernel test failed: {e}")
+        traceback.print_exc()
+        return False
+
+def test_shared_distance_context():
+    """Test that cluster views read the run's shared distance matrix."""
+    print("\n🧮 Testing shared distance context...")
+    
+    try:
+        from route_optimization import (
+            DistanceCalculator, DistanceContext, PickupPoint, Driver, PriorityFlag
+        )
+        
+        calculator = DistanceCalculator()
+        pickup_points = [
+            PickupPoint(f"P{i}", 28.6139 + i * 0.002, 77.2090 + i * 0.003, PriorityFlag.GREEN, 1.0)
+            for i in range(6)
+        ]
+        drivers = [Driver("D1", 28.6130, 77.2080), Driver("D2", 28.6200, 77.2200)]
+        
+        context = DistanceContext(calculator, drivers, pickup_points)
+        cluster = [pickup_points[4], pickup_points[1], pickup_points[5]]
+        view = context.cluster_view(drivers[1], cluster)
+        
+        # The view indexes the shared matrix instead of copying it
+        assert view.context.matrix is context.matrix
+        assert len(view) == 4
+        
+        expected = calculator.road_distance(drivers[1].base_lat, drivers[1].base_lng,
+                                            cluster[2].lat, cluster[2].lng)
+        # Distances are stored as float32 (centimeter resolution)
+        assert abs(view.distance(0, 3) - expected) < 1e-5
+        assert abs(view.subview([3, 0]).distance(0, 1) - expected) < 1e-5
+        
+        row = view.distances_from(1, [2, 3])
+        assert abs(row[0] - view.distance(1, 2)) < 1e-12
+        assert view.to_array().shape == (4, 4)
+        
+        print("   ✅ Shared distance context test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Shared distance context test failed: {e}")
+        traceback.print_exc()
+        return False
+
+def test_persistent_distance_cache():
+    """Test that cached road distances are shared and skip API calls."""
+    print("\n💾 Testing persistent distance cache...")
+    
+    try:
+        import os
+        import tempfile
+        from route_optimization import DistanceCalculator, PersistentDistanceCache
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "distances.sqlite")
+            
+            writer = PersistentDistanceCache(path)
+            writer.set("google", 28.6139, 77.2090, 28.6140, 77.2095, 4.2)
+            
+            # A second instance stands in for another worker process
+            reader = PersistentDistanceCache(path)
+            assert reader.get("google", 28.6139, 77.2090, 28.6140, 77.2095) == 4.2
+            assert reader.get("google", 28.613901, 77.209001, 28.6140, 77.2095) == 4.2  # Quantized key
+            assert reader.get("other", 28.6139, 77.2090, 28.6140, 77.2095) is None
+            
+            # A cached pair never reaches the API, even with an unusable key
+            calculator = DistanceCalculator("invalid-key", persistent_cache=reader)
+            assert calculator.road_distance(28.6139, 77.2090, 28.6140, 77.2095) == 4.2
+            
+            writer.close()
+            reader.close()
+        
+        print("   ✅ Persistent distance cache test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Persistent distance cache test failed: {e}")
+        traceback.print_exc()
+        return False
+
+def test_bounded_distance_cache():
+    """Test size bound, TTL expiry and counters of the in-memory cache."""
+    print("\n🧹 Testing bounded distance cache...")
+    
+    try:
+        from route_optimization import DistanceCalculator
+        from route_optimization.distance_cache import LRUDistanceCache
+        
+        now = [0.0]
+        cache = LRUDistanceCache(max_size=2, ttl_seconds=10, clock=lambda: now[0])
+        cache.set("a", 1.0)
+        cache.set("b", 2.0)
+        assert cache.get("a") == 1.0  # "b" is now least recently used
+        cache.set("c", 3.0)
+        assert cache.get("b") is None
+        assert cache.get("c") == 3.0
+        
+        now[0] = 11.0
+        assert cache.get("a") is None
+        
+        stats = cache.stats()
+        assert stats['size'] == 1
+        assert stats['evictions'] == 1
+        assert stats['expirations'] == 1
+        assert stats['hits'] == 2 and stats['misses'] == 2
+        assert stats['approx_bytes'] > 0
+        
+        calculator = DistanceCalculator(cache_max_size=1)
+        calculator.road_distance(28.61, 77.20, 28.62, 77.21)
+        calculator.road_distance(28.63, 77.22, 28.64, 77.23)
+        calculator.road_distance(28.63, 77.22, 28.64, 77.23)
+        road_stats = calculator.cache_stats()['road_distance']
+        assert road_stats['size'] == 1 and road_stats['evictions'] == 1 and road_stats['hits'] == 1
+        assert 'haversine' in calculator.cache_stats()
+        
+        print("   ✅ Bounded distance cache test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Bounded distance cache test failed: {e}")
+        traceback.print_exc()
+        return False
+
+def _start_distance_matrix_stub(handle_request):
+    """Start a local HTTP server answering in the Distance Matrix response format."""
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+    
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            origins = [tuple(map(float, o.split(","))) for o in query['origins'][0].split("|")]
+            destinations = [tuple(map(float, d.split(","))) for d in query['destinations'][0].split("|")]
+            status, payload = handle_request(origins, destinations)
+            body = json.dumps(payload).encode()
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client gave up waiting (latency injection)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/distancematrix/json"
+
+def test_tiled_distance_matrix_client():
+    """Test tiling, stitching and per-element fallback against a local API stub."""
+    print("\n🌐 Testing tiled Distance Matrix client...")
+    
+    try:
+        import threading
+        import numpy as np
+        from route_optimization import DistanceCalculator
+        from route_optimization.google_maps_client import DistanceMatrixClient
+        
+        failing_destination = (28.7, 77.3)
+        malformed = [False]
+        request_sizes = []
+        lock = threading.Lock()
+        
+        def handle_request(origins, destinations):
+            with lock:
+                request_sizes.append(len(origins) * len(destinations))
+            if malformed[0]:
+                return 200, {"status": "OK", "rows": None}
+            rows = []
+            for o_lat, o_lng in origins:
+                elements = []
+                for d_lat, d_lng in destinations:
+                    if (d_lat, d_lng) == failing_destination:
+                        elements.append({"status": "ZERO_RESULTS"})
+                    else:
+                        meters = round(abs(o_lat - d_lat) * 100000 + abs(o_lng - d_lng) * 100000)
+                        elements.append({"status": "OK", "distance": {"value": meters}})
+                rows.append({"elements": elements})
+            return 200, {"status": "OK", "rows": rows}
+        
+        server, url = _start_distance_matrix_stub(handle_request)
+        try:
+            client = DistanceMatrixClient("test-key", base_url=url, max_concurrency=3)
+            calculator = DistanceCalculator("test-key", matrix_client=client)
+            
+            origins = [(28.6 + i * 0.01, 77.2) for i in range(12)]
+            destinations = [(28.6, 77.2 + j * 0.01) for j in range(14)] + [failing_destination]
+            matrix = calculator.batch_distance_matrix(origins, destinations)
+            
+            assert matrix.shape == (12, 15)
+            assert all(size <= 100 for size in request_sizes)
+            assert sum(request_sizes) == 12 * 15
+            assert abs(matrix[5, 3] - round(0.05 * 100000 + 0.03 * 100000) / 1000.0) < 1e-9
+            
+            # Failed elements fall back to Haversine with road factor
+            expected = calculator.haversine_distance(*origins[2], *failing_destination) * 1.3
+            assert abs(matrix[2, 14] - expected) < 1e-9
+            
+            distance = calculator.road_distance(28.6, 77.2, 28.61, 77.21)
+            assert abs(distance - 2.0) < 1e-9
+            
+            # A malformed 200 response only loses its tile or pair
+            malformed[0] = True
+            calculator = DistanceCalculator("test-key", matrix_client=client)
+            offline = calculator.offline_distance_matrix(origins, destinations)
+            assert np.allclose(calculator.batch_distances(origins, destinations), offline)
+            expected = calculator.haversine_distance(28.6, 77.2, 28.62, 77.21) * 1.3
+            assert abs(calculator.road_distance(28.6, 77.2, 28.62, 77.21) - expected) < 1e-9
+            
+            # Anything else going wrong on the API path still yields offline distances
+            calculator._batch_google_maps = None
+            assert np.allclose(calculator.batch_distance_matrix(origins, destinations), offline)
+            client.close()
+        finally:
+            server.shutdown()
+        
+        print("   ✅ Tiled Distance Matrix client test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Tiled Distance Matrix client test failed: {e}")
+        traceback.print_exc()
+        return False
+
+def test_road_network_provider():
+    """Test offline shortest-path distances on a small road graph."""
+    print("\n🛣️  Testing road network provider...")
+    
+    try:
+        import os
+        import tempfile
+        import numpy as np
+        from route_optimization import DistanceCalculator, RoadNetworkProvider
+        
+        # Two river banks joined by a single bridge at the east end
+        lngs = [77.20 + i * 0.01 for i in range(11)]
+        nodes = [(28.60, lng) for lng in lngs] + [(28.62, lng) for lng in lngs]
+        sources, targets, lengths = [], [], []
+        calculator = DistanceCalculator()
+        for bank in (0, 11):
+            for i in range(10):
+                sources.append(bank + i)
+                targets.append(bank + i + 1)
+                lengths.append(calculator.haversine_distance(*nodes[bank + i], *nodes[bank + i + 1]))
+        sources.append(10)
+        targets.append(21)
+        lengths.append(calculator.haversine_distance(*nodes[10], *nodes[21]))
+        
+        network = RoadNetworkProvider.from_edges(np.array(nodes), sources, targets, lengths)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "delhi.npz")
+            network.save(path)
+            network = RoadNetworkProvider.load(path)
+        
+        calculator = DistanceCalculator(road_network=network)
+        south, north = (28.6001, 77.2001), (28.6201, 77.2001)
+        far_away = (28.90, 77.60)
+        
+        matrix = calculator.batch_distance_matrix([south, north], [north, far_away])
+        river_crossing = 2 * sum(lengths[:10]) + lengths[-1]
+        assert abs(matrix[0, 0] - river_crossing) < 0.05
+        assert matrix[0, 0] > 3 * calculator.haversine_distance(*south, *north)
+        
+        # Points off the network fall back to the Haversine estimate
+        expected = calculator.haversine_distance(*south, *far_away) * 1.3
+        assert abs(matrix[0, 1] - expected) < 1e-9
+        assert abs(calculator.road_distance(*south, *north) - matrix[0, 0]) < 1e-6
+        
+        print("   ✅ Road network provider test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Road network provider test failed: {e}")
+        traceback.print_exc()
+        return False
+
+def test_api_circuit_breaker():
+    """Test that the circuit breaker short-circuits a slow or failing API and recovers."""
+    print("\n🔌 Testing Google Maps circuit breaker...")
+    
+    try:
+        import time
+        from route_optimization import DistanceCalculator, CircuitBreaker
+        from route_optimization.google_maps_client import DistanceMatrixClient
+        
+        mode = {'value': 'slow'}
+        request_count = [0]
+        
+        def handle_request(origins, destinations):
+            request_count[0] += 1
+            if mode['value'] == 'slow':
+                time.sleep(0.5)
+            if mode['value'] == 'error':
+                return 503, {'status': 'UNKNOWN_ERROR'}
+            if mode['value'] == 'malformed':
+                return 200, {'status': 'OK', 'rows': None}
+            rows = [{'elements': [{'status': 'OK', 'distance': {'value': 2000}}
+                                  for _ in destinations]} for _ in origins]
+            return 200, {'status': 'OK', 'rows': rows}
+        
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=3, base_backoff_seconds=10.0,
+                                 max_backoff_seconds=25.0, clock=lambda: now[0])
+        server, url = _start_distance_matrix_stub(handle_request)
+        try:
+            client = DistanceMatrixClient("test-key", base_url=url, max_concurrency=1,
+                                          timeout=0.1, circuit_breaker=breaker)
+            calculator = DistanceCalculator("test-key", matrix_client=client)
+            pairs = [(28.6, 77.2, 28.6 + i * 0.01, 77.3) for i in range(1, 9)]
+            
+            # Slow API: three timeouts open the circuit, the rest short-circuit
+            start = time.perf_counter()
+            distances = calculator.road_distances(pairs)
+            assert time.perf_counter() - start < 2.0
+            assert request_count[0] == 3
+            assert breaker.state == 'open'
+            assert abs(distances[-1] - calculator.haversine_distance(*pairs[-1]) * 1.3) < 1e-9
+            
+            # While open, nothing is sent
+            calculator.batch_distance_matrix([(28.5, 77.1)], [(28.7, 77.4)])
+            assert request_count[0] == 3
+            
+            # Half-open probe fails: circuit reopens with a doubled backoff
+            mode['value'] = 'error'
+            now[0] += 10.0
+            assert breaker.state == 'half_open'
+            calculator.road_distance(28.5, 77.1, 28.8, 77.5)
+            assert request_count[0] == 4
+            stats = calculator.api_circuit_stats()
+            assert stats['state'] == 'open' and stats['backoff_seconds'] == 20.0
+            assert stats['retry_in_seconds'] == 20.0
+            
+            # Backoff is capped; a successful probe closes the circuit again
+            now[0] += 20.0
+            calculator.road_distance(28.5, 77.1, 28.9, 77.5)
+            assert breaker.stats()['backoff_seconds'] == 25.0
+            mode['value'] = 'ok'
+            now[0] += 25.0
+            assert calculator.road_distance(28.5, 77.1, 28.9, 77.6) == 2.0
+            assert breaker.state == 'closed'
+            assert breaker.stats()['backoff_seconds'] == 10.0
+            assert breaker.stats()['times_opened'] == 3
+            client.close()
+            
+            # A malformed payload counts as a failed request (ending a half-open
+            # probe instead of leaving it in flight) and falls back like any other
+            mode['value'] = 'malformed'
+            probe_breaker = CircuitBreaker(failure_threshold=1, base_backoff_seconds=10.0, clock=lambda: now[0])
+            client = DistanceMatrixClient("test-key", base_url=url, max_concurrency=1,
+                                          timeout=0.1, circuit_breaker=probe_breaker)
+            calculator = DistanceCalculator("test-key", matrix_client=client)
+            for failures, expected in enumerate(('closed', 'half_open'), start=1):
+                assert probe_breaker.state == expected
+                origin, destination = (28.5, 77.1), (28.8 + failures * 0.01, 77.5)
+                expected_distance = calculator.haversine_distance(*origin, *destination) * 1.3
+                matrix = calculator.batch_distance_matrix([origin], [destination])
+                assert abs(matrix[0, 0] - expected_distance) < 1e-9
+                assert probe_breaker.state == 'open'
+                assert probe_breaker.stats()['failures'] == failures
+                now[0] += 60.0
+            client.close()
+        finally:
+            server.shutdown()
+        
+        print("   ✅ Circuit breaker test passed")
+        return True
+    
+    except Exception as e:
+        print(f"   ❌ Circuit breaker test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_coordinate_snapping():
+    """Test cache key snapping: error bound, scalar, batch and persistent cache hits."""
+    print("\n🧲 Testing coordinate snapping for cache keys...")
+    
+    try:
+        import os
+        import tempfile
+        import numpy as np
+        from route_optimization import DistanceCalculator, CoordinateSnapper, PersistentDistanceCache
+        from route_optimization.google_maps_client import DistanceMatrixClient
+        
+        # Geohash cell centers match the reference encoding ("u4pru")
+        geohash = CoordinateSnapper.from_spec("geohash:5")
+        lat, lng = geohash.snap_point(57.64911, 10.40744)
+        assert abs(lat - 57.63427734375) < 1e-9 and abs(lng - 10.39306640625) < 1e-9
+        
+        # Documented error bound holds for great-circle distances
+        rng = np.random.default_rng(3)
+        points = np.column_stack((28.4 + rng.random(400) * 0.4, 77.0 + rng.random(400) * 0.4))
+        for snapper in (CoordinateSnapper.from_spec("grid:25"), CoordinateSnapper.from_spec("geohash:7")):
+            snapped = snapper.snap_array(points)
+            moved = np.diag(DistanceCalculator.haversine_matrix(points, snapped))
+            assert moved.max() <= snapper.max_point_error_km
+            error = np.abs(DistanceCalculator.haversine_matrix(snapped) - DistanceCalculator.haversine_matrix(points))
+            assert error.max() <= snapper.max_pair_error_km
+        
+        requested = []
+        
+        def handle_request(origins, destinations):
+            requested.append(len(origins) * len(destinations))
+            rows = [{'elements': [{'status': 'OK', 'distance': {'value': 3000}}
+                                  for _ in destinations]} for _ in origins]
+            return 200, {'status': 'OK', 'rows': rows}
+        
+        server, url = _start_distance_matrix_stub(handle_request)
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                cache_path = os.path.join(tmp, "distances.sqlite")
+                client = DistanceMatrixClient("test-key", base_url=url, max_concurrency=1)
+                calculator = DistanceCalculator("test-key", PersistentDistanceCache(cache_path),
+                                                matrix_client=client,
+                                                snapper=CoordinateSnapper.from_spec("grid:10"))
+                
+                # GPS jitter in the fifth decimal place hits the same entry
+                assert calculator.road_distance(28.61390, 77.20900, 28.62000, 77.21000) == 3.0
+                assert calculator.road_distance(28.61391, 77.20901, 28.62001, 77.20999) == 3.0
+                assert calculator.road_distances([(28.61390, 77.20901, 28.62000, 77.21001),
+                                                  (28.61391, 77.20900, 28.61999, 77.21000)]) == [3.0, 3.0]
+                assert len(requested) == 1
+                
+                # Batch path: jittered duplicates are requested once, cached pairs not at all
+                origins = [(28.61390, 77.20900), (28.61391, 77.20901), (28.65, 77.25)]
+                destinations = [(28.62000, 77.21000), (28.62001, 77.21001)]
+                matrix = calculator.batch_distance_matrix(origins, destinations)
+                assert np.all(matrix == 3.0)
+                assert requested[1:] == [1]
+                
+                # A new calculator (another worker) hits the persistent cache
+                requested.clear()
+                other = DistanceCalculator("test-key", PersistentDistanceCache(cache_path),
+                                           matrix_client=client,
+                                           snapper=CoordinateSnapper.from_spec("grid:10"))
+                assert other.batch_distance_matrix([(28.65001, 77.25)], [(28.62, 77.21)])[0, 0] == 3.0
+                assert other.road_distance(28.61389, 77.209, 28.62, 77.21) == 3.0
+                assert requested == []
+                client.close()
+            finally:
+                server.shutdown()
+        
+        print("   ✅ Coordinate snapping test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Coordinate snapping test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_spatial_index():
+    """Test grid index k-nearest queries with deletion and indexed route construction."""
+    print("\n🗺️  Testing spatial index...")
+    
+    try:
+        import numpy as np
+        from route_optimization import DistanceCalculator
+        from route_optimization.spatial_index import SpatialGridIndex
+        from route_optimization import fallback_solver, PickupPoint, Driver, PriorityFlag
+        
+        rng = np.random.default_rng(7)
+        coords = np.column_stack((28.5 + rng.random(2000) * 0.3, 77.0 + rng.random(2000) * 0.3))
+        index = SpatialGridIndex(coords)
+        
+        # k-nearest matches a brute-force ranking, also after deletions
+        removed = rng.choice(2000, size=1500, replace=False)
+        for step, point_id in enumerate(removed):
+            index.remove(int(point_id))
+            if step % 250 == 0:
+                query = coords[rng.integers(2000)]
+                alive = np.setdiff1d(np.arange(2000), removed[:step + 1])
+                offsets = index.xy[alive] - index.project(query[None, :])[0]
+                expected = alive[np.argsort(np.hypot(offsets[:, 0], offsets[:, 1]))[:5]]
+                assert index.nearest(query[0], query[1], k=5) == expected.tolist()
+        assert len(index) == 500 and int(removed[0]) not in index
+        
+        # Far-away queries and exhausting the index
+        assert len(index.nearest(10.0, 10.0, k=3)) == 3
+        for point_id in np.setdiff1d(np.arange(2000), removed):
+            index.remove(int(point_id))
+        assert index.nearest(28.6, 77.1) == []
+        
+        # Indexed construction visits priorities in order and matches the full scan
+        points = []
+        for i in range(600):
+            priority = [PriorityFlag.RED, PriorityFlag.YELLOW, PriorityFlag.GREEN][i % 3]
+            points.append(PickupPoint(f"S{i}", float(coords[i, 0]), float(coords[i, 1]), priority, 1.0))
+        driver = Driver("D1", 28.6, 77.1)
+        solver = fallback_solver.FallbackRouteSolver(DistanceCalculator())
+        
+        full_scan = solver.solve_cluster_route(points, driver)
+        original_threshold = fallback_solver.SPATIAL_INDEX_MIN_POINTS
+        fallback_solver.SPATIAL_INDEX_MIN_POINTS = 100
+        try:
+            indexed = solver.solve_cluster_route(points, driver)
+        finally:
+            fallback_solver.SPATIAL_INDEX_MIN_POINTS = original_threshold
+        
+        assert [s.pickup_point.pickup_id for s in indexed] == [s.pickup_point.pickup_id for s in full_scan]
+        priorities = [s.pickup_point.priority_flag.priority_value for s in indexed]
+        assert priorities == sorted(priorities, reverse=True)
+        
+        print("   ✅ Spatial index test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Spatial index test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_sparse_distance_graph():
+    """Test the sparse k-nearest-neighbor distance mode against the dense matrix."""
+    print("\n🕸️  Testing sparse distance graph...")
+    
+    try:
+        import io
+        import contextlib
+        import random
+        import numpy as np
+        from route_optimization import DistanceCalculator, DistanceContext, RouteOptimizer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        
+        random.seed(11)
+        drivers = [Driver(f"D{i}", 28.5 + random.random() * 0.2, 77.0 + random.random() * 0.2)
+                   for i in range(3)]
+        points = [
+            PickupPoint(f"S{i}", 28.5 + random.random() * 0.2, 77.0 + random.random() * 0.2,
+                        random.choice(list(PriorityFlag)), random.random() * 3)
+            for i in range(400)
+        ]
+        calculator = DistanceCalculator()
+        dense = DistanceContext(calculator, drivers, points, sparse_threshold=None)
+        sparse = DistanceContext(calculator, drivers, points, sparse_threshold=0, neighbors=8)
+        
+        assert sparse.sparse and sparse.matrix is None and not dense.sparse
+        n = sparse.size
+        # Linear size: depot rows are complete, other rows hold k neighbors plus depots
+        assert sparse.graph.nnz <= n * (8 + 1 + 3) + 3 * n
+        assert sparse.nbytes < dense.nbytes / 5
+        
+        # Stored and estimated pairs agree with the dense matrix
+        rows = np.random.default_rng(0).integers(0, n, 2000)
+        cols = np.random.default_rng(1).integers(0, n, 2000)
+        assert np.allclose(sparse.lookup(rows, cols), dense.lookup(rows, cols), rtol=1e-5)
+        
+        indices, distances = sparse.graph.row(10)
+        assert set(range(3)) <= set(indices.tolist())
+        assert np.allclose(distances, dense.matrix[10, indices], rtol=1e-5)
+        
+        view = sparse.cluster_view(drivers[0], points[:50])
+        assert np.allclose(view.to_array(), dense.cluster_view(drivers[0], points[:50]).to_array(), rtol=1e-5)
+        
+        # Solvers produce the same routes in sparse mode
+        results = []
+        for threshold in (None, 0):
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = RouteOptimizer(sparse_matrix_threshold=threshold).optimize_routes(points, drivers)
+            results.append(result)
+        assert results[0].total_points_covered == results[1].total_points_covered == len(points)
+        assert abs(results[0].total_distance - results[1].total_distance) < 1e-3
+        
+        print("   ✅ Sparse distance graph test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Sparse distance graph test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_memory_mapped_distance_matrix():
+    """Test float32 matrix storage and reopening a stored matrix from disk."""
+    print("\n🗄️  Testing memory-mapped distance matrix...")
+    
+    try:
+        import os
+        import tempfile
+        import numpy as np
+        from route_optimization import DistanceCalculator, DistanceContext
+        from route_optimization.distance_matrix import DistanceMatrix
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        
+        calculator = DistanceCalculator()
+        drivers = [Driver("D1", 28.61, 77.20), Driver("D2", 28.65, 77.25)]
+        points = [PickupPoint(f"M{i}", 28.6 + i * 0.001, 77.2 + (i % 7) * 0.002, PriorityFlag.GREEN, 1.0)
+                  for i in range(60)]
+        
+        in_memory = DistanceContext(calculator, drivers, points)
+        assert in_memory.matrix.data.dtype == np.float32
+        assert not in_memory.matrix.is_memory_mapped
+        exact = calculator.offline_distance_matrix(in_memory.locations)
+        assert np.allclose(in_memory.matrix[:, :], exact, rtol=1e-6)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            stored = DistanceContext(calculator, drivers, points, matrix_dir=tmp)
+            assert stored.matrix.is_memory_mapped
+            files = [f for f in os.listdir(tmp) if f.endswith(".npy")]
+            assert len(files) == 1 and not [f for f in os.listdir(tmp) if f.endswith(".tmp")]
+            
+            # Same locations: reopened from disk, read-only, nothing recomputed
+            class NoCompute(DistanceCalculator):
+                def offline_distance_matrix(self, *args, **kwargs):
+                    raise AssertionError("matrix should have been reopened")
+            
+            reopened = DistanceContext(NoCompute(), drivers, points, matrix_dir=tmp)
+            assert reopened.matrix.path == stored.matrix.path
+            assert not reopened.matrix.data.flags.writeable
+            view = reopened.cluster_view(drivers[1], points[10:20])
+            assert np.array_equal(view.to_array(), in_memory.cluster_view(drivers[1], points[10:20]).to_array())
+            
+            # Different locations get their own file
+            DistanceContext(calculator, drivers, points[:30], matrix_dir=tmp)
+            assert len([f for f in os.listdir(tmp) if f.endswith(".npy")]) == 2
+            
+            # Standalone save / open round trip
+            path = os.path.join(tmp, "copy.npy")
+            in_memory.matrix.save(path)
+            assert np.array_equal(DistanceMatrix.open(path)[:, :], in_memory.matrix[:, :])
+        
+        print("   ✅ Memory-mapped distance matrix test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Memory-mapped distance matrix test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_travel_time_profiles():
+    """Test hour-of-day speed profiles applied to distance matrices and routes."""
+    print("\n⏱️  Testing travel-time speed profiles...")
+    
+    try:
+        import numpy as np
+        from route_optimization import DistanceCalculator, DistanceContext, TravelTimeModel, RouteOptimizer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        
+        # Legacy default: constant 25 km/h
+        calculator = DistanceCalculator()
+        assert abs(calculator.estimate_travel_time(5.0) - 12.0) < 1e-9
+        assert abs(calculator.estimate_travel_time(5.0, 50.0) - 6.0) < 1e-9
+        
+        model = TravelTimeModel.from_dict({
+            "class_bounds_km": [2.0],
+            "speeds_kmh": {
+                "local": {"default": 20, "8-10": 10},
+                "arterial": {"default": 40, "8-10": 20},
+            }
+        })
+        # Whole matrix at once: class by distance, speed by hour
+        distances = np.array([[0.0, 1.0], [4.0, 0.0]])
+        assert np.allclose(model.time_matrix(distances, 7), [[0.0, 3.0], [6.0, 0.0]])
+        assert np.allclose(model.time_matrix(distances, 8.5), [[0.0, 6.0], [12.0, 0.0]])
+        assert np.allclose(model.time_matrix(distances, 33), model.time_matrix(distances, 9))
+        
+        # A route leaving at 7:55 runs into the 8:00 slowdown on its second leg
+        times = model.route_times([4.0, 4.0, 1.0], departure_hour=7 + 55 / 60)
+        assert np.allclose(times, [6.0, 12.0, 6.0])
+        
+        # Route stops and totals read the profile at the requested departure hour
+        drivers = [Driver("D1", 28.61, 77.20)]
+        points = [PickupPoint(f"T{i}", 28.61 + i * 0.004, 77.20 + (i % 3) * 0.004, PriorityFlag.GREEN, 1.0)
+                  for i in range(12)]
+        context = DistanceContext(DistanceCalculator(travel_time_model=model), drivers, points, departure_hour=8)
+        assert np.allclose(context.time_matrix(), model.time_matrix(context.matrix[:, :], 8))
+        view = context.cluster_view(drivers[0], points)
+        assert np.allclose(view.to_time_array(), context.time_matrix()[np.ix_(view.nodes, view.nodes)])
+        
+        off_peak = RouteOptimizer(speed_profile=model).optimize_routes(points, drivers, departure_hour=12)
+        rush = RouteOptimizer(speed_profile=model).optimize_routes(points, drivers, departure_hour=8)
+        assert abs(off_peak.total_distance - rush.total_distance) < 1e-6
+        assert abs(rush.total_time - 2 * off_peak.total_time) < 1e-6
+        route = rush.routes[0]
+        assert abs(route.total_time - sum(stop.estimated_time for stop in route.stops)) < 1e-6
+        
+        assert TravelTimeModel.load("city").speeds_kmh.shape == (3, 24)
+        
+        print("   ✅ Travel-time profile test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Travel-time profile test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_equirectangular_metric():
+    """Test the equirectangular metric, its error report and automatic fallback."""
+    print("\n📐 Testing equirectangular distance metric...")
+    
+    try:
+        import numpy as np
+        from route_optimization import DistanceCalculator, RouteOptimizer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        
+        rng = np.random.default_rng(3)
+        city = np.column_stack((28.45 + rng.random(300) * 0.4, 77.0 + rng.random(300) * 0.4))
+        
+        exact = DistanceCalculator().offline_distance_matrix(city)
+        calculator = DistanceCalculator(metric="equirectangular")
+        fast = calculator.offline_distance_matrix(city)
+        report = calculator.metric_report
+        assert report['metric'] == "equirectangular" and report['within_budget']
+        
+        # Reported bound covers the actual error of every pair
+        off_diagonal = exact > 0
+        actual = np.max(np.abs(fast[off_diagonal] / exact[off_diagonal] - 1.0))
+        assert actual <= report['max_relative_error'] + 1e-9
+        assert report['max_relative_error'] < report['error_budget']
+        assert np.allclose(calculator.offline_pair_distances(city[:50], city[50:100]),
+                           fast[np.arange(50), np.arange(50, 100)])
+        
+        # Float32 output buffer is filled in place
+        out = np.empty(fast.shape, dtype=np.float32)
+        assert calculator.offline_distance_matrix(city, out=out) is out
+        assert np.allclose(out, fast, rtol=1e-6)
+        
+        # A country-sized area exceeds the budget: Haversine is used instead
+        country = np.column_stack((10 + rng.random(50) * 25, 70 + rng.random(50) * 20))
+        wide = calculator.offline_distance_matrix(country)
+        assert calculator.metric_report['metric'] == "haversine"
+        assert not calculator.metric_report['within_budget']
+        assert np.allclose(wide, DistanceCalculator().offline_distance_matrix(country))
+        assert calculator.offline_metric_id != DistanceCalculator().offline_metric_id
+        
+        # Stored matrices are keyed by the projection their area gets, or its fallback
+        keyed = DistanceCalculator(metric="equirectangular")
+        city_id = keyed.area_metric_id(city)
+        assert city_id == keyed.area_metric_id(city[:100]), "Areas inside the last one share its projection"
+        assert city_id != keyed.area_metric_id(city + (10.0, 0.0))
+        assert keyed.area_metric_id(country) not in (city_id, keyed.offline_metric_id)
+        assert DistanceCalculator().area_metric_id(city) == DistanceCalculator().offline_metric_id
+        
+        # Depot rows are never shared across requests with different areas
+        assert RouteOptimizer(distance_metric="equirectangular").driver_registry is None
+        
+        # Full pipeline (clustering, construction) runs on the projection
+        drivers = [Driver("D1", 28.6, 77.1), Driver("D2", 28.7, 77.3)]
+        points = [PickupPoint(f"E{i}", float(lat), float(lng), PriorityFlag.YELLOW, 1.0)
+                  for i, (lat, lng) in enumerate(city[:80])]
+        result = RouteOptimizer(distance_metric="equirectangular").optimize_routes(points, drivers)
+        assert sum(route.total_stops for route in result.routes) == len(points)
+        
+        print("   ✅ Equirectangular metric test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Equirectangular metric test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_driver_registry():
+    """Test warm depot distance vectors shared across requests."""
+    print("\n🚚 Testing driver registry...")
+    
+    try:
+        import numpy as np
+        from route_optimization import DistanceCalculator, DistanceContext, DriverRegistry, RouteOptimizer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        
+        calculator = DistanceCalculator()
+        registry = DriverRegistry()
+        drivers = [Driver("D1", 28.61, 77.20), Driver("D2", 28.65, 77.25)]
+        points = [PickupPoint(f"R{i}", 28.6 + i * 0.002, 77.2 + (i % 5) * 0.003, PriorityFlag.RED, 1.0)
+                  for i in range(40)]
+        
+        outbound, inbound = registry.depot_distances(calculator, drivers, points[:30])
+        depots = [(d.base_lat, d.base_lng) for d in drivers]
+        coords = [(p.lat, p.lng) for p in points]
+        assert np.allclose(outbound, calculator.offline_distance_matrix(depots, coords[:30]), rtol=1e-6)
+        assert np.allclose(inbound, outbound.T)
+        assert registry.stats()['computed_distances'] == 60
+        
+        # Known pickups are read back; only the new ones are computed
+        outbound, _ = registry.depot_distances(calculator, drivers, points)
+        assert registry.stats()['computed_distances'] == 80
+        assert np.allclose(outbound, calculator.offline_distance_matrix(depots, coords), rtol=1e-6)
+        
+        # A new driver computes one row; a moved driver recomputes its row
+        moved = [Driver("D1", 28.70, 77.10), Driver("D2", 28.65, 77.25), Driver("D3", 28.60, 77.30)]
+        outbound, _ = registry.depot_distances(calculator, moved, points)
+        assert registry.stats()['computed_distances'] == 160
+        assert registry.stats()['drivers'] == 3
+        assert np.allclose(outbound, calculator.offline_distance_matrix(
+            [(d.base_lat, d.base_lng) for d in moved], coords), rtol=1e-6)
+        
+        # The run's matrix takes its depot rows from the registry
+        with_registry = DistanceContext(calculator, moved, points, driver_registry=registry)
+        plain = DistanceContext(calculator, moved, points)
+        assert np.allclose(with_registry.matrix[:, :], plain.matrix[:, :], rtol=1e-6)
+        sparse = DistanceContext(calculator, moved, points, sparse_threshold=10, driver_registry=registry)
+        rows = np.repeat(np.arange(3), 43)
+        cols = np.tile(np.arange(43), 3)
+        assert np.allclose(sparse.lookup(rows, cols), plain.matrix[rows, cols], rtol=1e-6)
+        assert registry.stats()['computed_distances'] == 160
+        
+        # Optimizers with the same metric share one registry across requests
+        first = RouteOptimizer()
+        assert RouteOptimizer().driver_registry is first.driver_registry
+        first.optimize_routes(points, drivers)
+        computed = first.driver_registry.stats()['computed_distances']
+        RouteOptimizer().optimize_routes(points, drivers)
+        assert first.driver_registry.stats()['computed_distances'] == computed
+        assert not hasattr(first.driver_registry, 'distance_calculator'), "Requests pass their own calculator"
+        
+        # Driver rows are capped: the least recently used driver makes room
+        small = DriverRegistry(max_drivers=2)
+        small.depot_distances(calculator, drivers, points[:10])
+        small.depot_distances(calculator, [drivers[1]], points[:10])
+        outbound, _ = small.depot_distances(calculator, [moved[2]], points[:10])
+        assert small.stats()['drivers'] == 2, "D1 should have been replaced"
+        assert np.allclose(outbound, calculator.offline_distance_matrix(
+            [(moved[2].base_lat, moved[2].base_lng)], coords[:10]), rtol=1e-6)
+        computed = small.stats()['computed_distances']
+        small.depot_distances(calculator, [drivers[1]], points[:10])
+        assert small.stats()['computed_distances'] == computed, "D2 was used recently and should be kept"
+        small.depot_distances(calculator, moved, points[:10])
+        assert small.stats()['drivers'] == 3, "A request larger than the cap keeps all its drivers"
+        
+        # Rows x locations are capped together: past max_cells the known locations are dropped
+        bounded = DriverRegistry(max_cells=60)
+        bounded.depot_distances(calculator, drivers, points[:20])
+        outbound, _ = bounded.depot_distances(calculator, drivers, points[20:40])
+        assert bounded.stats()['pickup_locations'] == 20
+        assert np.allclose(outbound, calculator.offline_distance_matrix(depots, coords[20:40]), rtol=1e-6)
+        outbound, _ = bounded.depot_distances(calculator, moved[2:], points[:20])
+        assert np.allclose(outbound, calculator.offline_distance_matrix(
+            [(moved[2].base_lat, moved[2].base_lng)], coords[:20]), rtol=1e-6)
+        assert bounded._outbound.size <= 60, "Doubling should stop at max_cells"
+        
+        print("   ✅ Driver registry test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Driver registry test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_clustering_engine():
+    """Test the time-budgeted clustering engine and its strategies."""
+    print("\n🔁 Testing clustering engine...")
+    
+    try:
+        import numpy as np
+        from route_optimization.clustering_engine import ClusteringEngine, CLUSTERING_STRATEGIES
+        
+        rng = np.random.default_rng(5)
+        centers = rng.random((4, 2)) * 10
+        features = np.vstack([c + rng.normal(0, 0.2, (150, 2)) for c in centers])
+        
+        for name in CLUSTERING_STRATEGIES:
+            labels = ClusteringEngine(name, max_attempts=3).cluster(features, 4)
+            assert len(labels) == len(features) and len(np.unique(labels)) == 4
+        
+        # Well separated blobs: scores stop improving and the engine stops early
+        engine = ClusteringEngine("kmeans++", time_budget_seconds=None, max_attempts=20, patience=2)
+        engine.cluster(features, 4)
+        assert engine.last_run['stop_reason'] == "converged"
+        assert engine.last_run['attempts'] < 20
+        assert engine.last_run['best_score'] > 0.7
+        
+        # The budget is checked between attempts; the first attempt always runs
+        ticks = iter(range(1000))
+        engine = ClusteringEngine("kmeans++", time_budget_seconds=2.5, max_attempts=20,
+                                  patience=20, clock=lambda: float(next(ticks)))
+        engine.cluster(features, 4)
+        assert engine.last_run['stop_reason'] == "time_budget"
+        assert engine.last_run['attempts'] == 3
+        engine = ClusteringEngine("kmeans++", time_budget_seconds=0.0)
+        assert engine.cluster(features, 4) is not None and engine.last_run['attempts'] == 1
+        
+        # Sampled silhouette and linear-time inertia both rank a good clustering higher
+        good = ClusteringEngine("kmeans++", max_attempts=1).cluster(features, 4)
+        bad = rng.integers(0, 4, len(features))
+        for quality in ("silhouette", "inertia"):
+            scorer = ClusteringEngine(quality=quality, sample_size=200)
+            inertia = lambda labels: sum(((features[labels == k] - features[labels == k].mean(axis=0)) ** 2).sum()
+                                         for k in range(4))
+            assert scorer.score(features, good, inertia(good)) > scorer.score(features, bad, inertia(bad))
+        
+        # Large inputs pick mini-batch k-means under 'auto'
+        big = rng.random((12000, 2))
+        engine = ClusteringEngine(max_attempts=1)
+        engine.cluster(big, 8)
+        assert engine.last_run['strategy'] == "minibatch"
+        
+        # API options left out of a request keep the library defaults
+        import inspect
+        import route_optimization_server as server
+        from route_optimization import optimize_waste_collection_routes
+        from route_optimization.clustering_engine import CLUSTERING_TIME_BUDGET
+        defaults = inspect.signature(optimize_waste_collection_routes).parameters
+        assert defaults['clustering_time_budget'].default == CLUSTERING_TIME_BUDGET
+        kwargs = server._optimizer_options({'clustering_strategy': 'kmeans', 'unknown': 1})
+        assert kwargs['clustering_strategy'] == 'kmeans' and 'clustering_time_budget' not in kwargs
+        assert 'unknown' not in kwargs and set(kwargs) <= set(defaults)
+        assert all(name in defaults for name in server.OPTIMIZER_OPTIONS)
+        
+        print("   ✅ Clustering engine test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Clustering engine test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_capacity_aware_clustering():
+    """Test capacity-constrained balanced clustering."""
+    print("\n⚖️  Testing capacity-aware clustering...")
+    
+    try:
+        import random
+        from route_optimization import DistanceCalculator, PickupClusterer, RouteOptimizer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        
+        random.seed(11)
+        points = [PickupPoint(f"C{i}", 28.5 + random.random() * 0.2, 77.0 + random.random() * 0.2,
+                              PriorityFlag.YELLOW, 0.5 + random.random() * 2) for i in range(600)]
+        # Most drivers sit in one corner, so plain k-means overloads some of them
+        drivers = [Driver(f"D{i}", 28.5 + random.random() * 0.05, 77.0 + random.random() * 0.05,
+                          max_capacity=60.0 + 20 * (i % 3)) for i in range(12)]
+        total_volume = sum(p.volume for p in points)
+        assert total_volume < sum(d.max_capacity for d in drivers)
+        
+        clusterer = PickupClusterer(DistanceCalculator(), capacity_aware=True)
+        clusters = clusterer.cluster_pickups(points, drivers)
+        assert sum(len(c) for c in clusters.values()) == len(points)
+        assert len({p.pickup_id for c in clusters.values() for p in c}) == len(points)
+        for driver_index, cluster in clusters.items():
+            assert sum(p.volume for p in cluster) <= drivers[driver_index].max_capacity + 1e-9
+        report = clusterer.capacitated.last_report
+        assert report['overflow_volume'] == 0 and report['max_utilization'] <= 1.0
+        
+        # Loads are balanced relative to capacity rather than packed into the nearest trucks
+        utilizations = [load / cap for load, cap in zip(report['loads'], report['capacities'])]
+        assert min(utilizations) > 0.3
+        
+        # More volume than capacity: everything is still assigned and the excess reported
+        tight = [Driver(d.driver_id, d.base_lat, d.base_lng, max_capacity=20.0) for d in drivers]
+        clusters = clusterer.cluster_pickups(points, tight)
+        assert sum(len(c) for c in clusters.values()) == len(points)
+        overflow = clusterer.capacitated.last_report['overflow_volume']
+        assert abs(overflow - (total_volume - 20.0 * len(tight))) < 1e-6
+        
+        # End to end: every route stays within its driver's capacity
+        result = RouteOptimizer(capacity_aware_clustering=True).optimize_routes(points, drivers)
+        assert result.total_points_covered == len(points)
+        for route in result.routes:
+            assert route.total_volume <= route.driver.max_capacity + 1e-9
+        
+        print("   ✅ Capacity-aware clustering test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Capacity-aware clustering test failed: {e}")
+        traceback.print_exc()
+        return False
+def test_optimal_driver_assignment():
+    """Test optimal cluster-to-driver assignment with unequal counts."""
+    print("\n🎯 Testing optimal driver assignment...")
+    
+    try:
+        import itertools
+        import numpy as np
+        from route_optimization import DistanceCalculator, PickupClusterer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        
+        clusterer = PickupClusterer(DistanceCalculator())
+        
+        # Greedy would take the 1.0 pair first and pay 100 for the other driver
+        costs = np.array([[1.0, 2.0], [2.0, 100.0]])
+        assert clusterer._optimal_assignment(costs) == [1, 0]
+        
+        rng = np.random.default_rng(2)
+        costs = rng.random((6, 6))
+        best = min(itertools.permutations(range(6)), key=lambda p: sum(costs[i, p[i]] for i in range(6)))
+        assert clusterer._optimal_assignment(costs) == list(best)
+        
+        # More drivers than clusters: the closest drivers get them, the rest stay idle
+        assert clusterer._optimal_assignment(np.array([[5.0], [1.0], [3.0]])) == [-1, 0, -1]
+        
+        drivers = [Driver("Far", 28.90, 77.60), Driver("Near", 28.61, 77.21), Driver("Mid", 28.70, 77.35)]
+        points = [PickupPoint("Q1", 28.610, 77.210, PriorityFlag.RED, 1.0),
+                  PickupPoint("Q2", 28.612, 77.212, PriorityFlag.RED, 1.0)]
+        clusters = clusterer.cluster_pickups(points, drivers)
+        assert set(clusters) == {1, 2}
+        assert clusterer.cluster_pickups(points[:1], drivers) == {1: points[:1]}
+        
+        # More clusters than drivers: leftover clusters join the nearest driver
+        grouped = {0: points[:1], 1: points[1:], 2: [PickupPoint("Q3", 28.89, 77.59, PriorityFlag.GREEN, 1.0)]}
+        merged = clusterer._optimize_driver_assignment(grouped, drivers[:2])
+        assert sorted(p.pickup_id for c in merged.values() for p in c) == ["Q1", "Q2", "Q3"]
+        assert [p.pickup_id for p in merged[0]] == ["Q3"]
+        assert len(merged[1]) == 2
+        
+        print("   ✅ Optimal driver assignment test passed")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Optimal driver assignment test failed: {e}")
+        traceback.print_exc()
+        return False
+
+def test_incremental_clustering():
+    """Test warm-started clustering across successive runs."""
+    print("\n♻️  Testing incremental clustering...")
+    
+    try:
+        import random
+        from route_optimization import DistanceCalculator, PickupClusterer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        from route_optimization.incremental_clustering import IncrementalClustering
+        
+        random.seed(18)
+        flags = list(PriorityFlag)
+        points = [PickupPoint(f"P{i}", 28.5 + random.random() * 0.3, 77.0 + random.random() * 0.3,
+                              random.choice(flags), random.uniform(1, 5)) for i in range(300)]
+        drivers = [Driver(f"D{i}", 28.5 + 0.075 * i, 77.15) for i in range(5)]
+        
+        clusterer = PickupClusterer(DistanceCalculator(), incremental=IncrementalClustering())
+        first = clusterer.cluster_pickups(points, drivers)
+        assert clusterer.last_warm_start['mode'] == 'full'
+        
+        # Same reports again: nothing to place, identical clusters
+        again = clusterer.cluster_pickups(points, drivers)
+        assert clusterer.last_warm_start == {'mode': 'incremental', 'placed_points': 0,
+                                             'removed_points': 0, 'affected_clusters': 0}
+        assert {k: [p.pickup_id for p in v] for k, v in again.items()} == \
+               {k: [p.pickup_id for p in v] for k, v in first.items()}
+        
+        # A few reports collected, a few new ones: only their clusters move
+        added = [PickupPoint(f"N{i}", 28.51 + 0.001 * i, 77.01, PriorityFlag.RED, 2.0) for i in range(10)]
+        changed = points[5:] + added
+        result = clusterer.cluster_pickups(changed, drivers)
+        report = clusterer.last_warm_start
+        assert report['mode'] == 'incremental'
+        assert report['placed_points'] == 10 and report['removed_points'] == 5
+        assert report['affected_clusters'] < len(drivers)
+        assert sorted(p.pickup_id for c in result.values() for p in c) == sorted(p.pickup_id for p in changed)
+        
+        # New points joined the cluster of their close neighbours
+        home = {p.pickup_id: k for k, c in result.items() for p in c}
+        assert len({home[p.pickup_id] for p in added}) == 1
+        
+        # Untouched clusters keep their members
+        before = {k: {p.pickup_id for p in v} for k, v in again.items()}
+        after = {k: {p.pickup_id for p in v} for k, v in result.items()}
+        assert sum(before[k] == after.get(k) for k in before) >= len(drivers) - report['affected_clusters']
+        
+        # A moved point is placed again
+        moved = list(changed)
+        moved[0] = PickupPoint(moved[0].pickup_id, 28.79, 77.29, moved[0].priority_flag, moved[0].volume)
+        clusterer.cluster_pickups(moved, drivers)
+        assert clusterer.last_warm_start['placed_points'] == 1
+        
+        # Too much changed: full clustering
+        clusterer.cluster_pickups(points[:100], drivers)
+        assert clusterer.last_warm_start['mode'] == 'full'
+        
+        # Another fleet has its own state
+        clusterer.cluster_pickups(points, drivers[:4])
+        assert clusterer.last_warm_start['mode'] == 'full'
+        
+        print("   ✅ Incremental clustering test passed")
+        return True
+    
+    except Exception as e:
+        print(f"   ❌ Incremental clustering test failed: {e}")
+        traceback.print_exc()
+        return False
+
+
+def test_report_aggregation():
+    """Test merging near-duplicate reports into single stops."""
+    print("\n🧲 Testing report aggregation...")
+    
+    try:
+        from route_optimization import RouteOptimizer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        from route_optimization.report_aggregation import ReportAggregator
+        
+        # ~0.0001 degrees is about 11 m: R1-R3 are one bin, R4 is 40 m away, R5 elsewhere
+        reports = [
+            PickupPoint("R1", 28.61000, 77.21000, PriorityFlag.GREEN, 1.0, "Bin at gate"),
+            PickupPoint("R2", 28.61010, 77.21000, PriorityFlag.RED, 2.0),
+            PickupPoint("R3", 28.61000, 77.21012, PriorityFlag.YELLOW, 0.5),
+            PickupPoint("R4", 28.61036, 77.21000, PriorityFlag.GREEN, 1.0),
+            PickupPoint("R5", 28.65000, 77.25000, PriorityFlag.GREEN, 1.0),
+        ]
+        aggregator = ReportAggregator(radius_m=25)
+        stops = aggregator.aggregate(reports)
+        assert [stop.pickup_id for stop in stops] == ["R1", "R4", "R5"]
+        merged = stops[0]
+        assert merged.member_ids == ["R1", "R2", "R3"]
+        assert merged.priority_flag == PriorityFlag.RED
+        assert abs(merged.volume - 3.5) < 1e-9
+        assert merged.description == "Bin at gate"
+        assert stops[1] is reports[3] and stops[1].member_ids == ["R4"]
+        assert aggregator.last_report == {'reports': 5, 'stops': 3, 'merged_stops': 1}
+        
+        # Merges are measured from the first report, so they do not chain
+        chain = [PickupPoint(f"C{i}", 28.61 + 0.0002 * i, 77.21, PriorityFlag.GREEN, 1.0) for i in range(5)]
+        assert [len(stop.member_ids) for stop in ReportAggregator(25).aggregate(chain)] == [2, 2, 1]
+        
+        # The solver sees stops, the export lists every report
+        optimizer = RouteOptimizer(aggregation_radius_m=25)
+        result = optimizer.optimize_routes(reports, [Driver("D1", 28.60, 77.20)])
+        assert result.total_points_covered == 3
+        assert result.total_reports_covered == 5
+        exported = optimizer.export_routes_for_drivers(result)["D1"]["stops"]
+        assert sorted(stop['pickup_id'] for stop in exported) == ["R1", "R2", "R3", "R4", "R5"]
+        assert [stop['stop_number'] for stop in exported] == [1, 2, 3, 4, 5]
+        members = [stop for stop in exported if stop.get('merged_stop_id') == "R1"]
+        assert [stop['pickup_id'] for stop in members] == ["R1", "R2", "R3"]
+        assert [stop['distance_from_previous_km'] for stop in members[1:]] == [0.0, 0.0]
+        assert optimizer.suggest_driver_assignments(reports, [Driver("D1", 28.60, 77.20)]) == \
+               {"D1": ["R1", "R2", "R3", "R4", "R5"]}
+        
+        print("   ✅ Report aggregation test passed")
+        return True
+    
+    except Exception as e:
+        print(f"   ❌ Report aggregation test failed: {e}")
+        traceback.print_exc()
+        return False
+
+
+def test_zone_decomposition():
+    """Test hierarchical zone decomposition and boundary repair."""
+    print("\n🧩 Testing zone decomposition...")
+    
+    try:
+        import random
+        from route_optimization import RouteOptimizer, DistanceCalculator
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        from route_optimization.zone_decomposition import Zone, ZoneDecomposer, ZoneBoundaryRepair
+        
+        random.seed(20)
+        flags = list(PriorityFlag)
+        points = [PickupPoint(f"P{i}", 28.5 + random.random() * 0.2, 77.1 + random.random() * 0.2,
+                              random.choice(flags), random.uniform(0.01, 0.05)) for i in range(1000)]
+        drivers = [Driver(f"D{i}", 28.5 + random.random() * 0.2, 77.1 + random.random() * 0.2) for i in range(16)]
+        
+        zones = ZoneDecomposer(max_points=150).decompose(points, drivers)
+        assert all(len(zone.pickup_points) <= 150 for zone in zones)
+        assert all(zone.drivers for zone in zones)
+        assert sorted(d.driver_id for zone in zones for d in zone.drivers) == sorted(d.driver_id for d in drivers)
+        assert sorted(p.pickup_id for zone in zones for p in zone.pickup_points) == sorted(p.pickup_id for p in points)
+        for zone in zones:
+            lat_min, lat_max, lng_min, lng_max = zone.box
+            assert all(lat_min <= p.lat <= lat_max and lng_min <= p.lng <= lng_max for p in zone.pickup_points)
+        assert ZoneDecomposer.neighbors(zones)
+        
+        # Never more zones than drivers
+        assert len(ZoneDecomposer(max_points=10).decompose(points, drivers[:3])) <= 3
+        
+        # Two zones split at lng 77.2; W1 sits right at the border, next to route B's stops
+        west = [PickupPoint("W0", 28.60, 77.10, PriorityFlag.GREEN, 1.0),
+                PickupPoint("W1", 28.60, 77.1995, PriorityFlag.GREEN, 1.0)]
+        east = [PickupPoint("E0", 28.60, 77.2005, PriorityFlag.GREEN, 1.0),
+                PickupPoint("E1", 28.60, 77.21, PriorityFlag.GREEN, 1.0)]
+        split = [Zone(0, (28.5, 28.7, 77.0, 77.2), west, [Driver("A", 28.60, 77.09)]),
+                 Zone(1, (28.5, 28.7, 77.2, 77.3), east, [Driver("B", 28.60, 77.205)])]
+        assert ZoneDecomposer.neighbors(split) == [(0, 1)]
+        
+        optimizer = RouteOptimizer(hierarchical_zone_size=2)
+        routes = [[optimizer._route_from_order(zone.drivers[0], zone.pickup_points, 8.0)] for zone in split]
+        repair = ZoneBoundaryRepair(DistanceCalculator())
+        changed = repair.repair(split, routes)
+        assert repair.moved == 1
+        assert [p.pickup_id for p in changed[(0, 0)]] == ["W0"]
+        assert sorted(p.pickup_id for p in changed[(1, 0)]) == ["E0", "E1", "W1"]
+        
+        # A route already over capacity (clustering overflow) receives nothing more
+        overloaded = [split[0], Zone(1, split[1].box, east, [Driver("B", 28.60, 77.205, max_capacity=1.5)])]
+        routes = [[optimizer._route_from_order(zone.drivers[0], zone.pickup_points, 8.0)] for zone in overloaded]
+        changed = repair.repair(overloaded, routes)
+        assert "W1" not in [p.pickup_id for p in changed.get((1, 0), east)], "Overloaded route B should not grow"
+        
+        # Hierarchical run covers every pickup with every driver's route kept apart
+        result = RouteOptimizer(hierarchical_zone_size=150).optimize_routes(points, drivers)
+        assert result.total_points_covered == len(points)
+        visited = [stop.pickup_point.pickup_id for route in result.routes for stop in route.stops]
+        assert sorted(visited) == sorted(p.pickup_id for p in points)
+        for route in result.routes:
+            values = [stop.pickup_point.priority_flag.priority_value for stop in route.stops]
+            assert values == sorted(values, reverse=True)
+        
+        print("   ✅ Zone decomposition test passed")
+        return True
+    
+    except Exception as e:
+        print(f"   ❌ Zone decomposition test failed: {e}")
+        traceback.print_exc()
+        return False
+
+
+def test_local_search():
+    """Test 2-opt / Or-opt improvement of constructed routes."""
+    print("\n🔁 Testing route local search...")
+    
+    try:
+        import random
+        import numpy as np
+        from route_optimization import RouteOptimizer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        from route_optimization.distance_calculator import DistanceCalculator
+        from route_optimization.distance_context import DistanceContext
+        from route_optimization.fallback_solver import FallbackRouteSolver
+        from route_optimization.local_search import RouteLocalSearch
+        
+        rng = random.Random(21)
+        flags = [PriorityFlag.RED, PriorityFlag.YELLOW, PriorityFlag.GREEN]
+        points = [PickupPoint(f"L{i}", 28.60 + rng.random() * 0.05, 77.20 + rng.random() * 0.05,
+                              rng.choice(flags), 1.0) for i in range(150)]
+        driver = Driver("D1", 28.625, 77.225)
+        calculator = DistanceCalculator()
+        view = DistanceContext(calculator, [driver], points).cluster_view(driver, points)
+        
+        greedy = FallbackRouteSolver(calculator).solve_cluster_route(points, driver, distance_view=view)
+        search = RouteLocalSearch(time_budget=None)
+        improved = FallbackRouteSolver(calculator, search).solve_cluster_route(points, driver, distance_view=view)
+        greedy_km = sum(stop.distance_from_previous for stop in greedy)
+        improved_km = sum(stop.distance_from_previous for stop in improved)
+        assert improved_km < greedy_km
+        assert abs((greedy_km - improved_km) - search.last_report['gain_km']) < 1e-6
+        assert search.last_report['two_opt_moves'] > 0
+        
+        # Every stop stays in its priority segment: red, then yellow, then green
+        def segments(stops):
+            return [sorted(stop.pickup_point.pickup_id for stop in stops if stop.pickup_point.priority_flag == flag)
+                    for flag in flags]
+        values = [stop.pickup_point.priority_flag.priority_value for stop in improved]
+        assert values == sorted(values, reverse=True)
+        assert segments(improved) == segments(greedy)
+        
+        # A crossing on a line is undone: depot, then 1, 3, 2, 4 km east
+        line = [PickupPoint(f"X{km}", 0.0, km / 111.32, PriorityFlag.GREEN, 1.0) for km in (1, 3, 2, 4)]
+        depot = Driver("D2", 0.0, 0.0)
+        line_view = DistanceContext(calculator, [depot], line).cluster_view(depot, line)
+        assert RouteLocalSearch(time_budget=None).improve([0, 1, 2, 3], [1] * 4, line_view) == [0, 2, 1, 3]
+        # ...but not across a priority boundary
+        assert RouteLocalSearch(time_budget=None).improve([0, 1, 2, 3], [3, 3, 2, 2], line_view) == [0, 1, 2, 3]
+        
+        # Sparse runs copy cluster distances in one block, answered like lookup
+        sparse = DistanceContext(calculator, [driver], points, sparse_threshold=50)
+        sparse_view = sparse.cluster_view(driver, points[:60])
+        rows, cols = np.ix_(sparse_view.nodes, sparse_view.nodes)
+        expected = sparse.lookup(*np.broadcast_arrays(rows, cols))
+        assert np.allclose(sparse_view.to_array(), expected, atol=1e-9)
+        
+        # On by default in the optimizer
+        drivers = [driver, Driver("D2", 28.60, 77.20)]
+        plain = RouteOptimizer(local_search=False).optimize_routes(points, drivers)
+        searched = RouteOptimizer(local_search_time_budget=None).optimize_routes(points, drivers)
+        assert searched.total_points_covered == plain.total_points_covered == len(points)
+        assert searched.total_distance < plain.total_distance
+        
+        print("   ✅ Route local search test passed")
+        return True
+    
+    except Exception as e:
+        print(f"   ❌ Route local search test failed: {e}")
+        traceback.print_exc()
+        return False
+
+
+def test_parallel_solving():
+    """Test process-pool route solving of clusters."""
+    print("\n🧵 Testing parallel cluster solving...")
+    
+    try:
+        import os
+        import random
+        import numpy as np
+        from route_optimization import RouteOptimizer
+        from route_optimization import PickupPoint, Driver, PriorityFlag
+        from route_optimization.distance_calculator import DistanceCalculator
+        from route_optimization.distance_context import DistanceContext
+        from route_optimization.parallel_solver import ParallelClusterSolver
+        from route_optimization.simple_route_solver import SimpleRouteSolver
+        
+        rng = random.Random(22)
+        flags = [PriorityFlag.RED, PriorityFlag.YELLOW, PriorityFlag.GREEN]
+        points = [PickupPoint(f"Q{i}", 28.55 + rng.random() * 0.1, 77.15 + rng.random() * 0.1,
+                              rng.choice(flags), rng.uniform(0.5, 2.0)) for i in range(240)]
+        drivers = [Driver(f"D{i}", 28.55 + 0.03 * i, 77.15 + 0.03 * i) for i in range(4)]
+        
+        # Clusters ship as flat arrays: depot first, float32 distances
+        calculator = DistanceCalculator()
+        context = DistanceContext(calculator, drivers, points)
+        view = context.cluster_view(drivers[1], points[:30])
+        locations, distances, codes, volumes, driver_id, capacity = ParallelClusterSolver.pack(points[:30], drivers[1], view)
+        assert locations.shape == (31, 2) and tuple(locations[0]) == (drivers[1].base_lat, drivers[1].base_lng)
+        assert distances.dtype == np.float32 and distances.shape == (31, 31)
+        assert codes.dtype == np.int8 and len(volumes) == 30
+        assert (driver_id, capacity) == (drivers[1].driver_id, drivers[1].max_capacity)
+        
+        # Same routes, in the same order, as solving one cluster after another
+        sequential = RouteOptimizer(local_search_time_budget=None).optimize_routes(points, drivers)
+        optimizer = RouteOptimizer(local_search_time_budget=None, parallel_workers=2)
+        assert optimizer.parallel_solver.workers <= (os.cpu_count() or 1), "Workers should be capped at the CPU count"
+        # Force a pool even on a single-CPU machine
+        optimizer.parallel_solver.workers = 2
+        parallel = optimizer.optimize_routes(points, drivers)
+        assert [route.driver.driver_id for route in parallel.routes] == \
+               [route.driver.driver_id for route in sequential.routes]
+        for ours, theirs in zip(parallel.routes, sequential.routes):
+            assert [stop.pickup_point.pickup_id for stop in ours.stops] == \
+                   [stop.pickup_point.pickup_id for stop in theirs.stops]
+        assert abs(parallel.total_distance - sequential.total_distance) < 1e-6
+        
+        # Workers route with the drivers' own capacity, not the default
+        loaded = [PickupPoint(f"L{i}", point.lat, point.lng, point.priority_flag, 2.0)
+                  for i, point in enumerate(points[:120])]
+        large = [Driver(f"D{i}", 28.55 + 0.03 * i, 77.15 + 0.03 * i, max_capacity=200.0) for i in range(3)]
+        settings = dict(route_solver="ortools", ortools_time_limit=0.2, local_search_time_budget=None)
+        sequential = RouteOptimizer(**settings).optimize_routes(loaded, large)
+        optimizer = RouteOptimizer(parallel_workers=2, **settings)
+        optimizer.parallel_solver.workers = 2
+        parallel = optimizer.optimize_routes(loaded, large)
+        assert parallel.total_points_covered == sequential.total_points_covered == len(loaded), \
+            "Parallel OR-Tools routes should cover as many pickups as sequential ones"
+        
+        # Clusters above the size limit are solved in the calling process
+        local = ParallelClusterSolver(workers=2, max_cluster_points=10)
+        local.workers = 2
+        clusters = [(points[:20], drivers[0], context.cluster_view(drivers[0], points[:20])),
+                    (points[20:40], drivers[1], context.cluster_view(drivers[1], points[20:40]))]
+        orders = local.solve_orders(clusters, SimpleRouteSolver(calculator), 0.4, 0.6)
+        assert [sorted(order) for order in orders] == [list(range(20))] * 2
+        
+        print("   ✅ Parallel cluster solving test passed")
+        return True
+    
+    except Exception as e:
+        print(f"   ❌ Parallel cluster solving test failed: {e}")
+        traceback.print_exc()
+        return False
+
+
+def test_ortools_solver():
+    """Test the OR-Tools route solver settings and its native matrix."""
+    print("\n🧪 Testing OR-Tools Solver...")
+    
+    try:
+        import numpy as np
+        from route_optimization import RouteOptimizer, PickupPoint, Driver, PriorityFlag, DistanceCalculator
+        from route_optimization import DistanceContext
+        from route_optimization.route_solver import RouteSolver, ORTOOLS_AVAILABLE
+        
+        matrix = RouteSolver.integer_matrix(np.array([[0.0, 1.2344], [1.2346, 0.0]]))
+        assert matrix.dtype == np.int64
+        assert matrix.tolist() == [[0, 1234], [1235, 0]], "Distances should round to whole meters"
+        
+        try:
+            RouteOptimizer(route_solver="exact")
+            assert False, "Unknown route solver should raise"
+        except ValueError:
+            pass
+        
+        if not ORTOOLS_AVAILABLE:
+            print("ℹ️  OR-Tools not installed, solver search skipped")
+            print("✅ OR-Tools solver test passed")
+            return True
+        
+        from ortools.constraint_solver import routing_enums_pb2
+        calculator = DistanceCalculator()
+        solver = RouteSolver(calculator, time_limit=None, solution_limit=20, metaheuristic="TABU_SEARCH")
+        parameters = solver.search_parameters()
+        assert parameters.solution_limit == 20
+        assert not parameters.HasField("time_limit")
+        assert parameters.local_search_metaheuristic == routing_enums_pb2.LocalSearchMetaheuristic.TABU_SEARCH
+        assert RouteSolver(calculator, time_limit=0.5).search_parameters().time_limit.ToMilliseconds() == 500
+        for bad in ({'metaheuristic': 'hill_climbing'}, {'time_limit': None}):
+            try:
+                RouteSolver(calculator, **bad)
+                assert False, f"{bad} should raise"
+            except ValueError:
+                pass
+        
+        rng = np.random.default_rng(23)
+        flags = [PriorityFlag.GREEN, PriorityFlag.YELLOW, PriorityFlag.RED]
+        points = [
+            PickupPoint(f"P{i}", 28.60 + rng.uniform(0, 0.03), 77.20 + rng.uniform(0, 0.03),
+                        flags[i % 3], 1.0)
+            for i in range(24)
+        ]
+        driver = Driver("D1", 28.615, 77.215, max_capacity=100.0)
+        
+        # The priority pre-sort walks the cluster's matrix, never the scalar Haversine
+        distances = DistanceContext.for_cluster(calculator, driver, points).to_array()
+        calculator.haversine_distance = None
+        order = solver._sort_by_priority(points, distances)
+        del calculator.haversine_distance
+        assert sorted(order) == list(range(len(points)))
+        assert [points[i].priority_flag for i in order] == sorted(
+            (p.priority_flag for p in points), key=lambda flag: -flag.priority_value)
+        reds = [i for i in order if points[i].priority_flag == PriorityFlag.RED]
+        assert distances[reds[0] + 1, reds[1] + 1] == min(distances[reds[0] + 1, j + 1] for j in reds[1:])
+        
+        route = solver.solve_cluster_route(points, driver)
+        assert sorted(stop.pickup_point.pickup_id for stop in route) == sorted(p.pickup_id for p in points)
+        values = [stop.pickup_point.priority_flag.priority_value for stop in route]
+        assert values == sorted(values, reverse=True), "Priority order should be kept"
+        
+        optimizer = RouteOptimizer(route_solver="ortools", ortools_time_limit=0.1)
+        result = optimizer.optimize_routes(points, [driver, Driver("D2", 28.605, 77.205, max_capacity=100.0)])
+        visited = [stop.pickup_point.pickup_id for route in result.routes for stop in route.stops]
+        assert sorted(visited) == sorted(p.pickup_id for p in points), "Every pickup should be routed"
+        
+        # A cluster over the driver's capacity keeps every pickup instead of
+        # the ones OR-Tools would drop, also without a heuristic seed
+        small = Driver("D3", 28.615, 77.215, max_capacity=10.0)
+        route = RouteSolver(calculator, time_limit=0.1, heuristic_start=False).solve_cluster_route(points, small)
+        assert len(route) == len(points), "Pickups over capacity should not be dropped"
+        
+        print("✅ OR-Tools solver test passed")
+        return True
+    
+    except Exception as e:
+        print(f"❌ OR-Tools solver test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+
+def test_ortools_warm_start():
+    """Test seeding the OR-Tools search with the heuristic route."""
+    print("\n🧪 Testing OR-Tools Warm Start...")
+    
+    try:
+        import numpy as np
+        from route_optimization import PickupPoint, Driver, PriorityFlag, DistanceCalculator, DistanceContext
+        from route_optimization.route_solver import RouteSolver, ORTOOLS_AVAILABLE
+        
+        if not ORTOOLS_AVAILABLE:
+            print("ℹ️  OR-Tools not installed, warm start skipped")
+            print("✅ OR-Tools warm start test passed")
+            return True
+        
+        rng = np.random.default_rng(24)
+        flags = list(PriorityFlag)
+        points = [
+            PickupPoint(f"P{i}", 28.60 + rng.uniform(0, 0.1), 77.20 + rng.uniform(0, 0.1),
+                        flags[rng.integers(3)], 1.0)
+            for i in range(120)
+        ]
+        driver = Driver("D1", 28.65, 77.25, max_capacity=500.0)
+        calculator = DistanceCalculator()
+        view = DistanceContext.for_cluster(calculator, driver, points)
+        
+        solver = RouteSolver(calculator, time_limit=0.05)
+        heuristic = solver.fallback_solver.solve_cluster_order(points, driver, 0.4, 0.6, view)
+        order = solver.solve_cluster_order(points, driver, 0.4, 0.6, view)
+        
+        # Even a very short search returns a complete route no longer than its seed
+        assert sorted(order) == list(range(len(points))), "Warm-started route should visit every point"
+        assert sum(view.route_legs([i + 1 for i in order])) <= sum(view.route_legs([i + 1 for i in heuristic])) + 1e-3
+        values = [points[i].priority_flag.priority_value for i in order]
+        assert values == sorted(values, reverse=True), "Priority order should be kept"
+        
+        # A seed that overloads the vehicle is rejected and the search starts
+        # cold; its dropped pickups bring the heuristic route back
+        heavy = [PickupPoint(p.pickup_id, p.lat, p.lng, PriorityFlag.GREEN, 5.0) for p in points[:20]]
+        small = Driver("D2", 28.65, 77.25, max_capacity=50.0)
+        route = RouteSolver(calculator, time_limit=0.2).solve_cluster_route(heavy, small)
+        assert [stop.pickup_point.pickup_id for stop in route] == \
+               [heavy[i].pickup_id for i in solver.fallback_solver.solve_cluster_order(
+                   heavy, small, 0.4, 0.6, DistanceContext.for_cluster(calculator, small, heavy))], \
+               "Pickups over capacity should keep the heuristic route"
+        
+        print("✅ OR-Tools warm start test passed")
+        return True
+    
+    except Exception as e:
+        print(f"❌ OR-Tools warm start test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+
+def test_joint_routing():
+    """Test solving all drivers' routes in one OR-Tools model."""
+    print("\n🧪 Testing Joint Routing...")
+    
+    try:
+        import numpy as np
+        from route_optimization import RouteOptimizer, PickupPoint, Driver, PriorityFlag
+        from route_optimization.route_solver import ORTOOLS_AVAILABLE
+        
+        if not ORTOOLS_AVAILABLE:
+            print("ℹ️  OR-Tools not installed, joint routing skipped")
+            print("✅ Joint routing test passed")
+            return True
+        
+        rng = np.random.default_rng(25)
+        flags = list(PriorityFlag)
+        points = [
+            PickupPoint(f"P{i}", 28.50 + rng.uniform(0, 0.2), 77.10 + rng.uniform(0, 0.2),
+                        flags[rng.integers(3)], 1.0)
+            for i in range(120)
+        ]
+        drivers = [
+            Driver(f"D{j}", 28.50 + rng.uniform(0, 0.2), 77.10 + rng.uniform(0, 0.2), max_capacity=30.0 + 5 * j)
+            for j in range(4)
+        ]
+        
+        clustered = RouteOptimizer().optimize_routes(points, drivers)
+        optimizer = RouteOptimizer(route_solver="joint", ortools_time_limit=1.0)
+        joint = optimizer.optimize_routes(points, drivers)
+        
+        assert optimizer.joint_solver.last_report['status'] == 'solved'
+        assert optimizer.joint_solver.last_report['elapsed_seconds'] < 1.5, "Time limit should be strict"
+        visited = [stop.pickup_point.pickup_id for route in joint.routes for stop in route.stops]
+        assert sorted(visited) == sorted(p.pickup_id for p in points), "Every pickup should be routed once"
+        for route in joint.routes:
+            assert route.total_volume <= route.driver.max_capacity + 1e-9, "Each driver's capacity should hold"
+            values = [stop.pickup_point.priority_flag.priority_value for stop in route.stops]
+            assert values == sorted(values, reverse=True), "Priority order should be kept"
+        # The search starts from the cluster routes, so it never ends up longer
+        assert joint.total_distance <= clustered.total_distance + 0.01
+        
+        # Out of time or too large: the cluster routes are kept
+        for options in ({'ortools_time_limit': 0.001}, {'joint_max_points': 50}):
+            fallback = RouteOptimizer(route_solver="joint", **options).optimize_routes(points, drivers)
+            assert abs(fallback.total_distance - clustered.total_distance) < 1e-6, f"{options} should keep cluster routes"
+        
+        # Too little capacity for every pickup: a joint solution would drop
+        # pickups the cluster routes visit, so the cluster routes are kept
+        small = [Driver(d.driver_id, d.base_lat, d.base_lng, max_capacity=20.0) for d in drivers]
+        overloaded = RouteOptimizer().optimize_routes(points, small)
+        fallback = RouteOptimizer(route_solver="joint", ortools_time_limit=1.0).optimize_routes(points, small)
+        assert sum(route.total_stops for route in fallback.routes) == len(points), "No pickup should be dropped"
+        assert abs(fallback.total_distance - overloaded.total_distance) < 1e-6
+        
+        print("✅ Joint routing test passed")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Joint routing test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_server_options():
+    """Test validation of the API server's request options."""
+    print("\n🛡️  Testing API server options...")
+    
+    try:
+        import route_optimization_server as server
+        
+        # Malformed worker counts are rejected, the rest capped
+        assert server._parallel_workers(None) is None
+        assert server._parallel_workers(10 ** 6) == server.MAX_PARALLEL_WORKERS
+        assert server._parallel_workers(0) == server.MAX_PARALLEL_WORKERS
+        for bad in ("8", 2.5, -1, True):
+            try:
+                server._parallel_workers(bad)
+                assert False, f"{bad!r} should be rejected"
+            except ValueError:
+                pass
+        
+        # Search limits are bounded: malformed or unbounding values are
+        # rejected, large ones capped at the server maximum
+        kwargs = server._optimizer_options({'ortools_time_limit': 10 ** 6, 'ortools_solution_limit': 10 ** 9,
+                                            'clustering_time_budget': 0.5, 'joint_max_points': 50})
+        assert kwargs['ortools_time_limit'] == server.MAX_ORTOOLS_TIME_LIMIT
+        assert kwargs['ortools_solution_limit'] == server.MAX_ORTOOLS_SOLUTION_LIMIT
+        assert kwargs['clustering_time_budget'] == 0.5 and kwargs['joint_max_points'] == 50
+        assert server._optimizer_options({'ortools_solution_limit': None})['ortools_solution_limit'] is None
+        for bad in ({'ortools_time_limit': None}, {'ortools_time_limit': "5"}, {'ortools_time_limit': float('nan')},
+                    {'ortools_solution_limit': 2.5}, {'local_search_time_budget': None},
+                    {'local_search_time_budget': 0}, {'clustering_time_budget': -1.0},
+                    {'joint_max_points': True}):
+            try:
+                server._optimizer_options(bad)
+                assert False, f"{bad} should be rejected"
+            except ValueError:
+                pass
+        
+        # The endpoints answer malformed options with 400
+        client = server.app.test_client()
+        payload = {
+            'pickup_points': [{'pickup_id': 'P1', 'lat': 28.61, 'lng': 77.21, 'priority_flag': 'red', 'volume': 1.0}],
+            'drivers': [{'driver_id': 'D1', 'base_lat': 28.6, 'base_lng': 77.2}],
+            'target_driver_id': 'D1',
+            'options': {'ortools_time_limit': None, 'ortools_solution_limit': 10 ** 9}
+        }
+        assert client.post('/optimize', json=payload).status_code == 400
+        assert client.post('/optimize-driver', json=payload).status_code == 400
+        
+        print("   ✅ API server options test passed")
+        return True
+    
+    except Exception as e:
+        print(f"   ❌ API server options test failed: {e}")
+        traceback.print_exc()
+        return False
+
+
 def main():
     """Run all tests."""
     print("🚛 Swachh Saarthi Route Optimization - Test Suite")
@@ -192,6 +1825,32 @@ def main():
         test_convenience_function,
         test_edge_cases,
         test_data_validation,
+        test_distance_matrix_kernel,
+        test_shared_distance_context,
+        test_persistent_distance_cache,
+        test_bounded_distance_cache,
+        test_tiled_distance_matrix_client,
+        test_road_network_provider,
+        test_api_circuit_breaker,
+        test_coordinate_snapping,
+        test_spatial_index,
+        test_sparse_distance_graph,
+        test_memory_mapped_distance_matrix,
+        test_travel_time_profiles,
+        test_equirectangular_metric,
+        test_driver_registry,
+        test_clustering_engine,
+        test_capacity_aware_clustering,
+        test_optimal_driver_assignment,
+        test_incremental_clustering,
+        test_report_aggregation,
+        test_zone_decomposition,
+        test_local_search,
+        test_parallel_solving,
+        test_ortools_solver,
+        test_ortools_warm_start,
+        test_joint_routing,
+        test_server_options,
     ]
     
     passed = 0